@@ -0,0 +1,164 @@
+import os
+import sys
+import time
+import getopt
+import numpy
+
+from synthetic_mesh import synthetic_mesh
+
+USAGE = ' -n <num_cases> -s <seed> --mesh-nodes <num_nodes>'
+
+
+def random_rings(rng, num_cases):
+    """ Star-shaped counter-clockwise rings of 3 to 12 vertices like vertex one-rings, some with duplicated angles
+    (co-circular vertices), some reversed (clockwise) and some with a vertex on the chord between its neighbours. """
+
+    rings = list()
+    for case in range(num_cases):
+        size = int(rng.integers(3, 13))
+        angles = numpy.sort(rng.uniform(0, 2 * numpy.pi, size))
+        radius = numpy.ones(size) if case % 5 == 0 else rng.uniform(0.2, 1.0, size)
+        ring = numpy.c_[radius * numpy.cos(angles), radius * numpy.sin(angles)] * 100.0 + rng.uniform(-1e4, 1e4, 2)
+        if case % 11 == 0:
+            ring = ring[::-1]
+        if case % 13 == 0 and size > 3:
+            ring[1] = (ring[0] + ring[2]) / 2.0
+        rings.append(numpy.ascontiguousarray(ring))
+    return rings
+
+
+def random_triangles(rng, ring_xy):
+    z = rng.normal(-20.0, 5.0, len(ring_xy))
+    return numpy.c_[ring_xy, z]
+
+
+def run_both(function, *args):
+    """ Runs function with the kernels off and on, returning both results. An exception is returned as its type,
+    so rings that Triangle rejects in the fallback path still have to be rejected the same way. """
+
+    from mesh_simplification import kernels
+
+    results = list()
+    for enabled in (False, True):
+        kernels.ENABLED = enabled
+        try:
+            results.append(function(*args))
+        except Exception as error:
+            results.append(type(error).__name__)
+    return tuple(results)
+
+
+def same(reference, compiled):
+    if isinstance(reference, tuple):
+        return len(reference) == len(compiled) and all(same(a, b) for a, b in zip(reference, compiled))
+    if reference is None or compiled is None or isinstance(reference, str) or isinstance(compiled, str):
+        return reference == compiled
+    return numpy.array_equal(numpy.asarray(reference), numpy.asarray(compiled))
+
+
+def check_kernels(num_cases, seed):
+    """ Compares every kernel with the function it replaces on random inputs. Returns the number of mismatches. """
+
+    from mesh_simplification.utilities import triangulate_ring, batch_max_deviation, triangle_aspects, \
+        largest_triangle_area
+
+    rng = numpy.random.default_rng(seed)
+    mismatches = dict()
+    for ring_xy in random_rings(rng, num_cases):
+        ring_xyz = random_triangles(rng, ring_xy)
+        reference, compiled = run_both(triangulate_ring, ring_xy)
+        if not same(reference, compiled):
+            mismatches['triangulate_ring'] = mismatches.get('triangulate_ring', 0) + 1
+        if isinstance(reference, str):
+            continue
+        triangles_xyz = ring_xyz[reference]
+
+        # Soundings inside, on the border of and outside the hole, including the ring vertices themselves
+        xy_min, xy_max = ring_xy.min(axis=0), ring_xy.max(axis=0)
+        points_xyz = numpy.r_[ring_xyz, numpy.c_[rng.uniform(xy_min, xy_max, (20, 2)), rng.normal(-20.0, 5.0, 20)]]
+        inside = points_xyz[:len(ring_xyz) + 10]
+        for points in (inside, points_xyz, ring_xyz):
+            reference_result, compiled_result = run_both(batch_max_deviation, triangles_xyz, points, True)
+            if not same(reference_result, compiled_result):
+                mismatches['batch_max_deviation'] = mismatches.get('batch_max_deviation', 0) + 1
+
+        for triangles in (triangles_xyz, ring_xyz[rng.integers(0, len(ring_xyz), (8, 3))]):
+            if not same(*run_both(triangle_aspects, triangles)):
+                mismatches['triangle_aspects'] = mismatches.get('triangle_aspects', 0) + 1
+            if not same(*run_both(largest_triangle_area, triangles)):
+                mismatches['largest_triangle_area'] = mismatches.get('largest_triangle_area', 0) + 1
+
+    return mismatches
+
+
+def check_simplification(num_nodes, seed):
+    """ Simplifies the same synthetic mesh with the kernels off and on. The meshes must be identical; returns the
+    seconds spent with each. """
+
+    from mesh_simplification import kernels
+    from mesh_simplification.mesh import ArrayMesh
+    from mesh_simplification.spatial_index import GridIndex
+    from mesh_simplification.simplification import simplify_queue
+
+    nodes, triangles, boundary = synthetic_mesh(num_nodes, seed)
+    omit = numpy.zeros(len(nodes), dtype=numpy.int8)
+    omit[nodes[:, 2] < 0] = 3
+    omit[boundary] = 2
+    # Area limit that some of the removals reach, so the area test runs too
+    edge1, edge2 = nodes[triangles[:, 1]] - nodes[triangles[:, 0]], nodes[triangles[:, 2]] - nodes[triangles[:, 0]]
+    areas = numpy.abs(edge1[:, 0] * edge2[:, 1] - edge2[:, 0] * edge1[:, 1]) / 2.0
+    max_area = 20.0 * float(numpy.median(areas))
+    results, seconds = list(), list()
+    for enabled in (False, True, True):
+        kernels.ENABLED = enabled
+        mesh = ArrayMesh(nodes, triangles, numpy.full(len(nodes), 0.5), omit)
+        point_tree = GridIndex.build(nodes)
+        mesh.assign_soundings(point_tree.points)
+        start = time.perf_counter()
+        simplify_queue(mesh, point_tree, max_area, True)
+        simplify_queue(mesh, point_tree, 0.0, False)
+        seconds.append(time.perf_counter() - start)
+        results.append(mesh.compact_arrays())
+
+    # The first compiled run includes compiling the kernels (or loading them from the cache)
+    identical = all(same(a, b) for a, b in zip(results[0], results[2]))
+    return identical, len(results[0][0]), seconds[0], seconds[2]
+
+
+def main():
+    num_cases, seed, num_nodes = 20000, 0, 40000
+    try:
+        options_list, remainder = getopt.getopt(sys.argv[1:], "hn:s:", ['mesh-nodes='])
+    except getopt.GetoptError:
+        print(sys.argv[0], USAGE)
+        sys.exit(2)
+    for opt, arg in options_list:
+        if opt == '-h':
+            print(sys.argv[0], USAGE)
+            sys.exit()
+        elif opt == '--mesh-nodes':
+            num_nodes = int(arg)
+        elif opt == '-n':
+            num_cases = int(arg)
+        elif opt == '-s':
+            seed = int(arg)
+
+    from mesh_simplification import kernels
+    if not kernels.AVAILABLE:
+        print('Numba is not installed, the compiled kernels are not used')
+        return
+    if os.environ.get('MESH_SIMPLIFICATION_NO_KERNELS'):
+        print('MESH_SIMPLIFICATION_NO_KERNELS is set, the kernels are still compared here')
+
+    mismatches = check_kernels(num_cases, seed)
+    print('kernel cases: ' + str(num_cases) + ', mismatches: ' + str(mismatches or 0))
+    identical, vertices, python_seconds, kernel_seconds = check_simplification(num_nodes, seed)
+    print('simplified ' + str(num_nodes) + ' nodes to ' + str(vertices) + ' vertices, identical: ' + str(identical))
+    print('python {:.2f} s, kernels {:.2f} s, speedup {:.2f}x'.format(python_seconds, kernel_seconds,
+                                                                      python_seconds / kernel_seconds))
+    if mismatches or not identical:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
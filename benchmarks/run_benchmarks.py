@@ -0,0 +1,167 @@
+import os
+import sys
+import json
+import time
+import getopt
+import platform
+import resource
+import subprocess
+import numpy
+
+from synthetic_mesh import write_synthetic_mesh
+
+USAGE = ' -o <results_json> -w <work_directory> --scales <10000,100000,1000000> --mode <pass|queue|independent> \
+--compare <baseline_json>'
+
+# Fixed parameters, so results can be compared across commits
+PARAMETERS = {'z_offset': '0.5', 'max_triangle_area': 0.0, 'aspect': False, 'negative_down': False, 'seed': 0}
+
+
+def peak_rss_mb():
+    """ Peak resident set size of this process so far (ru_maxrss is in KiB on Linux and bytes on macOS). """
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1e6 if sys.platform == 'darwin' else peak / 1024.0
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_scale(mesh_url, boundary_url, mode, work_dir):
+    """ Runs every pipeline stage once on one mesh and returns its timings. Runs in its own process, so the peak RSS
+    after each stage belongs to this mesh only. """
+
+    from mesh_simplification.reader import Reader
+    from mesh_simplification.writer import Writer
+    from mesh_simplification.spatial_index import GridIndex
+    from mesh_simplification.simplification import simplify_iteration
+    from mesh_simplification.utilities import validate_mesh
+
+    stages = dict()
+
+    def stage(name, start):
+        stages[name] = {'seconds': time.perf_counter() - start, 'peak_rss_mb': peak_rss_mb()}
+        return time.perf_counter()
+
+    start = time.perf_counter()
+    boundary_points = Reader.read_boundary_idx(boundary_url)
+    mesh = Reader.read_gr3_mesh(mesh_url, PARAMETERS['z_offset'], boundary_points, PARAMETERS['negative_down'])
+    input_points, input_uncertainty = Reader.read_mesh_vertices(mesh, PARAMETERS['negative_down'])
+    start = stage('read', start)
+
+    point_tree = GridIndex.build(input_points)
+    mesh.assign_soundings(point_tree.points)
+    start = stage('index', start)
+
+    vertices_before = mesh.n_vertices()
+    iterations, done = 0, False
+    while not done:
+        iterations += 1
+        mesh, ignore_count, done = simplify_iteration(mesh, point_tree, PARAMETERS['max_triangle_area'],
+                                                      PARAMETERS['aspect'], mode)
+    start = stage('simplify', start)
+
+    errors, summary = validate_mesh(mesh, input_points, input_uncertainty)
+    start = stage('validate', start)
+
+    file_name = os.path.join(work_dir, 'benchmark_output')
+    Writer.write_mesh_gr3(mesh, file_name)
+    Writer.write_mesh_vtk(mesh, file_name)
+    stage('write', start)
+
+    return {'nodes': int(vertices_before),
+            'faces_after': int(mesh.n_faces()),
+            'vertices_after': int(mesh.n_vertices()),
+            'vertices_removed': int(vertices_before - mesh.n_vertices()),
+            'iterations': iterations,
+            'violations': summary['violations'],
+            'max_error': summary['max_error'],
+            'rms_error': summary['rms_error'],
+            'stages': stages}
+
+
+def compare(baseline_url, results_url):
+    """ Prints the time and peak RSS of every stage relative to a baseline results file. """
+
+    with open(baseline_url) as infile:
+        baseline = {result['nodes']: result for result in json.load(infile)['results']}
+    with open(results_url) as infile:
+        results = json.load(infile)['results']
+
+    print('nodes stage seconds baseline_seconds ratio peak_rss_mb baseline_peak_rss_mb')
+    for result in results:
+        old = baseline.get(result['nodes'])
+        if old is None:
+            continue
+        for name, values in result['stages'].items():
+            old_values = old['stages'].get(name)
+            if old_values is None:
+                continue
+            ratio = values['seconds'] / old_values['seconds'] if old_values['seconds'] > 0 else float('nan')
+            print(result['nodes'], name, '%.3f' % values['seconds'], '%.3f' % old_values['seconds'], '%.2f' % ratio,
+                  '%.1f' % values['peak_rss_mb'], '%.1f' % old_values['peak_rss_mb'])
+        if result['vertices_after'] != old['vertices_after']:
+            print(result['nodes'], 'vertices_after changed:', old['vertices_after'], '->', result['vertices_after'])
+
+
+def main():
+    results_url, work_dir, mode, baseline_url = 'benchmark_results.json', 'benchmark_meshes', 'pass', None
+    scales, single = [10000, 100000, 1000000], None
+    try:
+        options_list, remainder = getopt.getopt(sys.argv[1:], "ho:w:", ['scales=', 'mode=', 'compare=', 'single='])
+    except getopt.GetoptError:
+        print(sys.argv[0], USAGE)
+        sys.exit(2)
+    for opt, arg in options_list:
+        if opt == '-h':
+            print(sys.argv[0], USAGE)
+            sys.exit()
+        elif opt == '--scales':
+            scales = [int(scale) for scale in arg.split(',')]
+        elif opt == '--mode':
+            mode = str(arg)
+        elif opt == '--compare':
+            baseline_url = str(arg)
+        elif opt == '--single':
+            single = int(arg)
+        elif opt in "-o":
+            results_url = str(arg)
+        elif opt in "-w":
+            work_dir = str(arg)
+
+    # Child process: one scale, result printed as JSON on the last line
+    if single is not None:
+        mesh_url, boundary_url = write_synthetic_mesh(single, work_dir, PARAMETERS['seed'])
+        print(json.dumps(run_scale(mesh_url, boundary_url, mode, work_dir)))
+        return
+
+    work_dir = os.path.abspath(work_dir)
+    if not os.path.isdir(work_dir):
+        os.makedirs(work_dir)
+    results = list()
+    for scale in scales:
+        print('Generating and running ' + str(scale) + ' nodes')
+        write_synthetic_mesh(scale, work_dir, PARAMETERS['seed'])
+        output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--single', str(scale),
+                                          '--mode', mode, '-w', work_dir], cwd=work_dir)
+        result = json.loads(output.decode().strip().splitlines()[-1])
+        print(json.dumps(result['stages']))
+        results.append(result)
+
+    with open(results_url, 'w') as outfile:
+        json.dump({'commit': git_commit(), 'python': platform.python_version(), 'numpy': numpy.__version__,
+                   'platform': platform.platform(), 'mode': mode, 'parameters': PARAMETERS, 'results': results},
+                  outfile, indent=1)
+    print('Results written to ' + results_url)
+
+    if baseline_url is not None:
+        compare(baseline_url, results_url)
+
+
+if __name__ == '__main__':
+    main()
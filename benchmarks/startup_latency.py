@@ -0,0 +1,89 @@
+import os
+import sys
+import json
+import time
+import getopt
+import tempfile
+import subprocess
+
+USAGE = ' -n <repeats> -o <results_json> --importtime <slowest_imports>'
+
+# Each command runs in a fresh interpreter; the first one is the interpreter startup the others are compared with
+COMMANDS = [('interpreter', ['-c', 'pass']),
+            ('import package', ['-c', 'import mesh_simplification']),
+            ('import main', ['-c', 'import mesh_simplification.main']),
+            ('import api', ['-c', 'from mesh_simplification import simplify']),
+            ('mesh_simplification -h', ['-m', 'mesh_simplification.main', '-h']),
+            ('mesh_simplification_sweep -h', ['-m', 'mesh_simplification.sweep', '-h']),
+            ('mesh_simplification_extract -h', ['-m', 'mesh_simplification.progressive', '-h'])]
+
+
+def time_command(arguments, repeats, work_dir):
+    """ Wall seconds of every run of python with the given arguments. """
+
+    seconds = list()
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + arguments, cwd=work_dir, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, check=False)
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def slowest_imports(module, count, work_dir):
+    """ The count imports with the largest cumulative time when importing module, from python -X importtime. """
+
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module], cwd=work_dir,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=False).stderr.decode()
+    imports = list()
+    for line in output.splitlines():
+        fields = line.split('|')
+        if len(fields) == 3 and fields[1].strip().isdigit():
+            imports.append((int(fields[1]), fields[2].rstrip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def main():
+    repeats, results_url, importtime = 10, None, 0
+    try:
+        options_list, remainder = getopt.getopt(sys.argv[1:], "hn:o:", ['importtime='])
+    except getopt.GetoptError:
+        print(sys.argv[0], USAGE)
+        sys.exit(2)
+    for opt, arg in options_list:
+        if opt == '-h':
+            print(sys.argv[0], USAGE)
+            sys.exit()
+        elif opt == '--importtime':
+            importtime = int(arg)
+        elif opt in "-n":
+            repeats = int(arg)
+        elif opt in "-o":
+            results_url = str(arg)
+
+    # Commands run in an empty directory, so any file they create there (e.g. a log file) is noticed
+    work_dir = tempfile.mkdtemp()
+    results = dict()
+    print('command median_ms min_ms')
+    for name, arguments in COMMANDS:
+        seconds = sorted(time_command(arguments, repeats, work_dir))
+        results[name] = {'median_ms': 1000 * seconds[len(seconds) // 2], 'min_ms': 1000 * seconds[0]}
+        print(name, '%.1f' % results[name]['median_ms'], '%.1f' % results[name]['min_ms'])
+    created = os.listdir(work_dir)
+    if created:
+        print('files created: ' + ', '.join(sorted(created)))
+
+    if importtime:
+        print('slowest imports of mesh_simplification.main (cumulative us):')
+        for microseconds, module in slowest_imports('mesh_simplification.main', importtime, work_dir):
+            print(microseconds, module)
+
+    if results_url is not None:
+        with open(results_url, 'w') as outfile:
+            json.dump({'python': sys.version.split()[0], 'repeats': repeats, 'files_created': created,
+                       'results': results}, outfile, indent=1)
+        print('Results written to ' + results_url)
+
+
+if __name__ == '__main__':
+    main()
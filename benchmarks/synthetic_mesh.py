@@ -0,0 +1,109 @@
+import os
+import sys
+import getopt
+import numpy
+
+USAGE = ' -n <num_nodes> -o <output_directory> -s <seed>'
+
+
+def depth_field(x, y, rng):
+    """ Positive-down depths (m) over a 10 km square: a shelf deepening offshore, a meandering channel, a few
+    seamounts and small-scale roughness, with an island in one corner and a strip of coast along the west edge that
+    are above water (negative depths). """
+
+    depth = 5.0 + 45.0 * (x / 10000.0) ** 1.5
+    channel = 2500.0 + 1200.0 * numpy.sin(y / 1500.0)
+    depth += 15.0 * numpy.exp(-((x - channel) / 300.0) ** 2)
+    for cx, cy, height, radius in ((7000.0, 3000.0, 25.0, 600.0), (8500.0, 8000.0, 35.0, 900.0),
+                                   (5000.0, 6500.0, 15.0, 400.0)):
+        depth -= height * numpy.exp(-((x - cx) ** 2 + (y - cy) ** 2) / (2 * radius ** 2))
+    depth += 0.3 * numpy.sin(x / 90.0) * numpy.cos(y / 70.0) + rng.normal(0.0, 0.05, len(x))
+
+    # Land: island and western coast
+    island = numpy.hypot(x - 3000.0, y - 7500.0) < 700.0
+    depth[island] = -2.0 - 3.0 * rng.random(int(island.sum()))
+    coast = x < 300.0 + 150.0 * numpy.sin(y / 800.0)
+    depth[coast] = -1.0 - 0.01 * (300.0 - x[coast]).clip(0)
+
+    return depth
+
+
+def synthetic_mesh(num_nodes, seed=0):
+    """ Jittered structured triangulation of about num_nodes nodes. Returns the (N, 3) nodes, the (F, 3) zero-based
+    triangles and the zero-based indices of the nodes on the outer boundary. """
+
+    rng = numpy.random.default_rng(seed)
+    side = max(int(round(numpy.sqrt(num_nodes))), 2)
+    spacing = 10000.0 / (side - 1)
+    grid = numpy.linspace(0.0, 10000.0, side)
+    x, y = [v.ravel() for v in numpy.meshgrid(grid, grid)]
+
+    # Interior nodes are moved by less than a quarter cell so no triangle flips
+    interior = (x > 0) & (x < 10000.0) & (y > 0) & (y < 10000.0)
+    x[interior] += rng.uniform(-0.2, 0.2, int(interior.sum())) * spacing
+    y[interior] += rng.uniform(-0.2, 0.2, int(interior.sum())) * spacing
+    z = depth_field(x, y, rng)
+
+    # Two triangles per grid cell, alternating the diagonal
+    row, column = [v.ravel() for v in numpy.meshgrid(numpy.arange(side - 1), numpy.arange(side - 1), indexing='ij')]
+    v00 = row * side + column
+    v01, v10, v11 = v00 + 1, v00 + side, v00 + side + 1
+    flip = (row + column) % 2 == 1
+    triangles = numpy.concatenate([numpy.where(flip[:, None], numpy.c_[v00, v01, v10], numpy.c_[v00, v01, v11]),
+                                   numpy.where(flip[:, None], numpy.c_[v01, v11, v10], numpy.c_[v00, v11, v10])])
+
+    boundary = numpy.flatnonzero(~interior)
+    return numpy.c_[x, y, z], triangles, boundary
+
+
+def write_synthetic_mesh(num_nodes, out_dir, seed=0, chunk_size=100000):
+    """ Writes <out_dir>/synthetic_<num_nodes>.gr3 and its comma-delimited boundary index file, returning both
+    paths. Existing files are reused, the mesh only depends on num_nodes and seed. """
+
+    name = os.path.join(out_dir, 'synthetic_' + str(num_nodes))
+    mesh_url, boundary_url = name + '.gr3', name + '_boundary_idx.txt'
+    if os.path.exists(mesh_url) and os.path.exists(boundary_url):
+        return mesh_url, boundary_url
+
+    nodes, triangles, boundary = synthetic_mesh(num_nodes, seed)
+    with open(mesh_url, 'w') as outfile:
+        outfile.write('synthetic ' + str(num_nodes) + ' seed ' + str(seed) + '\n')
+        outfile.write(str(len(triangles)) + ' ' + str(len(nodes)) + '\n')
+        for start in range(0, len(nodes), chunk_size):
+            chunk = nodes[start:start + chunk_size]
+            numpy.savetxt(outfile, numpy.c_[numpy.arange(start + 1, start + len(chunk) + 1), chunk],
+                          fmt=['%d', '%.3f', '%.3f', '%.4f'])
+        for start in range(0, len(triangles), chunk_size):
+            chunk = triangles[start:start + chunk_size] + 1
+            numpy.savetxt(outfile, numpy.c_[numpy.arange(start + 1, start + len(chunk) + 1),
+                                            numpy.full(len(chunk), 3), chunk], fmt='%d')
+    numpy.savetxt(boundary_url, boundary + 1, fmt='%d')
+
+    return mesh_url, boundary_url
+
+
+def main():
+    num_nodes, out_dir, seed = 10000, '.', 0
+    try:
+        options_list, remainder = getopt.getopt(sys.argv[1:], "hn:o:s:")
+    except getopt.GetoptError:
+        print(sys.argv[0], USAGE)
+        sys.exit(2)
+    for opt, arg in options_list:
+        if opt == '-h':
+            print(sys.argv[0], USAGE)
+            sys.exit()
+        elif opt == '-n':
+            num_nodes = int(arg)
+        elif opt == '-o':
+            out_dir = str(arg)
+        elif opt == '-s':
+            seed = int(arg)
+
+    mesh_url, boundary_url = write_synthetic_mesh(num_nodes, out_dir, seed)
+    print(mesh_url)
+    print(boundary_url)
+
+
+if __name__ == '__main__':
+    main()
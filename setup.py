@@ -14,12 +14,14 @@ setup(name='mesh_simplification',
       packages=['mesh_simplification'],
       install_requires=['triangle',
                         'numpy==2.0.2',
-                        'shapely>=1.8.0',
-                        'openmesh==1.2.1'],
-      python_requires='>=3.6, <4',
+                        'shapely>=1.8.0'],
+      extras_require={'kernels': ['numba']},
+      python_requires='>=3.8, <4',
       url='https://github.com/NoelDyer/Bathymetric-Mesh-Simplification',
       long_description_content_type='text/markdown',
       zip_safe=True,
       entry_points={'console_scripts':
-                     ['mesh_simplification=mesh_simplification.main:main']}
+                     ['mesh_simplification=mesh_simplification.main:main',
+                      'mesh_simplification_sweep=mesh_simplification.sweep:main',
+                      'mesh_simplification_extract=mesh_simplification.progressive:main']}
       )
@@ -1 +1,8 @@
+def __getattr__(name):
+    """ Imports simplify() from api on first use, so importing the package or one of its modules stays cheap. """
 
+    if name == 'simplify':
+        from mesh_simplification.api import simplify
+        globals()['simplify'] = simplify
+        return simplify
+    raise AttributeError('module ' + __name__ + ' has no attribute ' + name)
@@ -0,0 +1,113 @@
+import numpy
+
+from math import ceil
+
+from mesh_simplification.reader import Reader
+from mesh_simplification.mesh import ArrayMesh
+from mesh_simplification.simplification import simplify_iteration
+from mesh_simplification.spatial_index import GridIndex
+from mesh_simplification.utilities import validate_mesh, outline_vertices
+
+MODES = ('pass', 'queue', 'independent', 'cost')
+OPERATORS = ('remove', 'collapse')
+
+
+class Cancelled(Exception):
+    """ Raised by the removal callback to stop the simplification driver when cancel() returns True. """
+
+
+class Callbacks(object):
+    """ on_removal hook of the simplification drivers calling progress and cancel every few removals. """
+
+    def __init__(self, progress, cancel, every):
+        self.progress = progress
+        self.cancel = cancel
+        self.every = max(int(every), 1)
+        self.iteration = 1
+        self._removals = 0
+
+    def removal(self, mesh):
+        self._removals += 1
+        if self._removals >= self.every:
+            self._removals = 0
+            self.check(mesh)
+
+    def check(self, mesh):
+        if self.progress is not None:
+            self.progress(self.iteration, mesh.n_vertices())
+        if self.cancel is not None and self.cancel():
+            raise Cancelled()
+
+
+def simplify(nodes, elements, boundary_idx, z_offset, max_triangle_area=0.0, aspect=False, negative_down=False,
+             mode='pass', operator='remove', reference=False, target_vertices=None, target_reduction=None,
+             time_budget=None, workers=None, validate=False, progress=None, cancel=None, callback_every=1000):
+    """ Simplifies a mesh held in memory and returns the simplified nodes and elements, without reading or writing
+    any file. The parameters are those of the command line tool (see README).
+
+    nodes is an (N, 3) array of x, y and depth, elements an (M, 3) array of zero-based node indices. boundary_idx
+    holds the zero-based indices of the nodes to keep; None keeps the nodes on the outline of the mesh instead.
+    z_offset is a single value or one per node. progress, if given, is called with the iteration and the current
+    vertex count every callback_every removals and after every iteration; cancel, if given, is called at the same
+    points and stops the run when it returns True. The mesh simplified so far is then returned.
+
+    Returns the nodes and zero-based elements of the simplified mesh, and a summary dict with the iteration count,
+    vertex counts, whether the run was cancelled and, with validate=True, the violations and the maximum and RMS
+    vertical errors at the input nodes. """
+
+    if mode not in MODES:
+        raise ValueError('Unknown simplification mode: ' + str(mode))
+    if operator not in OPERATORS:
+        raise ValueError('Unknown removal operator: ' + str(operator))
+    nodes = numpy.asarray(nodes, dtype=numpy.float64)
+    elements = numpy.asarray(elements, dtype=numpy.int64)
+    if nodes.ndim != 2 or nodes.shape[1] != 3 or elements.ndim != 2 or elements.shape[1] != 3:
+        raise ValueError('nodes and elements must be (N, 3) and (M, 3) arrays')
+    if len(elements) and (elements.min() < 0 or elements.max() >= len(nodes)):
+        raise ValueError('elements refer to nodes outside 0 - ' + str(len(nodes) - 1))
+
+    z_offsets = numpy.broadcast_to(numpy.asarray(z_offset, dtype=numpy.float64), (len(nodes),)).copy()
+    if boundary_idx is None:
+        boundary = outline_vertices(len(nodes), elements)
+    else:
+        boundary = numpy.zeros(len(nodes), dtype=bool)
+        boundary[numpy.asarray(boundary_idx, dtype=numpy.int64)] = True
+    omit = Reader.omit_flags(nodes[:, 2], boundary, negative_down)
+    mesh = ArrayMesh(nodes, elements, z_offsets, omit)
+    input_points, input_uncertainty = Reader.read_mesh_vertices(mesh, negative_down)
+
+    point_tree = GridIndex.build(input_points)
+    mesh.assign_soundings(point_tree.points)
+
+    vertices_before = mesh.n_vertices()
+    if target_reduction is not None:
+        target_vertices = max(target_vertices or 0, int(ceil(vertices_before * (1.0 - target_reduction / 100.0))))
+
+    callbacks = Callbacks(progress, cancel, callback_every)
+    on_removal = callbacks.removal if progress is not None or cancel is not None else None
+    cancelled = False
+    while True:
+        try:
+            mesh, ignore_count, done = simplify_iteration(mesh, point_tree, max_triangle_area, aspect, mode, reference,
+                                                          operator, workers=workers,
+                                                          target_vertices=target_vertices, time_budget=time_budget,
+                                                          on_removal=on_removal)
+            callbacks.check(mesh)
+        except Cancelled:
+            cancelled = True
+            mesh.garbage_collection()
+        if cancelled or done:
+            break
+        callbacks.iteration += 1
+
+    summary = {'iterations': callbacks.iteration,
+               'vertices_before': int(vertices_before),
+               'vertices': int(mesh.n_vertices()),
+               'faces': int(mesh.n_faces()),
+               'cancelled': cancelled}
+    if validate:
+        errors, validation = validate_mesh(mesh, input_points, input_uncertainty)
+        summary.update(validation)
+
+    points, faces, z_offsets, omit = mesh.compact_arrays()
+    return points, faces.astype(numpy.int64), summary
@@ -0,0 +1,67 @@
+import os
+import json
+import time
+import numpy
+
+from mesh_simplification.mesh import ArrayMesh
+from mesh_simplification.logger import log
+
+
+class Checkpoint(object):
+    """ Writes the state of a run to a checkpoint file every few removals and/or seconds, and at the end of each
+    iteration. The original soundings and the run parameters do not change during a run and are kept here so that
+    every checkpoint is self-contained. """
+
+    def __init__(self, url, input_points, input_uncertainty, parameters, every_removals=0, every_seconds=0):
+        self.url = url
+        self.input_points = input_points
+        self.input_uncertainty = input_uncertainty
+        self.parameters = parameters
+        self.every_removals = every_removals
+        self.every_seconds = every_seconds
+        self.iteration = 1
+        self._removals = 0
+        self._last_save = time.monotonic()
+
+    def removal(self, mesh):
+        """ Called by the simplification drivers after every removal, saves when a limit is reached. """
+
+        self._removals += 1
+        if (self.every_removals > 0 and self._removals >= self.every_removals) or \
+                (self.every_seconds > 0 and time.monotonic() - self._last_save >= self.every_seconds):
+            self.save(mesh, self.iteration)
+
+    def save(self, mesh, iteration):
+        save_checkpoint(self.url, mesh, iteration, self.input_points, self.input_uncertainty, self.parameters)
+        self._removals = 0
+        self._last_save = time.monotonic()
+
+
+def save_checkpoint(url_out, mesh, iteration, input_points, input_uncertainty, parameters):
+    """ Saves the live mesh arrays, the iteration to continue with, the original soundings and the run parameters to
+    a NumPy .npz file. The file is written next to url_out first and then moved over it, so a run killed while
+    saving leaves the previous checkpoint intact. """
+
+    points, faces, z_offset, omit = mesh.compact_arrays()
+    temporary_url = url_out + '.tmp.npz'
+    numpy.savez(temporary_url, points=points, faces=faces, z_offset=z_offset, omit=omit, iteration=iteration,
+                input_points=input_points, input_uncertainty=input_uncertainty,
+                parameters=json.dumps(parameters))
+    os.replace(temporary_url, url_out)
+    log.info('\t\t-Checkpoint Saved: ' + url_out + ' (' + str(len(points)) + ' Vertices)')
+
+
+def load_checkpoint(url_in):
+    """ Loads a checkpoint written by save_checkpoint().
+
+    Returns the mesh, the iteration to continue with, the original soundings and their vertical uncertainty, and
+    the run parameters. """
+
+    with numpy.load(url_in) as data:
+        mesh = ArrayMesh(data['points'], data['faces'], data['z_offset'], data['omit'])
+        iteration = int(data['iteration'])
+        input_points = data['input_points']
+        input_uncertainty = data['input_uncertainty']
+        parameters = json.loads(str(data['parameters']))
+
+    return mesh, iteration, input_points, input_uncertainty, parameters
@@ -0,0 +1,116 @@
+import csv
+import json
+import time
+import cProfile
+import tracemalloc
+
+from contextlib import contextmanager
+
+from mesh_simplification.logger import log
+
+# Seconds spent per stage and counters (removals, rejections by reason, ...) since the last reset()
+_timers = dict()
+_counters = dict()
+
+
+def reset():
+    _timers.clear()
+    _counters.clear()
+
+
+def add_time(stage, start):
+    """ Adds the time since start (a time.perf_counter() value) to a stage and returns the current time, so that
+    consecutive stages can be timed with one clock read each. """
+
+    now = time.perf_counter()
+    _timers[stage] = _timers.get(stage, 0.0) + now - start
+    return now
+
+
+@contextmanager
+def timed(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(stage, start)
+
+
+def count(name, value=1):
+    _counters[name] = _counters.get(name, 0) + value
+
+
+def reject(reason):
+    """ Counts a candidate vertex that had to stay, by the test that rejected it. """
+
+    count('rejected_' + reason)
+
+
+def snapshot():
+    return {'seconds': dict(_timers), 'counts': dict(_counters)}
+
+
+class Report(object):
+    """ Per-iteration instrumentation report. Rows are written out after every iteration so a killed run keeps its
+    report: a JSON list, or a CSV table if the file name ends in .csv. """
+
+    def __init__(self, url):
+        self.url = url
+        self.rows = list()
+
+    def add_iteration(self, iteration, vertices_before, vertices_after, simplify_seconds):
+        stats = snapshot()
+        removals = vertices_before - vertices_after
+        row = {'iteration': iteration,
+               'vertices_before': vertices_before,
+               'vertices_after': vertices_after,
+               'removals': removals,
+               'removals_per_second': removals / simplify_seconds if simplify_seconds > 0 else 0.0}
+        row.update(('seconds_' + stage, seconds) for stage, seconds in sorted(stats['seconds'].items()))
+        row.update(sorted(stats['counts'].items()))
+        self.rows.append(row)
+        log.info('\t\t-Removals per Second: ' + str(row['removals_per_second']))
+        self.write()
+
+    def write(self):
+        if self.url.endswith('.csv'):
+            columns = list()
+            for row in self.rows:
+                columns.extend(column for column in row if column not in columns)
+            with open(self.url, 'w', newline='') as outfile:
+                writer = csv.DictWriter(outfile, fieldnames=columns, restval=0)
+                writer.writeheader()
+                writer.writerows(self.rows)
+        else:
+            with open(self.url, 'w') as outfile:
+                json.dump(self.rows, outfile, indent=1)
+
+
+class Profiler(object):
+    """ Optional cProfile and tracemalloc hooks around a whole run. The cProfile statistics are dumped to a file
+    that can be read with pstats or snakeviz; tracemalloc logs the peak traced memory and the top allocation
+    sites. """
+
+    def __init__(self, profile_url=None, trace_memory=False):
+        self.profile_url = profile_url
+        self.trace_memory = trace_memory
+        self.profile = None
+
+    def start(self):
+        if self.trace_memory:
+            tracemalloc.start()
+        if self.profile_url is not None:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+
+    def stop(self):
+        if self.profile is not None:
+            self.profile.disable()
+            self.profile.dump_stats(self.profile_url)
+            log.info('-Profile Written: ' + self.profile_url)
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            log.info('-Peak Traced Memory (MB): ' + str(peak / 1e6))
+            for statistic in tracemalloc.take_snapshot().statistics('lineno')[:10]:
+                log.info('\t-' + str(statistic))
+            tracemalloc.stop()
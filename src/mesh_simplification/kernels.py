@@ -0,0 +1,233 @@
+import os
+import math
+import importlib.util
+import numpy
+
+# Compiled versions of the small per-candidate kernels. Numba is optional: without it, or with the environment
+# variable MESH_SIMPLIFICATION_NO_KERNELS set, ENABLED is False and utilities uses its NumPy/Python code instead.
+# Every kernel returns exactly what the function it replaces returns, see tests/test_kernels.py and
+# benchmarks/kernel_parity.py.
+AVAILABLE = importlib.util.find_spec('numba') is not None
+ENABLED = AVAILABLE and not os.environ.get('MESH_SIMPLIFICATION_NO_KERNELS')
+
+# Kernels compiled by __getattr__(), from the functions of the same name with a leading underscore
+KERNELS = ('max_deviation', 'triangle_aspects', 'largest_triangle_area', 'ear_clip', 'walk_lists')
+HELPERS = ('_orientation', '_in_circle')
+
+
+def __getattr__(name):
+    """ Compiles all kernels the first time one of them is looked up. Importing Numba takes longer than importing
+    the rest of the package, so it is left until a kernel is actually needed. """
+
+    if name not in KERNELS:
+        raise AttributeError('module ' + __name__ + ' has no attribute ' + name)
+
+    from numba import njit
+
+    module = globals()
+    for function_name in HELPERS:
+        module[function_name] = njit(cache=True)(module[function_name])
+    for function_name in KERNELS:
+        module[function_name] = njit(cache=True)(module['_' + function_name])
+    return module[name]
+
+
+# Same sector bounds as utilities.COMPASS_DEGREES and COMPASS_CLASSES
+_COMPASS_DEGREES = numpy.array([22.5, 67.5, 112.5, 157.5, 202.5, 247.5, 292.5, 337.5, 360])
+_COMPASS_CLASSES = numpy.array([0, 1, 2, 3, 4, 5, 6, 7, 0], dtype=numpy.int8)
+
+
+def _max_deviation(triangles_xyz, points_xyz, tolerance):
+    """ utilities.batch_max_deviation(): the largest vertical distance between the points and the triangles over
+    them (infinite if a point is outside every triangle or a z-value is not finite) and the index of the triangle
+    containing each point. Points on shared edges belong to the triangle containing them most. """
+
+    num_triangles = triangles_xyz.shape[0]
+    owner = numpy.zeros(points_xyz.shape[0], dtype=numpy.int64)
+    deviation = 0.0
+    for i in range(points_xyz.shape[0]):
+        x, y = points_xyz[i, 0], points_xyz[i, 1]
+        best, best_weight, best_w1, best_w2, best_w3 = 0, -numpy.inf, 0.0, 0.0, 0.0
+        for t in range(num_triangles):
+            x1, y1 = triangles_xyz[t, 0, 0], triangles_xyz[t, 0, 1]
+            x2, y2 = triangles_xyz[t, 1, 0], triangles_xyz[t, 1, 1]
+            x3, y3 = triangles_xyz[t, 2, 0], triangles_xyz[t, 2, 1]
+            weight1_numer = ((y2 - y3) * (x - x3)) + ((x3 - x2) * (y - y3))
+            weight2_numer = ((y3 - y1) * (x - x3)) + ((x1 - x3) * (y - y3))
+            denom = ((y2 - y3) * (x1 - x3)) + ((x3 - x2) * (y1 - y3))
+            if denom == 0:
+                continue
+            weight1 = weight1_numer / denom
+            weight2 = weight2_numer / denom
+            weight3 = 1 - weight1 - weight2
+            if not (math.isfinite(weight1) and math.isfinite(weight2) and math.isfinite(weight3)):
+                continue
+            min_weight = min(weight1, weight2, weight3)
+            if min_weight > best_weight:
+                best, best_weight, best_w1, best_w2, best_w3 = t, min_weight, weight1, weight2, weight3
+        if best_weight < -tolerance:
+            return numpy.inf, owner
+        owner[i] = best
+        interp_z = (triangles_xyz[best, 0, 2] * best_w1) + (triangles_xyz[best, 1, 2] * best_w2) + \
+                   (triangles_xyz[best, 2, 2] * best_w3)
+        difference = abs(interp_z - points_xyz[i, 2])
+        if not math.isfinite(difference):
+            return numpy.inf, owner
+        deviation = max(deviation, difference)
+
+    return deviation, owner
+
+
+def _triangle_aspects(triangles_xyz):
+    """ utilities.triangle_aspects() of (T, 3, 3) triangles, as indices into utilities.COMPASS_DIRECTIONS. """
+
+    aspects = numpy.empty(triangles_xyz.shape[0], dtype=numpy.int8)
+    for t in range(triangles_xyz.shape[0]):
+        e1x = triangles_xyz[t, 1, 0] - triangles_xyz[t, 0, 0]
+        e1y = triangles_xyz[t, 1, 1] - triangles_xyz[t, 0, 1]
+        e1z = triangles_xyz[t, 1, 2] - triangles_xyz[t, 0, 2]
+        e2x = triangles_xyz[t, 2, 0] - triangles_xyz[t, 0, 0]
+        e2y = triangles_xyz[t, 2, 1] - triangles_xyz[t, 0, 1]
+        e2z = triangles_xyz[t, 2, 2] - triangles_xyz[t, 0, 2]
+        normal_x = e1y * e2z - e1z * e2y
+        normal_y = e1z * e2x - e1x * e2z
+        normal_z = e1x * e2y - e1y * e2x
+        # Clockwise and degenerate triangles are reversed by taking the cross product the other way round
+        if normal_z <= 0:
+            normal_x = e2y * e1z - e2z * e1y
+            normal_y = e2z * e1x - e2x * e1z
+        aspect_degrees = numpy.degrees(numpy.arctan2(normal_x, normal_y)) % 360.0
+        idx = numpy.searchsorted(_COMPASS_DEGREES, aspect_degrees)
+        aspects[t] = _COMPASS_CLASSES[min(idx, len(_COMPASS_DEGREES) - 1)]
+
+    return aspects
+
+
+def _largest_triangle_area(triangles_xyz):
+    """ Largest area of (T, 3, 3) triangles in the x,y plane. """
+
+    largest = 0.0
+    for t in range(triangles_xyz.shape[0]):
+        area = (triangles_xyz[t, 1, 0] - triangles_xyz[t, 0, 0]) * (triangles_xyz[t, 2, 1] - triangles_xyz[t, 0, 1]) - \
+               (triangles_xyz[t, 2, 0] - triangles_xyz[t, 0, 0]) * (triangles_xyz[t, 1, 1] - triangles_xyz[t, 0, 1])
+        largest = max(largest, abs(area))
+
+    return largest / 2.0
+
+
+def _orientation(ring_xy, a, b, c):
+    return (ring_xy[b, 0] - ring_xy[a, 0]) * (ring_xy[c, 1] - ring_xy[a, 1]) - \
+           (ring_xy[c, 0] - ring_xy[a, 0]) * (ring_xy[b, 1] - ring_xy[a, 1])
+
+
+def _in_circle(ring_xy, a, b, c, d):
+    adx, ady = ring_xy[a, 0] - ring_xy[d, 0], ring_xy[a, 1] - ring_xy[d, 1]
+    bdx, bdy = ring_xy[b, 0] - ring_xy[d, 0], ring_xy[b, 1] - ring_xy[d, 1]
+    cdx, cdy = ring_xy[c, 0] - ring_xy[d, 0], ring_xy[c, 1] - ring_xy[d, 1]
+    determinant = (adx * adx + ady * ady) * (bdx * cdy - cdx * bdy) - \
+                  (bdx * bdx + bdy * bdy) * (adx * cdy - cdx * ady) + \
+                  (cdx * cdx + cdy * cdy) * (adx * bdy - bdx * ady)
+    scale = math.pow(max(abs(adx), abs(ady), abs(bdx), abs(bdy), abs(cdx), abs(cdy)), 4.0)
+    return determinant > 1e-10 * scale
+
+
+def _ear_clip(ring_xy):
+    """ utilities.ear_clip() followed by utilities.delaunay_flip(), in the same order, on a (K, 2) ring. Returns
+    (K - 2, 3) index triangles, or an empty (0, 3) array where ear_clip() returns None. """
+
+    num_points = ring_xy.shape[0]
+    failed = numpy.zeros((0, 3), dtype=numpy.int64)
+    if num_points < 3:
+        return failed
+    area = 0.0
+    for i in range(1, num_points - 1):
+        area += _orientation(ring_xy, 0, i, i + 1)
+    if area <= 0:
+        return failed
+
+    remaining = numpy.arange(num_points)
+    num_remaining = num_points
+    triangles = numpy.empty((num_points - 2, 3), dtype=numpy.int64)
+    num_triangles = 0
+    while num_remaining > 3:
+        clipped = False
+        for i in range(num_remaining):
+            a, b, c = remaining[i - 1 if i > 0 else num_remaining - 1], remaining[i], remaining[(i + 1) % num_remaining]
+            if _orientation(ring_xy, a, b, c) <= 0:
+                continue
+            # Any other ring vertex inside or on the candidate ear blocks it
+            blocked = False
+            for k in range(num_remaining):
+                j = remaining[k]
+                if j != a and j != b and j != c:
+                    if _orientation(ring_xy, a, b, j) >= 0 and _orientation(ring_xy, b, c, j) >= 0 and \
+                            _orientation(ring_xy, c, a, j) >= 0:
+                        blocked = True
+                        break
+            if not blocked:
+                triangles[num_triangles] = (a, b, c)
+                num_triangles += 1
+                remaining[i:num_remaining - 1] = remaining[i + 1:num_remaining].copy()
+                num_remaining -= 1
+                clipped = True
+                break
+        if not clipped:
+            return failed
+
+    if _orientation(ring_xy, remaining[0], remaining[1], remaining[2]) <= 0:
+        return failed
+    triangles[num_triangles] = (remaining[0], remaining[1], remaining[2])
+    num_triangles += 1
+
+    # Lawson flips, trying the interior edges in the order utilities.delaunay_flip() visits them
+    for _ in range(num_triangles * num_triangles + 1):
+        flipped = False
+        for t1 in range(num_triangles):
+            for e in range(3):
+                u, v = triangles[t1, e], triangles[t1, (e + 1) % 3]
+                if u > v:
+                    continue
+                t2 = -1
+                for t in range(num_triangles):
+                    if (triangles[t, 0] == v and triangles[t, 1] == u) or \
+                            (triangles[t, 1] == v and triangles[t, 2] == u) or \
+                            (triangles[t, 2] == v and triangles[t, 0] == u):
+                        t2 = t
+                        break
+                if t2 == -1:
+                    continue
+                w = triangles[t1, (e + 2) % 3]
+                x = triangles[t2, 0] + triangles[t2, 1] + triangles[t2, 2] - u - v
+                if _in_circle(ring_xy, u, v, w, x) and _orientation(ring_xy, u, x, w) > 0 and \
+                        _orientation(ring_xy, x, v, w) > 0:
+                    triangles[t1] = (u, x, w)
+                    triangles[t2] = (x, v, w)
+                    flipped = True
+                    break
+            if flipped:
+                break
+        if not flipped:
+            break
+
+    return triangles
+
+
+def _walk_lists(first, following, heads):
+    """ Concatenated contents of the linked lists starting at first[heads], chained through following. """
+
+    count = 0
+    for head in heads:
+        item = first[head]
+        while item != -1:
+            count += 1
+            item = following[item]
+    items = numpy.empty(count, dtype=numpy.int64)
+    count = 0
+    for head in heads:
+        item = first[head]
+        while item != -1:
+            items[count] = item
+            count += 1
+            item = following[item]
+
+    return items
@@ -1,10 +1,18 @@
 import logging
 import sys
 
-output_file_handler = logging.FileHandler('mesh_simplification_log', mode='w')
-stdout_handler = logging.StreamHandler(sys.stdout)
+# The package logs through this logger. Nothing is configured on import, the command line tools call
+# configure_logging() and library users attach their own handlers (logging.getLogger('mesh_simplification')).
+log = logging.getLogger('mesh_simplification')
+log.addHandler(logging.NullHandler())
 
-log = logging
-logging.basicConfig(level=logging.INFO,
-                    format="%(asctime)s :: %(levelname)-5s :: %(message)s",
-                    handlers=[output_file_handler, stdout_handler])
+
+def configure_logging(log_file='mesh_simplification_log'):
+    """ Logs INFO and above to stdout and, unless log_file is None, to log_file, overwriting it. """
+
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if log_file is not None:
+        handlers.insert(0, logging.FileHandler(log_file, mode='w'))
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s :: %(levelname)-5s :: %(message)s",
+                        handlers=handlers)
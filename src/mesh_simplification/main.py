@@ -1,98 +1,211 @@
 import numpy
 
+from math import ceil
+
+from mesh_simplification import instrumentation
+from mesh_simplification.instrumentation import Report, Profiler
 from mesh_simplification.reader import Reader
-from mesh_simplification.writer import Writer
-from mesh_simplification.simplification import vertex_removal
-from mesh_simplification.utilities import validate_mesh, calculate_average_depth
+from mesh_simplification.writer import BackgroundWriter
+from mesh_simplification.simplification import simplify_iteration
+from mesh_simplification.spatial_index import GridIndex
+from mesh_simplification.out_of_core import simplify_out_of_core
+from mesh_simplification.checkpoint import Checkpoint, load_checkpoint
+from mesh_simplification.progressive import ProgressiveLog
+from mesh_simplification.utilities import validate_mesh
 from mesh_simplification.logger import log
 
-from shapely.strtree import STRtree
-from shapely.geometry import Point
-from math import ceil
-
 
 def main():
 
     # Read input arguments
-    input_file, boundary_idx_list, negative_down, validate, z_offset, max_triangle_area, aspect = Reader.read_arguments()
-
-    # Read boundary points
-    log.info('-Reading Boundary Node Indices')
-    boundary_points = Reader.read_boundary_idx(boundary_idx_list)
-    log.info('-Reading Mesh')
-    input_mesh = Reader.read_gr3_mesh(input_file, z_offset, boundary_points, negative_down)
-    input_points = Reader.read_mesh_vertices(input_mesh, negative_down)
-
-    # Write initial mesh file
-    log.info('-Writing Initial Mesh Files')
-    Writer.write_mesh_gr3(input_mesh, 'Input_Mesh')
-    Writer.write_mesh_vtk(input_mesh, 'Input_Mesh')
-    
+    input_file, boundary_idx_list, negative_down, validate, z_offset, max_triangle_area, aspect, options = \
+        Reader.read_arguments()
+
+    # Output files are written from snapshots of the mesh in a separate process while simplification goes on,
+    # out-of-core simplification streams its single output file itself
+    writer = None
+    if options['resume'] is not None or not options['out_of_core']:
+        writer = BackgroundWriter(options['formats'], options['binary_vtk'], not options['sync_write'])
+
+    profiler = Profiler(options['profile'], options['tracemalloc'])
+    profiler.start()
+    try:
+        run(input_file, boundary_idx_list, negative_down, validate, z_offset, max_triangle_area, aspect, options,
+            writer)
+    finally:
+        if writer is not None:
+            writer.close()
+        profiler.stop()
+
+
+def run(input_file, boundary_idx_list, negative_down, validate, z_offset, max_triangle_area, aspect, options,
+        writer):
+    """ Reads (or resumes) the mesh and runs the simplification iterations. """
+
+    if options['resume'] is not None:
+        # Continue from a checkpoint instead of reading the input files
+        input_mesh, iteration_count, input_points, input_uncertainty, parameters = \
+            load_checkpoint(options['resume'])
+
+        # Validation does not change the mesh, so -v turns it on; the other values would and are kept from the run
+        # that wrote the checkpoint, a differing value given on the command line is ignored with a warning
+        parameters.setdefault('operator', 'remove')
+        parameters.setdefault('target_vertices', None)
+        parameters['target_reduction'] = None
+        given = [('-n', 'negative_down', negative_down, False), ('-t', 'max_triangle_area', max_triangle_area, 0),
+                 ('-a', 'aspect', aspect, False), ('--mode', 'mode', options['mode'], 'pass'),
+                 ('--reference', 'reference', options['reference'], False), ('--tiles', 'tiles', options['tiles'], 1),
+                 ('--operator', 'operator', options['operator'], 'remove'),
+                 ('--target-vertices', 'target_vertices', options['target_vertices'], None),
+                 ('--target-reduction', 'target_reduction', options['target_reduction'], None)]
+        for flag, name, value, default in given:
+            if value != default and value != parameters[name]:
+                log.warning('-Ignored ' + flag + ' ' + str(value) + ', Checkpoint Value Used: ' + str(parameters[name]))
+
+        input_file, negative_down, validate = parameters['input_file'], parameters['negative_down'], \
+            validate or parameters['validate']
+        max_triangle_area, aspect = parameters['max_triangle_area'], parameters['aspect']
+        options['mode'], options['reference'], options['tiles'] = parameters['mode'], parameters['reference'], \
+            parameters['tiles']
+        options['target_vertices'], options['target_reduction'] = parameters['target_vertices'], None
+        options['operator'] = parameters['operator']
+        log.info('-Resumed at Iteration ' + str(iteration_count) + ' With ' + str(input_mesh.n_vertices()) +
+                 ' Vertices')
+    else:
+        # Read boundary points
+        boundary_points = None
+        if boundary_idx_list is not None:
+            log.info('-Reading Boundary Node Indices')
+            boundary_points = Reader.read_boundary_idx(boundary_idx_list)
+
+        # Meshes too large for memory are streamed through disk and simplified chunk by chunk
+        if options['out_of_core']:
+            log.info('-Simplifying Mesh Out-of-Core')
+            simplify_out_of_core(input_file, z_offset, boundary_points, negative_down, validate, max_triangle_area,
+                                 aspect, 'Simplified_Mesh', options['chunk_size'], options['reference'])
+            return
+
+        log.info('-Reading Mesh')
+        with instrumentation.timed('read'):
+            input_mesh = Reader.read_gr3_mesh(input_file, z_offset, boundary_points, negative_down)
+            input_points, input_uncertainty = Reader.read_mesh_vertices(input_mesh, negative_down)
+        iteration_count = 1
+
+        # Write initial mesh file, only when every iteration is written
+        if options['output_every'] == 1:
+            log.info('-Writing Initial Mesh Files')
+            with instrumentation.timed('write'):
+                writer.write_mesh(input_mesh, 'Input_Mesh')
+
+    # Index the original soundings once, they do not change between iterations
+    log.info('-Indexing Input Soundings')
+    with instrumentation.timed('point_tree'):
+        if options['index_cache'] and input_file is not None:
+            point_tree = GridIndex.build_cached(input_points, input_file, negative_down)
+        else:
+            point_tree = GridIndex.build(input_points)
+
+    # Every face owns the soundings it contains, removals hand them over to the faces that replace it
+    log.info('-Assigning Soundings to Faces')
+    with instrumentation.timed('sounding_owners'):
+        input_mesh.assign_soundings(point_tree.points)
+
+    # Cost mode stops at the smaller reduction of a vertex count or a percentage of the starting vertices
+    target_vertices = options['target_vertices']
+    if options['target_reduction'] is not None:
+        reduction_target = int(ceil(input_mesh.n_vertices() * (1.0 - options['target_reduction'] / 100.0)))
+        target_vertices = max(target_vertices or 0, reduction_target)
+
+    # Per-iteration stage timings and counters, the first row includes reading and indexing
+    report = Report(options['report']) if options['report'] is not None else None
+
+    # Checkpoints hold everything needed to continue the run without the input files
+    checkpoint, on_removal = None, None
+    if options['checkpoint'] is not None:
+        parameters = {'input_file': input_file, 'negative_down': negative_down, 'validate': validate,
+                      'max_triangle_area': max_triangle_area, 'aspect': aspect, 'mode': options['mode'],
+                      'reference': options['reference'], 'tiles': options['tiles'], 'target_vertices': target_vertices,
+                      'operator': options['operator']}
+        checkpoint = Checkpoint(options['checkpoint'], input_points, input_uncertainty, parameters,
+                                options['checkpoint_every'], options['checkpoint_seconds'])
+        on_removal = checkpoint.removal
+
+    # Every removal from here on is recorded, so meshes at any level between input and output can be extracted
+    if options['progressive'] is not None and options['tiles'] == 1:
+        input_mesh.operation_log = ProgressiveLog(options['progressive'], input_mesh)
+
     # Simplify input mesh
     log.info('-Simplifying Mesh')
-    stop, iteration_count = False, 1
+    stop = False
     while stop is False:
         # Report iteration count
         log.info('\t-Iteration Count: ' + str(iteration_count))
+        if checkpoint is not None:
+            checkpoint.iteration = iteration_count
         
         # Report vertex/triangle count before simplification iteration
-        vertex_count_before_simplification = int(input_mesh.n_vertices())
-        triangle_count_before_simplification = int(input_mesh.n_faces())
-        average_depth_before_simplification = float(calculate_average_depth(input_mesh, negative_down))
+        statistics = input_mesh.statistics(negative_down)
+        vertex_count_before_simplification = statistics['vertices']
+        triangle_count_before_simplification = statistics['faces']
+        average_depth_before_simplification = statistics['average_depth']
         log.info('\t\t-Mesh Vertices Before Iteration: ' + str(vertex_count_before_simplification))
         log.info('\t\t-Mesh Triangles Before Iteration: ' + str(triangle_count_before_simplification))
         log.info('\t\t-Average Depth Before Iteration: ' + str(average_depth_before_simplification))
         
-        # Get vertex handles of mesh nodes
-        vertex_handles = input_mesh.vertices()
-        
-        # Sort list of vertex handles by depth
-        vertices_sorted = sorted([v for v in vertex_handles], key=lambda k: input_mesh.point(k)[2])
-
-        np_point_array = numpy.array([Point(p[0]) for p in input_points])
-        point_tree = STRtree(np_point_array, int(ceil(len(np_point_array) * 0.004)))
-
-        ignore_count = 0
-        for vertex_handle in vertices_sorted:
-            # Skips land and boundary nodes
-            if int(input_mesh.vertex_property('omit', vertex_handle)) != 0:
-                ignore_count += 1
-            elif float(input_mesh.vertex_property('z_offset', vertex_handle)) > input_mesh.point(vertex_handle)[2]:
-                ignore_count += 1
-            else:
-                vertex_removal(input_mesh, vertex_handle, point_tree, max_triangle_area, aspect)
-
-        # Garbage collection removes deleted elements from memory
-        input_mesh.garbage_collection()
+        # Skips land and boundary nodes, remaining vertices are tried shallowest first
+        input_mesh, ignore_count, stop = simplify_iteration(input_mesh, point_tree, max_triangle_area, aspect,
+                                                            options['mode'], options['reference'], options['operator'],
+                                                            options['tiles'], options['workers'], target_vertices,
+                                                            options['time_budget'], on_removal)
+        simplify_seconds = instrumentation.snapshot()['seconds']['simplify']
         
         # Report vertex/triangle count after simplification iteration
-        vertex_count_after_simplification = int(input_mesh.n_vertices())
-        triangle_count_after_simplification = int(input_mesh.n_faces())
-        average_depth_after_simplification = float(calculate_average_depth(input_mesh, negative_down))
+        statistics = input_mesh.statistics(negative_down)
+        vertex_count_after_simplification = statistics['vertices']
+        triangle_count_after_simplification = statistics['faces']
+        average_depth_after_simplification = statistics['average_depth']
         log.info('\t\t-Mesh Vertices After Iteration: ' + str(vertex_count_after_simplification))
         log.info('\t\t-Mesh Triangles After Iteration: ' + str(triangle_count_after_simplification))
         log.info('\t\t-Average Depth After Iteration: ' + str(average_depth_after_simplification))
+        log.info('\t\t-Triangle Area Range: ' + str(statistics['min_area']) + ' - ' + str(statistics['max_area']))
+        log.info('\t\t-Vertices by Omit Flag (Eligible, Boundary+Land, Boundary, Land, Tile Border): ' +
+                 str(statistics['omit_counts']))
         log.info('\t\t-Total Omitted Nodes From Simplification: ' + str(ignore_count))
 
         # Validate simplification
         if validate:
             log.info('\t-Validating Mesh Simplification')
-            violations = validate_mesh(input_mesh, input_points)
-            log.info('\t\t-Violations: ' + str(len(violations)))
-            Writer.write_violations_xyz(violations, 'Violations_' + str(iteration_count))
-        
-        # Write output file for iteration: VTK and OBJ
-        log.info('\t\t-Writing Output Files')
-        file_name = 'Simplified_Mesh_Iteration_' + str(iteration_count)
-        Writer.write_mesh_vtk(input_mesh, file_name)
-        Writer.write_mesh_gr3(input_mesh, file_name)
+            with instrumentation.timed('validation'):
+                errors, summary = validate_mesh(input_mesh, input_points, input_uncertainty)
+            log.info('\t\t-Violations: ' + str(summary['violations']))
+            log.info('\t\t-Maximum Vertical Error: ' + str(summary['max_error']))
+            log.info('\t\t-RMS Vertical Error: ' + str(summary['rms_error']))
+            if summary['unlocated']:
+                log.info('\t\t-Soundings Outside Mesh: ' + str(summary['unlocated']))
+
+        # Write output files for the iterations selected by --output, the last one is always written
+        output_every = options['output_every']
+        if stop or (output_every > 0 and iteration_count % output_every == 0):
+            log.info('\t\t-Writing Output Files')
+            file_name = 'Simplified_Mesh_Iteration_' + str(iteration_count)
+            with instrumentation.timed('write'):
+                if validate:
+                    violations = input_points[~(numpy.abs(errors) <= input_uncertainty)]
+                    writer.write_violations(violations, 'Violations_' + str(iteration_count))
+                writer.write_mesh(input_mesh, file_name)
+
+        if report is not None:
+            report.add_iteration(iteration_count, vertex_count_before_simplification, vertex_count_after_simplification,
+                                 simplify_seconds)
+        instrumentation.reset()
 
         # Increase iteration count
         iteration_count += 1
-        
-        # Stop iterations if mesh can no longer be simplified
-        if vertex_count_before_simplification == vertex_count_after_simplification:
-            stop = True
+        if checkpoint is not None:
+            checkpoint.save(input_mesh, iteration_count)
+
+    if input_mesh.operation_log is not None:
+        input_mesh.operation_log.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,437 @@
+import numpy
+
+from mesh_simplification import kernels
+from mesh_simplification.utilities import triangle_normals, triangle_aspects, batch_interpolate, locate_points
+
+
+class ArrayMesh(object):
+    """ Triangle mesh kept in contiguous NumPy arrays instead of per-handle OpenMesh properties.
+
+    Vertices are plain integer indices into points (N x 3), z_offset and omit. Faces are rows of face_vertices and are
+    stored counter-clockwise. Vertex-to-face adjacency is a linked list per vertex inside the flat incidence_face and
+    incidence_next pools. Deleted faces and incidences are chained into free-lists and reused by add_face, so the
+    arrays only grow when the mesh does; garbage_collection() compacts everything and renumbers vertices and faces.
+
+    Running statistics (sums and counts of positive and negative depths, vertices per omit flag, face areas and
+    their range) are updated with every vertex and face change, so reporting them never rescans the mesh. Face
+    normals and compass aspects are cached per face as well; they are only computed when first asked for, in bulk,
+    and reset when a face changes.
+
+    After assign_soundings(), every face also owns the soundings it contains, chained into a linked list per face
+    through face_sounding and sounding_next, so the soundings under a one-ring are found without a spatial query. """
+
+    def __init__(self, points, faces, z_offset, omit):
+        self.points = numpy.ascontiguousarray(points, dtype=numpy.float64)
+        self.z_offset = numpy.ascontiguousarray(z_offset, dtype=numpy.float64)
+        self.omit = numpy.ascontiguousarray(omit, dtype=numpy.int8)
+        self.vertex_alive = numpy.ones(len(self.points), dtype=bool)
+        self._n_vertices = len(self.points)
+        self._build_connectivity(numpy.asarray(faces, dtype=numpy.int32).reshape(-1, 3))
+
+        # Hole re-triangulations of candidate vertices, see simplification.hole_triangulation()
+        self.hole_cache = dict()
+
+        # Index of every vertex in the mesh the run started from, kept through garbage collection, and the optional
+        # progressive.ProgressiveLog recording every removal
+        self.original_index = numpy.arange(len(self.points), dtype=numpy.int64)
+        self.operation_log = None
+
+        # Sounding ownership, see assign_soundings()
+        self.sounding_points = None
+        self.sounding_next = None
+        self.face_sounding = None
+
+    def _build_connectivity(self, faces):
+        """ Fills the face and incidence arrays in one bulk step. """
+
+        faces = orient_faces(self.points, faces)
+        num_faces = len(faces)
+
+        self.face_vertices = faces.copy()
+        self.face_alive = numpy.ones(num_faces, dtype=bool)
+        self._n_faces = num_faces
+        self._face_end = num_faces
+        self._face_free = -1
+
+        # Group the three incidences of every face by vertex, each group becomes that vertex's linked list
+        incidence_vertex = faces.ravel()
+        order = numpy.argsort(incidence_vertex, kind='stable')
+        sorted_vertex = incidence_vertex[order]
+        self.incidence_face = (order // 3).astype(numpy.int32)
+        self.incidence_next = numpy.arange(1, len(order) + 1, dtype=numpy.int32)
+        group_end = numpy.ones(len(order), dtype=bool)
+        group_end[:-1] = sorted_vertex[1:] != sorted_vertex[:-1]
+        self.incidence_next[group_end] = -1
+        group_start = numpy.ones(len(order), dtype=bool)
+        group_start[1:] = group_end[:-1]
+
+        self.vertex_first = numpy.full(len(self.points), -1, dtype=numpy.int32)
+        self.vertex_first[sorted_vertex[group_start]] = numpy.flatnonzero(group_start).astype(numpy.int32)
+        self._incidence_end = len(order)
+        self._incidence_free = -1
+
+        self._init_statistics()
+
+    def _init_statistics(self):
+        """ Computes the running statistics in one bulk step, afterwards they are only updated. """
+
+        z = self.points[self.vertex_alive, 2]
+        self._positive_depth_sum, self._positive_depth_count = float(z[z > 0].sum()), int((z > 0).sum())
+        self._negative_depth_sum, self._negative_depth_count = float(z[z < 0].sum()), int((z < 0).sum())
+        self.omit_counts = numpy.bincount(self.omit[self.vertex_alive], minlength=5)
+
+        faces = self.face_vertices[:self._face_end]
+        self.face_area = numpy.abs(signed_area(self.points[faces[:, 0]], self.points[faces[:, 1]],
+                                               self.points[faces[:, 2]])) / 2.0
+        self._area_range = None
+        self.face_normal = numpy.zeros((len(faces), 3), dtype=numpy.float64)
+        self.face_aspect = numpy.full(len(faces), -1, dtype=numpy.int8)  # -1 until computed
+
+    def _remove_vertex_statistics(self, vertex):
+        z = float(self.points[vertex, 2])
+        if z > 0:
+            self._positive_depth_sum -= z
+            self._positive_depth_count -= 1
+        elif z < 0:
+            self._negative_depth_sum -= z
+            self._negative_depth_count -= 1
+        self.omit_counts[self.omit[vertex]] -= 1
+
+    def _set_face_area(self, face, area):
+        self.face_area[face] = area
+        if self._area_range is not None:
+            self._area_range = (min(self._area_range[0], area), max(self._area_range[1], area))
+
+    def face_aspects(self, faces):
+        """ Compass aspects (indices into utilities.COMPASS_DIRECTIONS) of the given faces, computing the missing
+        ones together with their normals. """
+
+        faces = numpy.asarray(faces, dtype=numpy.int64)
+        missing = faces[self.face_aspect[faces] < 0]
+        if len(missing):
+            self.face_normal[missing] = triangle_normals(self.points[self.face_vertices[missing]])
+            self.face_aspect[missing] = triangle_aspects(normals=self.face_normal[missing])
+        return self.face_aspect[faces]
+
+    def average_depth(self, negative_down=False):
+        """ Average depth of the wet vertices (negative z if negative_down, positive z otherwise). """
+
+        if negative_down:
+            return self._negative_depth_sum / self._negative_depth_count if self._negative_depth_count else 0.0
+        return self._positive_depth_sum / self._positive_depth_count if self._positive_depth_count else 0.0
+
+    def area_range(self):
+        """ Smallest and largest face area. Deleting a face with the current smallest or largest area makes the range
+        stale, it is then recomputed on the next call. """
+
+        if self._area_range is None:
+            area = self.face_area[self.faces()]
+            self._area_range = (float(area.min()), float(area.max())) if len(area) else (0.0, 0.0)
+        return self._area_range
+
+    def statistics(self, negative_down=False):
+        min_area, max_area = self.area_range()
+        wet_count = self._negative_depth_count if negative_down else self._positive_depth_count
+        return {'vertices': self._n_vertices,
+                'faces': self._n_faces,
+                'wet_vertices': wet_count,
+                'average_depth': self.average_depth(negative_down),
+                'min_area': min_area,
+                'max_area': max_area,
+                'omit_counts': self.omit_counts.tolist()}
+
+    def n_vertices(self):
+        return self._n_vertices
+
+    def n_faces(self):
+        return self._n_faces
+
+    def vertices(self):
+        """ Indices of the vertices that have not been deleted. """
+
+        return numpy.flatnonzero(self.vertex_alive)
+
+    def faces(self):
+        """ Indices of the faces that have not been deleted. """
+
+        return numpy.flatnonzero(self.face_alive[:self._face_end])
+
+    def point(self, vertex):
+        return self.points[vertex]
+
+    def fv(self, face):
+        return self.face_vertices[face]
+
+    def vf(self, vertex):
+        """ Faces incident to a vertex. """
+
+        face_list = list()
+        incidence = self.vertex_first[vertex]
+        while incidence != -1:
+            face_list.append(int(self.incidence_face[incidence]))
+            incidence = self.incidence_next[incidence]
+        return face_list
+
+    def vv(self, vertex):
+        """ One-ring of a vertex in counter-clockwise order. For vertices on the mesh border the ring is open and
+        starts at the border neighbour without a preceding face. """
+
+        next_vertex = dict()
+        for face in self.vf(vertex):
+            a, b, c = self.face_vertices[face].tolist()
+            if a == vertex:
+                next_vertex[b] = c
+            elif b == vertex:
+                next_vertex[c] = a
+            else:
+                next_vertex[a] = b
+        if not next_vertex:
+            return list()
+
+        start = next(iter(next_vertex))
+        targets = set(next_vertex.values())
+        for v in next_vertex:
+            if v not in targets:
+                start = v
+                break
+
+        ring = [start]
+        current = next_vertex.get(start)
+        while current is not None and current != start and len(ring) <= len(next_vertex):
+            ring.append(current)
+            current = next_vertex.get(current)
+        return ring
+
+    def delete_vertex(self, vertex):
+        """ Deletes a vertex together with its incident faces, leaving a hole. """
+
+        for face in self.vf(vertex):
+            self.delete_face(face)
+        self._remove_vertex_statistics(vertex)
+        self.vertex_alive[vertex] = False
+        self._n_vertices -= 1
+
+    def collapse_vertex(self, vertex, target):
+        """ Merges a vertex into its neighbour target in place: the two faces on their shared edge are deleted and
+        every other face of the vertex keeps its index with the vertex replaced by target. Assumes the collapse is
+        valid (link condition holds and no face flips), see simplification.collapse_removal(). """
+
+        for face in self.vf(vertex):
+            corners = self.face_vertices[face]
+            if (corners == target).any():
+                self.delete_face(face)
+            else:
+                self._discard_face_area(face)
+                self.face_aspect[face] = -1
+                corners[corners == vertex] = target
+                self._remove_incidence(vertex, face)
+                self._add_incidence(target, face)
+                a, b, c = self.points[corners]
+                self._set_face_area(face, abs(signed_area(a, b, c)) / 2.0)
+        self._remove_vertex_statistics(vertex)
+        self.vertex_alive[vertex] = False
+        self._n_vertices -= 1
+
+    def assign_soundings(self, soundings_xyz):
+        """ Locates every sounding in the mesh once and makes the face containing it its owner. Soundings outside
+        the mesh are not owned by any face. """
+
+        faces = self.faces()
+        owner = locate_points(soundings_xyz, self.points[self.face_vertices[faces]])[0]
+        located = numpy.flatnonzero(owner >= 0)
+        self.sounding_points = soundings_xyz
+        self.sounding_next = numpy.full(len(soundings_xyz), -1, dtype=numpy.int32)
+        self.face_sounding = numpy.full(len(self.face_vertices), -1, dtype=numpy.int32)
+        self._link_soundings(located, faces[owner[located]])
+
+    def _link_soundings(self, soundings, faces):
+        """ Adds soundings to the front of the lists of their owner faces, all in one bulk step. """
+
+        order = numpy.argsort(faces, kind='stable')
+        soundings, faces = soundings[order], faces[order]
+        group_end = numpy.ones(len(faces), dtype=bool)
+        group_end[:-1] = faces[1:] != faces[:-1]
+        group_start = numpy.ones(len(faces), dtype=bool)
+        group_start[1:] = group_end[:-1]
+
+        following = numpy.empty(len(soundings), dtype=numpy.int32)
+        following[:-1] = soundings[1:]
+        following[group_end] = self.face_sounding[faces[group_end]]
+        self.sounding_next[soundings] = following
+        self.face_sounding[faces[group_start]] = soundings[group_start]
+
+    def face_soundings(self, faces):
+        """ Indices of the soundings owned by the given faces. """
+
+        if kernels.ENABLED:
+            return kernels.walk_lists(self.face_sounding, self.sounding_next, numpy.asarray(faces, dtype=numpy.int64))
+        soundings = list()
+        face_sounding, sounding_next = self.face_sounding, self.sounding_next
+        for face in faces:
+            sounding = face_sounding[face]
+            while sounding != -1:
+                soundings.append(sounding)
+                sounding = sounding_next[sounding]
+
+        return numpy.array(soundings, dtype=numpy.int64)
+
+    def reassign_soundings(self, soundings, faces, owner=None):
+        """ Hands soundings over to the faces that now cover them, after a removal replaced the faces that owned
+        them. Any soundings the given faces owned before are dropped, so they have to be among soundings. owner can
+        pass in the position in faces of the face containing each sounding, if it is already known. """
+
+        faces = numpy.asarray(faces, dtype=numpy.int64)
+        self.face_sounding[faces] = -1
+        if len(soundings) == 0:
+            return
+        if owner is None:
+            owner = batch_interpolate(self.points[self.face_vertices[faces]], self.sounding_points[soundings])[1]
+        self._link_soundings(soundings, faces[owner])
+
+    def _discard_face_area(self, face):
+        # Only the faces at either end of the area range make it stale
+        if self._area_range is not None and not self._area_range[0] < self.face_area[face] < self._area_range[1]:
+            self._area_range = None
+
+    def delete_face(self, face):
+        self._discard_face_area(face)
+        for v in self.face_vertices[face].tolist():
+            self._remove_incidence(v, face)
+        self.face_alive[face] = False
+        # Dead faces chain the face free-list through their first column
+        self.face_vertices[face] = (self._face_free, -1, -1)
+        self._face_free = face
+        self._n_faces -= 1
+
+    def add_face(self, v1, v2, v3):
+        """ Adds a face, orienting it counter-clockwise, and returns its index. """
+
+        area = signed_area(self.points[v1], self.points[v2], self.points[v3])
+        if area < 0:
+            v2, v3 = v3, v2
+
+        if self._face_free != -1:
+            face = self._face_free
+            self._face_free = int(self.face_vertices[face, 0])
+        else:
+            if self._face_end == len(self.face_vertices):
+                self._grow_faces()
+            face = self._face_end
+            self._face_end += 1
+
+        self.face_vertices[face] = (v1, v2, v3)
+        self.face_alive[face] = True
+        self._set_face_area(face, abs(area) / 2.0)
+        self.face_aspect[face] = -1
+        if self.face_sounding is not None:
+            self.face_sounding[face] = -1
+        for v in (v1, v2, v3):
+            self._add_incidence(v, face)
+        self._n_faces += 1
+        return face
+
+    def _add_incidence(self, vertex, face):
+        if self._incidence_free != -1:
+            incidence = self._incidence_free
+            self._incidence_free = int(self.incidence_next[incidence])
+        else:
+            if self._incidence_end == len(self.incidence_face):
+                self._grow_incidences()
+            incidence = self._incidence_end
+            self._incidence_end += 1
+
+        self.incidence_face[incidence] = face
+        self.incidence_next[incidence] = self.vertex_first[vertex]
+        self.vertex_first[vertex] = incidence
+
+    def _remove_incidence(self, vertex, face):
+        previous = -1
+        incidence = self.vertex_first[vertex]
+        while incidence != -1:
+            if self.incidence_face[incidence] == face:
+                if previous == -1:
+                    self.vertex_first[vertex] = self.incidence_next[incidence]
+                else:
+                    self.incidence_next[previous] = self.incidence_next[incidence]
+                self.incidence_next[incidence] = self._incidence_free
+                self._incidence_free = int(incidence)
+                return
+            previous = incidence
+            incidence = self.incidence_next[incidence]
+
+    def _grow_faces(self):
+        capacity = max(16, 2 * len(self.face_vertices))
+        face_vertices = numpy.full((capacity, 3), -1, dtype=numpy.int32)
+        face_vertices[:len(self.face_vertices)] = self.face_vertices
+        face_alive = numpy.zeros(capacity, dtype=bool)
+        face_alive[:len(self.face_alive)] = self.face_alive
+        face_area = numpy.zeros(capacity, dtype=numpy.float64)
+        face_area[:len(self.face_area)] = self.face_area
+        face_normal = numpy.zeros((capacity, 3), dtype=numpy.float64)
+        face_normal[:len(self.face_normal)] = self.face_normal
+        face_aspect = numpy.full(capacity, -1, dtype=numpy.int8)
+        face_aspect[:len(self.face_aspect)] = self.face_aspect
+        self.face_vertices, self.face_alive, self.face_area = face_vertices, face_alive, face_area
+        self.face_normal, self.face_aspect = face_normal, face_aspect
+        if self.face_sounding is not None:
+            face_sounding = numpy.full(capacity, -1, dtype=numpy.int32)
+            face_sounding[:len(self.face_sounding)] = self.face_sounding
+            self.face_sounding = face_sounding
+
+    def _grow_incidences(self):
+        capacity = max(48, 2 * len(self.incidence_face))
+        incidence_face = numpy.full(capacity, -1, dtype=numpy.int32)
+        incidence_face[:len(self.incidence_face)] = self.incidence_face
+        incidence_next = numpy.full(capacity, -1, dtype=numpy.int32)
+        incidence_next[:len(self.incidence_next)] = self.incidence_next
+        self.incidence_face, self.incidence_next = incidence_face, incidence_next
+
+    def compact_arrays(self):
+        """ Points, faces, z-offsets and omit flags of the live mesh with vertices renumbered consecutively. """
+
+        vertex_map = numpy.cumsum(self.vertex_alive, dtype=numpy.int32) - 1
+        faces = vertex_map[self.face_vertices[self.faces()]]
+        return (self.points[self.vertex_alive], faces, self.z_offset[self.vertex_alive],
+                self.omit[self.vertex_alive])
+
+    def garbage_collection(self):
+        """ Removes deleted vertices and faces from the arrays, renumbering both. """
+
+        vertex_map = (numpy.cumsum(self.vertex_alive) - 1).tolist()
+        alive = self.vertex_alive.tolist()
+        points, faces, z_offset, omit = self.compact_arrays()
+        self.points, self.z_offset, self.omit = points, z_offset, omit
+        self.original_index = self.original_index[self.vertex_alive]
+        live_faces = self.faces()
+        face_sounding = self.face_sounding[live_faces] if self.face_sounding is not None else None
+        face_normal, face_aspect = self.face_normal[live_faces], self.face_aspect[live_faces]
+        self.vertex_alive = numpy.ones(len(points), dtype=bool)
+        self._n_vertices = len(points)
+        self._build_connectivity(faces)
+        self.face_sounding = face_sounding
+
+        # Faces keep their vertices, so their cached normals and aspects are still valid
+        self.face_normal, self.face_aspect = face_normal, face_aspect
+
+        # Cached hole triangulations stay valid, only their vertex indices change
+        hole_cache = dict()
+        for vertex, (ring, triangles) in self.hole_cache.items():
+            if alive[vertex] and all(alive[v] for v in ring):
+                hole_cache[vertex_map[vertex]] = (tuple(vertex_map[v] for v in ring), triangles)
+        self.hole_cache = hole_cache
+
+
+def signed_area(p1, p2, p3):
+    """ Twice the signed area of a triangle in the x,y plane; positive when counter-clockwise. """
+
+    return (p2[..., 0] - p1[..., 0]) * (p3[..., 1] - p1[..., 1]) - (p3[..., 0] - p1[..., 0]) * (p2[..., 1] - p1[..., 1])
+
+
+def orient_faces(points, faces):
+    """ Returns a copy of faces with every clockwise face reversed. """
+
+    faces = numpy.array(faces, dtype=numpy.int32).reshape(-1, 3)
+    area = signed_area(points[faces[:, 0]], points[faces[:, 1]], points[faces[:, 2]])
+    clockwise = area < 0
+    faces[clockwise] = faces[clockwise][:, [0, 2, 1]]
+    return faces
@@ -0,0 +1,255 @@
+import os
+import shutil
+import tempfile
+import numpy
+
+from math import ceil, sqrt
+from numpy.lib.format import open_memmap
+
+from mesh_simplification.reader import Reader
+from mesh_simplification.writer import Writer
+from mesh_simplification.mesh import ArrayMesh
+from mesh_simplification.simplification import simplify_queue
+from mesh_simplification.spatial_index import GridIndex
+from mesh_simplification.parallel import TILE_BORDER
+from mesh_simplification.utilities import validate_mesh, outline_vertices
+from mesh_simplification.logger import log
+
+
+def node_chunks(infile, num_vertices, chunk_size):
+    """ Reads the node block of an open GR3 file chunk by chunk, yielding the first node number and an (n, 4) array of
+    index, x, y, z per chunk. """
+
+    for start in range(0, num_vertices, chunk_size):
+        yield start, Reader.read_gr3_nodes(infile, min(chunk_size, num_vertices - start))
+
+
+def tile_edges(nodes, num_tiles, sample_size=1000000):
+    """ Splits the node bbox into about num_tiles tiles holding similar numbers of nodes, using quantiles of a strided
+    sample of the (memory-mapped) nodes: columns split by x, then each column split by y. """
+
+    sample = numpy.asarray(nodes[::max(1, len(nodes) // sample_size), :2])
+    num_columns = int(ceil(sqrt(num_tiles)))
+    num_rows = int(ceil(num_tiles / float(num_columns)))
+
+    x_edges = numpy.quantile(sample[:, 0], numpy.linspace(0, 1, num_columns + 1)[1:-1])
+    column = numpy.searchsorted(x_edges, sample[:, 0], side='right')
+    y_edges = list()
+    for c in range(num_columns):
+        y = sample[column == c, 1]
+        if len(y) == 0:
+            y = sample[:, 1]
+        y_edges.append(numpy.quantile(y, numpy.linspace(0, 1, num_rows + 1)[1:-1]))
+
+    return x_edges, numpy.array(y_edges).reshape(num_columns, num_rows - 1)
+
+
+def locate_tiles(xy, x_edges, y_edges):
+    """ Tile number of every location in an (n, 2) array. """
+
+    column = numpy.searchsorted(x_edges, xy[:, 0], side='right')
+    row = numpy.empty(len(xy), dtype=numpy.int64)
+    for c in numpy.unique(column).tolist():
+        in_column = column == c
+        row[in_column] = numpy.searchsorted(y_edges[c], xy[in_column, 1], side='right')
+
+    return column * (y_edges.shape[1] + 1) + row
+
+
+def stream_input(mesh_url_in, z_offset, boundary_idx_list, negative_down, chunk_size, work_dir):
+    """ Streams the node and element blocks of a GR3 file to disk. Nodes go to memory-mapped arrays, elements are
+    bucketed into one raw int32 file per spatial tile by their centroid, and the lowest and highest tile using each
+    node are recorded so nodes shared by tiles can be frozen.
+
+    Returns the memory-mapped arrays, the per-tile element counts and whether any boundary node was found. """
+
+    with open(mesh_url_in) as infile:
+        infile.readline()  # header
+        num_faces, num_vertices = [int(v) for v in infile.readline().split()[:2]]
+
+        nodes = open_memmap(os.path.join(work_dir, 'nodes.npy'), mode='w+', dtype=numpy.float64,
+                            shape=(num_vertices, 3))
+        node_index = open_memmap(os.path.join(work_dir, 'node_index.npy'), mode='w+', dtype=numpy.int64,
+                                 shape=(num_vertices,))
+        for start, chunk in node_chunks(infile, num_vertices, chunk_size):
+            nodes[start:start + len(chunk)] = chunk[:, 1:4]
+            node_index[start:start + len(chunk)] = chunk[:, 0]
+        nodes.flush()
+
+        num_tiles = max(1, int(ceil(num_vertices / float(chunk_size))))
+        x_edges, y_edges = tile_edges(nodes, num_tiles)
+        num_tiles = (len(x_edges) + 1) * (y_edges.shape[1] + 1)
+        log.info('\t\t-Out-of-Core Tiles: ' + str(num_tiles))
+
+        lowest_tile = open_memmap(os.path.join(work_dir, 'lowest_tile.npy'), mode='w+', dtype=numpy.int32,
+                                  shape=(num_vertices,))
+        highest_tile = open_memmap(os.path.join(work_dir, 'highest_tile.npy'), mode='w+', dtype=numpy.int32,
+                                   shape=(num_vertices,))
+        lowest_tile[:] = numpy.iinfo(numpy.int32).max
+        highest_tile[:] = -1
+
+        tile_faces = numpy.zeros(num_tiles, dtype=numpy.int64)
+        for start in range(0, num_faces, chunk_size):
+            faces = Reader.read_gr3_elements(infile, min(chunk_size, num_faces - start))
+            if len(faces) == 0:
+                continue
+            vertices, local_faces = numpy.unique(faces, return_inverse=True)
+            local_faces = local_faces.reshape(-1, 3)
+            xy = numpy.asarray(nodes[vertices, :2])
+            face_tile = locate_tiles(xy[local_faces].mean(axis=1), x_edges, y_edges)
+
+            # Lowest and highest tile of every node used by this chunk, merged into the running values
+            corner_tile = numpy.repeat(face_tile, 3)
+            lowest = numpy.full(len(vertices), numpy.iinfo(numpy.int32).max, dtype=numpy.int64)
+            highest = numpy.full(len(vertices), -1, dtype=numpy.int64)
+            numpy.minimum.at(lowest, local_faces.ravel(), corner_tile)
+            numpy.maximum.at(highest, local_faces.ravel(), corner_tile)
+            lowest_tile[vertices] = numpy.minimum(lowest_tile[vertices], lowest)
+            highest_tile[vertices] = numpy.maximum(highest_tile[vertices], highest)
+
+            order = numpy.argsort(face_tile, kind='stable')
+            tiles, first = numpy.unique(face_tile[order], return_index=True)
+            for tile, rows in zip(tiles.tolist(), numpy.split(order, first[1:])):
+                with open(os.path.join(work_dir, 'tile_' + str(tile) + '.bin'), 'ab') as outfile:
+                    outfile.write(faces[rows].astype(numpy.int32).tobytes())
+                tile_faces[tile] += len(rows)
+
+        # Fall back on the open and land boundaries stored in the hgrid itself
+        if boundary_idx_list is None:
+            open_boundaries, land_boundaries = Reader.read_hgrid_boundaries(infile)
+            boundary_idx_list = numpy.concatenate(open_boundaries + land_boundaries + [[]]).astype(numpy.int64)
+            log.info('-Boundary Nodes Read From Mesh: ' + str(len(open_boundaries)) + ' Open, ' +
+                     str(len(land_boundaries)) + ' Land Segments')
+
+    # Z-offsets and eligibility are catalogued chunk by chunk, in the same way as Reader.read_gr3_mesh()
+    z_offsets = open_memmap(os.path.join(work_dir, 'z_offset.npy'), mode='w+', dtype=numpy.float64,
+                            shape=(num_vertices,))
+    omit = open_memmap(os.path.join(work_dir, 'omit.npy'), mode='w+', dtype=numpy.int8, shape=(num_vertices,))
+    z_offset_infile = None
+    if z_offset.replace('.', '').isnumeric():
+        z_offsets[:] = float(z_offset)
+    else:
+        z_offset_infile = open(z_offset)
+        z_offset_infile.readline()
+        z_offset_infile.readline()
+
+    boundary_idx_list = numpy.asarray(boundary_idx_list)
+    boundary_found = False
+    for start in range(0, num_vertices, chunk_size):
+        end = min(start + chunk_size, num_vertices)
+        if z_offset_infile is not None:
+            z_offsets[start:end] = Reader.read_gr3_nodes(z_offset_infile, end - start)[:, 3]
+        boundary = numpy.isin(node_index[start:end], boundary_idx_list)
+        boundary_found = boundary_found or bool(boundary.any())
+        omit[start:end] = Reader.omit_flags(nodes[start:end, 2], boundary, negative_down)
+    if z_offset_infile is not None:
+        z_offset_infile.close()
+    del node_index
+
+    return nodes, z_offsets, omit, lowest_tile, highest_tile, tile_faces, boundary_found
+
+
+def simplify_out_of_core(mesh_url_in, z_offset, boundary_idx_list, negative_down, validate, max_triangle_area,
+                         aspect_constraint, file_name, chunk_size=500000, reference=False):
+    """ Simplifies a GR3 mesh that does not fit in memory. The input is streamed into memory-mapped arrays and
+    spatial tiles of about chunk_size nodes on disk, then the tiles are loaded and simplified one at a time with the
+    nodes shared by several tiles frozen (a halo that is never removed), and the surviving faces are streamed to the
+    output GR3. Memory use depends on chunk_size rather than on the size of the mesh.
+
+    Unlike --tiles, there is no final sweep over the tile seams, so the frozen nodes stay in the output. Returns the
+    number of output vertices and faces. """
+
+    work_dir = tempfile.mkdtemp(prefix='out_of_core_', dir=os.path.dirname(os.path.abspath(file_name)))
+    try:
+        log.info('\t-Streaming Input Mesh to Disk: ' + work_dir)
+        nodes, z_offsets, omit, lowest_tile, highest_tile, tile_faces, boundary_found = \
+            stream_input(mesh_url_in, z_offset, boundary_idx_list, negative_down, chunk_size, work_dir)
+        num_vertices = len(nodes)
+        if not boundary_found:
+            log.info('-No Boundary Nodes Found, Outline of Mesh Kept')
+
+        kept = open_memmap(os.path.join(work_dir, 'kept.npy'), mode='w+', dtype=bool, shape=(num_vertices,))
+        faces_url = os.path.join(work_dir, 'faces_out.bin')
+        num_faces_out, violations, unlocated, max_error, square_error, validated = 0, 0, 0, 0.0, 0.0, 0
+        with open(faces_url, 'wb') as faces_outfile:
+            for tile in numpy.flatnonzero(tile_faces).tolist():
+                faces = numpy.fromfile(os.path.join(work_dir, 'tile_' + str(tile) + '.bin'), dtype=numpy.int32)
+                vertices, local_faces = numpy.unique(faces, return_inverse=True)
+                local_faces = local_faces.reshape(-1, 3)
+
+                # Nodes shared with another tile form the frozen halo
+                points = numpy.asarray(nodes[vertices])
+                tile_omit = numpy.asarray(omit[vertices])
+                shared = numpy.asarray(lowest_tile[vertices]) != numpy.asarray(highest_tile[vertices])
+                tile_omit[shared & (tile_omit == 0)] = TILE_BORDER
+
+                # All faces of an unshared node are in this tile, so it is on the outline of the mesh exactly when it
+                # is on the outline of the tile
+                if not boundary_found:
+                    outline = outline_vertices(len(vertices), local_faces) & ~shared
+                    tile_omit[outline & (tile_omit == 0)] = 2
+                    tile_omit[outline & (tile_omit == 3)] = 1
+
+                # Holes of interior nodes lie within the tile, so its own nodes are the soundings they can cover
+                soundings = points.copy()
+                if negative_down:
+                    soundings[:, 2] *= -1
+                tile_z_offset = numpy.asarray(z_offsets[vertices])
+                mesh = ArrayMesh(points, local_faces, tile_z_offset, tile_omit)
+                point_tree = GridIndex.build(soundings)
+                mesh.assign_soundings(point_tree.points)
+                vertices_before = mesh.n_vertices()
+                simplify_queue(mesh, point_tree, max_triangle_area, aspect_constraint, reference)
+                log.info('\t\t-Tile ' + str(tile) + ' Vertices: ' + str(vertices_before) + ' -> ' +
+                         str(mesh.n_vertices()))
+
+                if validate:
+                    # Shared nodes are validated by the lowest tile using them only
+                    owned = numpy.asarray(lowest_tile[vertices]) == tile
+                    errors, summary = validate_mesh(mesh, soundings[owned], tile_z_offset[owned])
+                    violations += summary['violations']
+                    unlocated += summary['unlocated']
+                    located_errors = numpy.abs(errors[~numpy.isnan(errors)])
+                    max_error = max(max_error, summary['max_error'])
+                    square_error += float((located_errors ** 2).sum())
+                    validated += len(located_errors)
+
+                kept[vertices[mesh.vertex_alive]] = True
+                tile_output = vertices[mesh.face_vertices[mesh.faces()]].astype(numpy.int32)
+                faces_outfile.write(tile_output.tobytes())
+                num_faces_out += len(tile_output)
+                del mesh, faces, local_faces, points, soundings
+
+        if validate:
+            log.info('\t-Validating Mesh Simplification')
+            log.info('\t\t-Violations: ' + str(violations))
+            log.info('\t\t-Maximum Vertical Error: ' + str(max_error))
+            log.info('\t\t-RMS Vertical Error: ' + str(sqrt(square_error / validated) if validated else 0.0))
+            if unlocated:
+                log.info('\t\t-Soundings Outside Mesh: ' + str(unlocated))
+
+        # Renumber the kept nodes consecutively, chunk by chunk
+        vertex_map = open_memmap(os.path.join(work_dir, 'vertex_map.npy'), mode='w+', dtype=numpy.int32,
+                                 shape=(num_vertices,))
+        num_vertices_out = 0
+        for start in range(0, num_vertices, chunk_size):
+            chunk_kept = numpy.asarray(kept[start:start + chunk_size])
+            vertex_map[start:start + chunk_size] = num_vertices_out + numpy.cumsum(chunk_kept) - 1
+            num_vertices_out += int(chunk_kept.sum())
+        log.info('\t\t-Mesh Vertices After Simplification: ' + str(num_vertices_out))
+        log.info('\t\t-Mesh Triangles After Simplification: ' + str(num_faces_out))
+
+        # Faces from ArrayMesh are already counter-clockwise
+        faces_out = numpy.memmap(faces_url, dtype=numpy.int32, mode='r', shape=(num_faces_out, 3)) \
+            if num_faces_out else numpy.zeros((0, 3), dtype=numpy.int32)
+        point_blocks = (numpy.asarray(nodes[start:start + chunk_size])[numpy.asarray(kept[start:start + chunk_size])]
+                        for start in range(0, num_vertices, chunk_size))
+        face_blocks = (numpy.asarray(vertex_map[numpy.asarray(faces_out[start:start + chunk_size]).ravel()])
+                       .reshape(-1, 3) for start in range(0, num_faces_out, chunk_size))
+        log.info('\t\t-Writing Output File')
+        Writer.write_gr3_blocks(file_name, num_vertices_out, num_faces_out, point_blocks, face_blocks)
+        del nodes, z_offsets, omit, lowest_tile, highest_tile, kept, vertex_map, faces_out
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return num_vertices_out, num_faces_out
@@ -0,0 +1,217 @@
+import os
+import numpy
+
+from math import ceil, sqrt
+
+from mesh_simplification import instrumentation
+from mesh_simplification.mesh import ArrayMesh
+from mesh_simplification.simplification import simplify_queue, removal_candidates, gather_candidate, \
+    test_removal, apply_removal
+from mesh_simplification.spatial_index import GridIndex
+from mesh_simplification.logger import log
+
+# Omit flag of vertices shared by several tiles, frozen while the tiles are simplified independently
+TILE_BORDER = 4
+
+# Read-only state of independent set worker processes, set once by init_removal_worker()
+_worker_state = dict()
+
+
+def partition_faces(points, faces, num_tiles):
+    """ Assigns every face to a spatial tile by its centroid. Columns split the faces evenly by x, and each column is
+    split evenly by y, so tiles hold similar numbers of faces. """
+
+    centroids = points[faces].mean(axis=1)
+    num_columns = int(ceil(sqrt(num_tiles)))
+    num_rows = int(ceil(num_tiles / float(num_columns)))
+
+    x_edges = numpy.quantile(centroids[:, 0], numpy.linspace(0, 1, num_columns + 1)[1:-1])
+    column = numpy.searchsorted(x_edges, centroids[:, 0], side='right')
+    tile = numpy.empty(len(faces), dtype=numpy.int64)
+    for c in range(num_columns):
+        in_column = column == c
+        if not in_column.any():
+            continue
+        y_edges = numpy.quantile(centroids[in_column, 1], numpy.linspace(0, 1, num_rows + 1)[1:-1])
+        tile[in_column] = c * num_rows + numpy.searchsorted(y_edges, centroids[in_column, 1], side='right')
+
+    return tile
+
+
+def border_vertices(num_vertices, faces, face_tile):
+    """ Mask of the vertices used by faces of more than one tile. """
+
+    corner_tile = numpy.repeat(face_tile, 3)
+    lowest = numpy.full(num_vertices, numpy.iinfo(numpy.int64).max, dtype=numpy.int64)
+    highest = numpy.full(num_vertices, -1, dtype=numpy.int64)
+    numpy.minimum.at(lowest, faces.ravel(), corner_tile)
+    numpy.maximum.at(highest, faces.ravel(), corner_tile)
+
+    return (highest >= 0) & (lowest != highest)
+
+
+def simplify_tile(tile_arrays):
+    """ Simplifies one tile in a worker process. Tile border vertices carry the TILE_BORDER omit flag, so every
+    vertex that can be removed has its whole one-ring inside the tile. Returns the faces of the simplified tile. """
+
+    points, faces, z_offset, omit, soundings, max_triangle_area, aspect_constraint, reference = tile_arrays
+    mesh = ArrayMesh(points, faces, z_offset, omit)
+    point_tree = GridIndex.build(soundings)
+    mesh.assign_soundings(point_tree.points)
+    simplify_queue(mesh, point_tree, max_triangle_area, aspect_constraint, reference)
+
+    return mesh.face_vertices[mesh.faces()]
+
+
+def simplify_tiled(mesh, point_tree, max_triangle_area, aspect_constraint, num_tiles, num_workers, reference=False,
+                   on_removal=None):
+    """ Splits the mesh into spatial tiles, simplifies the tile interiors in parallel worker processes, stitches the
+    tiles back together and finishes with a queue sweep seeded with the tile border vertices. on_removal is only
+    called during the final sweep, tile removals happen in the worker processes.
+
+    Returns the stitched mesh and the number of omitted vertices. """
+
+    points, faces, z_offset, omit = mesh.compact_arrays()
+    face_tile = partition_faces(points, faces, num_tiles)
+    border = border_vertices(len(points), faces, face_tile)
+    log.info('\t\t-Tiles: ' + str(len(numpy.unique(face_tile))) + ', Frozen Border Vertices: ' +
+             str(int(border.sum())))
+
+    tile_omit = omit.copy()
+    tile_omit[border & (omit == 0)] = TILE_BORDER
+
+    tile_vertices, tile_faces, bboxes = list(), list(), list()
+    for tile in numpy.unique(face_tile).tolist():
+        global_faces = faces[face_tile == tile]
+        vertices, local_faces = numpy.unique(global_faces, return_inverse=True)
+        tile_vertices.append(vertices)
+        tile_faces.append(local_faces.reshape(-1, 3))
+        xy = points[vertices, :2]
+        bboxes.append(numpy.concatenate([xy.min(axis=0), xy.max(axis=0)]))
+
+    # Holes of interior vertices lie within the tile, so soundings within its bbox are sufficient
+    sounding_index, offsets = point_tree.query_bboxes(bboxes)
+    tasks = list()
+    for tile, (vertices, local_faces) in enumerate(zip(tile_vertices, tile_faces)):
+        soundings = point_tree.points[sounding_index[offsets[tile]:offsets[tile + 1]]]
+        tasks.append((points[vertices], local_faces, z_offset[vertices], tile_omit[vertices], soundings,
+                      max_triangle_area, aspect_constraint, reference))
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    stitched_faces = list()
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        for vertices, local_faces in zip(tile_vertices, executor.map(simplify_tile, tasks)):
+            stitched_faces.append(vertices[local_faces])
+
+    # Vertices removed inside a tile are no longer referenced by any face
+    stitched_faces = numpy.concatenate(stitched_faces)
+    kept = numpy.zeros(len(points), dtype=bool)
+    kept[stitched_faces.ravel()] = True
+    vertex_map = numpy.cumsum(kept) - 1
+    stitched_mesh = ArrayMesh(points[kept], vertex_map[stitched_faces], z_offset[kept], omit[kept])
+    log.info('\t\t-Mesh Vertices After Tiles: ' + str(stitched_mesh.n_vertices()))
+    stitched_mesh.assign_soundings(point_tree.points)
+
+    # Seams: the frozen border vertices are the only ones not yet tried against their final one-ring
+    seeds = vertex_map[numpy.flatnonzero(border & kept)]
+    ignore_count = simplify_queue(stitched_mesh, point_tree, max_triangle_area, aspect_constraint, reference, seeds,
+                                  on_removal)
+
+    return stitched_mesh, ignore_count
+
+
+def independent_candidates(mesh, active):
+    """ Greedily picks candidates in the given (depth) order so that no two of them share any vertex of their
+    closed one-rings. Their removals touch disjoint faces and can be evaluated and applied in any order. """
+
+    blocked = numpy.zeros(len(mesh.points), dtype=bool)
+    selected = list()
+    for vertex_handle in active:
+        if blocked[vertex_handle]:
+            continue
+        ring = mesh.vv(vertex_handle)
+        if len(ring) < 3 or blocked[ring].any():
+            continue
+        blocked[vertex_handle] = True
+        blocked[ring] = True
+        selected.append((vertex_handle, ring))
+
+    return selected
+
+
+def init_removal_worker(point_tree, max_triangle_area, aspect_constraint, reference):
+    _worker_state['arguments'] = (point_tree, max_triangle_area, aspect_constraint, reference)
+
+
+def evaluate_candidate(candidate_arrays):
+    """ Worker side of test_removal(), using the state set by init_removal_worker(). """
+
+    ring_xyz, ring_faces_xyz, z_offset, soundings = candidate_arrays
+    point_tree, max_triangle_area, aspect_constraint, reference = _worker_state['arguments']
+    return test_removal(ring_xyz, ring_faces_xyz, z_offset, point_tree, max_triangle_area, aspect_constraint,
+                        reference, soundings=soundings)
+
+
+def simplify_independent(mesh, point_tree, max_triangle_area, aspect_constraint, num_workers, reference=False,
+                         on_removal=None):
+    """ Simplifies in rounds of independent removals. Each round selects an independent set of candidates, evaluates
+    their removal tests concurrently in a worker pool and applies the accepted removals in bulk.
+
+    Candidates that were not selected stay queued, rejected ones are only queued again when a neighbour is removed,
+    and the rounds continue until no candidate is left. Because the selected one-rings never overlap, the result does
+    not depend on the number of workers. Returns the number of omitted vertices. on_removal, if given, is called with
+    the mesh after every applied removal. """
+
+    candidates, ignore_count = removal_candidates(mesh)
+    eligible = numpy.zeros(len(mesh.points), dtype=bool)
+    eligible[candidates] = True
+    depth_rank = numpy.zeros(len(mesh.points), dtype=numpy.int64)
+    depth_rank[candidates] = numpy.arange(len(candidates))
+
+    init_arguments = (point_tree, max_triangle_area, aspect_constraint, reference)
+    executor = None
+    if num_workers is None or num_workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        executor = ProcessPoolExecutor(max_workers=num_workers, initializer=init_removal_worker,
+                                       initargs=init_arguments)
+    else:
+        init_removal_worker(*init_arguments)
+
+    try:
+        active = candidates
+        round_count = 0
+        while len(active):
+            round_count += 1
+            selected = independent_candidates(mesh, active.tolist())
+            tasks = [gather_candidate(mesh, vertex_handle, ring) for vertex_handle, ring in selected]
+            if executor is None:
+                results = map(evaluate_candidate, tasks)
+            else:
+                chunk_size = max(1, len(tasks) // (4 * (num_workers or os.cpu_count() or 1)))
+                results = executor.map(evaluate_candidate, tasks, chunksize=chunk_size)
+
+            requeue = numpy.zeros(len(mesh.points), dtype=bool)
+            requeue[active] = True
+            for (vertex_handle, ring), task, (triangles, deviation, owner) in zip(selected, tasks, results):
+                requeue[vertex_handle] = False
+                if triangles is not None:
+                    apply_removal(mesh, vertex_handle, ring, triangles, deviation, task[3], owner)
+                    instrumentation.count('removals')
+                    requeue[ring] = True
+                    if on_removal is not None:
+                        on_removal(mesh)
+                elif executor is not None:
+                    # Rejections by reason are counted in the worker processes and not collected
+                    instrumentation.reject('in_worker')
+
+            requeue &= eligible & mesh.vertex_alive
+            active = numpy.flatnonzero(requeue)
+            active = active[numpy.argsort(depth_rank[active], kind='stable')]
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    log.info('\t\t-Independent Set Rounds: ' + str(round_count))
+    return ignore_count
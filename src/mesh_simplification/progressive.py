@@ -0,0 +1,191 @@
+import sys
+import getopt
+import numpy
+
+from mesh_simplification.writer import Writer
+from mesh_simplification.logger import log, configure_logging
+
+USAGE = ' -i <progressive_log> -o <output_name> --vertices <num_vertices> --error <max_error> --vtk <write_vtk> \
+--binary <binary_vtk>'
+LONG_OPTIONS = ['vertices=', 'error=', 'vtk', 'binary']
+
+MAGIC = b'MSPROG1\n'
+
+
+class ProgressiveLog(object):
+    """ Records the removals of a run as a progressive mesh: the mesh the run starts from, followed by one operation
+    per removed vertex holding its original index, the largest vertical deviation its removal caused at the
+    soundings in the hole and the triangles that replaced its faces, in original vertex indices.
+
+    File layout (little-endian): MAGIC, the vertex and face counts (int64), the points (float64 x 3) and faces
+    (int32 x 3) of the starting mesh, then blocks of operations until the end of the file. Each block holds the
+    operation and triangle counts (int64), the removed vertices (int32), deviations (float64), triangles per
+    operation (int32) and the triangles (int32 x 3). Operations are buffered and written a block at a time. """
+
+    def __init__(self, url, mesh, block_size=65536):
+        self.url = url
+        self.block_size = block_size
+        self.num_operations = 0
+        self._vertices, self._deviations, self._counts, self._triangles = list(), list(), list(), list()
+
+        points = mesh.points[mesh.vertex_alive]
+        index_map = numpy.full(len(mesh.points), -1, dtype=numpy.int64)
+        index_map[mesh.vertex_alive] = numpy.arange(len(points))
+        faces = index_map[mesh.face_vertices[mesh.faces()]]
+        self.outfile = open(url, 'wb')
+        self.outfile.write(MAGIC)
+        self.outfile.write(numpy.array([len(points), len(faces)], dtype='<i8').tobytes())
+        self.outfile.write(numpy.ascontiguousarray(points, dtype='<f8').tobytes())
+        self.outfile.write(numpy.ascontiguousarray(faces, dtype='<i4').tobytes())
+
+        # Operations refer to vertices by their index in the starting mesh
+        mesh.original_index = numpy.arange(len(mesh.points), dtype=numpy.int64)
+        mesh.original_index[mesh.vertex_alive] = numpy.arange(len(points))
+
+    def record(self, mesh, vertex, ring, triangles, deviation):
+        """ Adds the removal of vertex, whose hole was filled with triangles given as indices into its one-ring. """
+
+        original_index = mesh.original_index
+        self._vertices.append(int(original_index[vertex]))
+        self._deviations.append(float(deviation))
+        self._counts.append(len(triangles))
+        self._triangles.append(original_index[numpy.asarray(ring)[triangles]])
+        self.num_operations += 1
+        if len(self._vertices) >= self.block_size:
+            self.flush()
+
+    def flush(self):
+        if not self._vertices:
+            return
+        triangles = numpy.concatenate(self._triangles)
+        self.outfile.write(numpy.array([len(self._vertices), len(triangles)], dtype='<i8').tobytes())
+        self.outfile.write(numpy.array(self._vertices, dtype='<i4').tobytes())
+        self.outfile.write(numpy.array(self._deviations, dtype='<f8').tobytes())
+        self.outfile.write(numpy.array(self._counts, dtype='<i4').tobytes())
+        self.outfile.write(numpy.ascontiguousarray(triangles, dtype='<i4').tobytes())
+        self.outfile.flush()
+        self._vertices, self._deviations, self._counts, self._triangles = list(), list(), list(), list()
+
+    def close(self):
+        self.flush()
+        self.outfile.close()
+        log.info('-Progressive Log Written: ' + self.url + ' (' + str(self.num_operations) + ' Operations)')
+
+
+def read_progressive_log(url_in):
+    """ Reads a file written by ProgressiveLog.
+
+    Returns the points and faces of the starting mesh, and the removed vertices, deviations, triangles per
+    operation and triangles of all operations in order. """
+
+    with open(url_in, 'rb') as infile:
+        if infile.read(len(MAGIC)) != MAGIC:
+            raise ValueError(url_in + ' is not a progressive mesh log')
+        num_vertices, num_faces = numpy.fromfile(infile, dtype='<i8', count=2).tolist()
+        points = numpy.fromfile(infile, dtype='<f8', count=num_vertices * 3).reshape(-1, 3)
+        faces = numpy.fromfile(infile, dtype='<i4', count=num_faces * 3).reshape(-1, 3)
+
+        vertices, deviations, counts, triangles = list(), list(), list(), list()
+        while True:
+            header = numpy.fromfile(infile, dtype='<i8', count=2)
+            if len(header) < 2:
+                break
+            num_operations, num_triangles = header.tolist()
+            vertices.append(numpy.fromfile(infile, dtype='<i4', count=num_operations))
+            deviations.append(numpy.fromfile(infile, dtype='<f8', count=num_operations))
+            counts.append(numpy.fromfile(infile, dtype='<i4', count=num_operations))
+            triangles.append(numpy.fromfile(infile, dtype='<i4', count=num_triangles * 3).reshape(-1, 3))
+
+    if not vertices:
+        return (points, faces, numpy.zeros(0, dtype=numpy.int32), numpy.zeros(0), numpy.zeros(0, dtype=numpy.int32),
+                numpy.zeros((0, 3), dtype=numpy.int32))
+    return (points, faces, numpy.concatenate(vertices), numpy.concatenate(deviations), numpy.concatenate(counts),
+            numpy.concatenate(triangles))
+
+
+def operations_for_error(deviations, max_error):
+    """ Length of the longest prefix of operations whose deviations are all within max_error. Each deviation is
+    measured against the original soundings, so their running maximum bounds the error of the extracted mesh. """
+
+    return int(numpy.searchsorted(numpy.maximum.accumulate(deviations), max_error, side='right'))
+
+
+def extract_mesh(points, faces, vertices, counts, triangles, num_operations):
+    """ Mesh after the first num_operations removals, as compact points and faces.
+
+    Every vertex is removed at most once, and a face lives from the operation that created it until the first
+    removal of one of its corners, so the live faces are found for all operations at once. """
+
+    num_operations = min(max(int(num_operations), 0), len(vertices))
+    removed_at = numpy.full(len(points), len(vertices), dtype=numpy.int64)
+    removed_at[vertices] = numpy.arange(len(vertices))
+
+    all_faces = numpy.concatenate([faces, triangles]).astype(numpy.int64)
+    created_at = numpy.concatenate([numpy.full(len(faces), -1, dtype=numpy.int64),
+                                    numpy.repeat(numpy.arange(len(vertices)), counts)])
+    removed_face_at = removed_at[all_faces].min(axis=1)
+    alive = (created_at < num_operations) & (removed_face_at >= num_operations)
+
+    kept = removed_at >= num_operations
+    vertex_map = numpy.cumsum(kept) - 1
+    return points[kept], vertex_map[all_faces[alive]]
+
+
+def main():
+    url_in, file_name, num_vertices, max_error, write_vtk, binary_vtk = None, 'Extracted_Mesh', None, None, False, False
+    try:
+        options_list, remainder = getopt.getopt(sys.argv[1:], "hi:o:", LONG_OPTIONS)
+    except getopt.GetoptError:
+        print(sys.argv[0], USAGE)
+        sys.exit(2)
+    for opt, arg in options_list:
+        if opt == '-h':
+            print(sys.argv[0], USAGE)
+            sys.exit()
+        elif opt == '--vertices':
+            num_vertices = int(arg)
+        elif opt == '--error':
+            max_error = float(arg)
+        elif opt == '--vtk':
+            write_vtk = True
+        elif opt == '--binary':
+            binary_vtk = True
+        elif opt in "-i":
+            url_in = str(arg)
+        elif opt in "-o":
+            file_name = str(arg)
+
+    if url_in is None or (num_vertices is None and max_error is None):
+        print(sys.argv[0], USAGE)
+        sys.exit(2)
+
+    configure_logging()
+
+    log.info('-Reading Progressive Log: ' + url_in)
+    points, faces, vertices, deviations, counts, triangles = read_progressive_log(url_in)
+    log.info('\t-Starting Mesh Vertices: ' + str(len(points)))
+    log.info('\t-Operations: ' + str(len(vertices)))
+
+    # With both limits the extraction stops at whichever is reached first
+    num_operations = len(vertices)
+    if num_vertices is not None:
+        num_operations = min(num_operations, len(points) - num_vertices)
+    if max_error is not None:
+        num_operations = min(num_operations, operations_for_error(deviations, max_error))
+    num_operations = max(num_operations, 0)
+
+    points_out, faces_out = extract_mesh(points, faces, vertices, counts, triangles, num_operations)
+    log.info('\t-Operations Applied: ' + str(num_operations))
+    log.info('\t-Mesh Vertices: ' + str(len(points_out)))
+    log.info('\t-Mesh Triangles: ' + str(len(faces_out)))
+    if num_operations:
+        log.info('\t-Maximum Deviation: ' + str(float(deviations[:num_operations].max())))
+
+    Writer.write_gr3(points_out, faces_out, file_name)
+    if write_vtk:
+        Writer.write_vtk(points_out, faces_out, file_name, binary_vtk)
+    log.info('-Mesh Written: ' + file_name + '.gr3')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,29 @@
 import sys
 import getopt
-import csv
+import itertools
 import numpy
 
-from openmesh import TriMesh
-from mesh_simplification.logger import log
+from mesh_simplification.mesh import ArrayMesh
+from mesh_simplification.utilities import outline_vertices
+from mesh_simplification.logger import log, configure_logging
+
+USAGE = ' -i <inputfile> -b <boundary_points> -n <negative_down> -v <validation> -z <z_offset> \
+-t <max_triangle_area> -a <aspect_constraint> --reference <reference_interpolation> \
+--binary <binary_vtk> \
+--mode <pass|queue|independent|cost> \
+--index-cache <index_cache> \
+--tiles <num_tiles> --workers <num_workers> \
+--out-of-core <out_of_core> --chunk-size <chunk_nodes> \
+--checkpoint <checkpoint_file> --checkpoint-every <removals> --checkpoint-seconds <seconds> \
+--resume <checkpoint_file> \
+--report <report_file> --profile <profile_file> --tracemalloc <trace_memory> \
+--target-vertices <num_vertices> --target-reduction <percent> --time-budget <seconds> \
+--operator <remove|collapse> --progressive <progressive_log> \
+--output <all|final|every:N> --formats <gr3,vtk> --sync-write <synchronous_write>'
+LONG_OPTIONS = ['reference', 'binary', 'mode=', 'index-cache', 'tiles=', 'workers=', 'out-of-core', 'chunk-size=',
+                'checkpoint=', 'checkpoint-every=', 'checkpoint-seconds=', 'resume=', 'report=', 'profile=',
+                'tracemalloc', 'target-vertices=', 'target-reduction=', 'time-budget=',
+                'operator=', 'progressive=', 'output=', 'formats=', 'sync-write']
 
 
 class Reader(object):
@@ -19,17 +38,87 @@ class Reader(object):
         max_triangle_area = 0
         aspect = False
 
+        # Less common settings are given as long options and returned together
+        options = {'reference': False,
+                   'binary_vtk': False,
+                   'mode': 'pass',
+                   'index_cache': False,
+                   'tiles': 1,
+                   'workers': None,
+                   'out_of_core': False,
+                   'chunk_size': 500000,
+                   'checkpoint': None,
+                   'checkpoint_every': 0,
+                   'checkpoint_seconds': 0,
+                   'resume': None,
+                   'report': None,
+                   'profile': None,
+                   'tracemalloc': False,
+                   'target_vertices': None,
+                   'target_reduction': None,
+                   'time_budget': None,
+                   'operator': 'remove',
+                   'progressive': None,
+                   'output': 'all',
+                   'output_every': 1,
+                   'formats': ['gr3', 'vtk'],
+                   'sync_write': False}
+
         try:
-            options, remainder = getopt.getopt(sys.argv[1:], "hi:b:nvz:t:a")
+            options_list, remainder = getopt.getopt(sys.argv[1:], "hi:b:nvz:t:a", LONG_OPTIONS)
         except getopt.GetoptError:
-            print(sys.argv[0], ' -i <inputfile> -b <boundary_points> -n <negative_down> -v <validation> \
-                                 -z <z_offset> -t <max_triangle_area> -a <aspect_constraint>')
+            print(sys.argv[0], USAGE)
             sys.exit(2)
-        for opt, arg in options:
+        for opt, arg in options_list:
             if opt == '-h':
-                print(sys.argv[0], ' -i <inputfile> -b <boundary_points> -n <negative_down> -v <validation> \
-                                     -z <z_offset> -t <max_triangle_area> -a <aspect_constraint>')
+                print(sys.argv[0], USAGE)
                 sys.exit()
+            elif opt == '--reference':
+                options['reference'] = True
+            elif opt == '--binary':
+                options['binary_vtk'] = True
+            elif opt == '--mode':
+                options['mode'] = str(arg)
+            elif opt == '--index-cache':
+                options['index_cache'] = True
+            elif opt == '--tiles':
+                options['tiles'] = int(arg)
+            elif opt == '--workers':
+                options['workers'] = int(arg)
+            elif opt == '--out-of-core':
+                options['out_of_core'] = True
+            elif opt == '--chunk-size':
+                options['chunk_size'] = int(arg)
+            elif opt == '--checkpoint':
+                options['checkpoint'] = str(arg)
+            elif opt == '--checkpoint-every':
+                options['checkpoint_every'] = int(arg)
+            elif opt == '--checkpoint-seconds':
+                options['checkpoint_seconds'] = float(arg)
+            elif opt == '--resume':
+                options['resume'] = str(arg)
+            elif opt == '--report':
+                options['report'] = str(arg)
+            elif opt == '--profile':
+                options['profile'] = str(arg)
+            elif opt == '--tracemalloc':
+                options['tracemalloc'] = True
+            elif opt == '--target-vertices':
+                options['target_vertices'] = int(arg)
+            elif opt == '--target-reduction':
+                options['target_reduction'] = float(arg)
+            elif opt == '--time-budget':
+                options['time_budget'] = float(arg)
+            elif opt == '--operator':
+                options['operator'] = str(arg)
+            elif opt == '--progressive':
+                options['progressive'] = str(arg)
+            elif opt == '--output':
+                options['output'] = str(arg)
+            elif opt == '--formats':
+                options['formats'] = [output_format.strip().lower() for output_format in str(arg).split(',')]
+            elif opt == '--sync-write':
+                options['sync_write'] = True
             elif opt in "-i":
                 input_file = str(arg)  
             elif opt in "-b":
@@ -44,16 +133,51 @@ class Reader(object):
                 max_triangle_area = float(arg)
             elif opt in "-a":
                 aspect = True
+
+        # The log file is only created once the arguments have been parsed, not for -h or usage errors
+        configure_logging()
+
         # Log input parameters
         log.info('-i {} -b {} -n {} -v {} -z {} -t {} -a {}'.format(input_file, boundary_idx_list, negative_down,
                                                                     validate, z_offset, max_triangle_area, aspect))
         
+        if options['report'] is not None:
+            log.info('-Instrumentation Report: ' + options['report'])
+        if options['profile'] is not None:
+            log.info('-cProfile Statistics: ' + options['profile'])
+
+        # Iteration meshes are written every output_every iterations, 0 writes the final mesh only
+        if options['output'] == 'all':
+            options['output_every'] = 1
+        elif options['output'] == 'final':
+            options['output_every'] = 0
+        elif options['output'].startswith('every:') and options['output'][6:].isdigit() and \
+                int(options['output'][6:]) > 0:
+            options['output_every'] = int(options['output'][6:])
+        else:
+            log.critical('Unknown Output Policy: ' + options['output'])
+            sys.exit()
+        unknown_formats = [output_format for output_format in options['formats'] if output_format not in ('gr3', 'vtk')]
+        if unknown_formats:
+            log.critical('Unknown Output Formats: ' + str(unknown_formats))
+            sys.exit()
+        log.info('-Output Meshes: ' + options['output'] + ', Formats: ' + str(options['formats']))
+        if options['sync_write']:
+            log.info('-Output Files Written Synchronously')
+
+        # A resumed run takes its mesh, soundings and simplification parameters from the checkpoint
+        if options['resume'] is not None:
+            log.info('-Resuming From Checkpoint: ' + options['resume'])
+            if options['checkpoint'] is None:
+                options['checkpoint'] = options['resume']
+            log.info('-Checkpoint File: ' + options['checkpoint'])
+            return input_file, boundary_idx_list, negative_down, validate, z_offset, max_triangle_area, aspect, options
+
         if input_file is None:
             log.critical('Source Bathymetry Not Provided')
             sys.exit()
         if boundary_idx_list is None:
-            log.info('-Boundary Points Not Provided')
-            sys.exit()
+            log.info('-Boundary Points Not Provided, Open and Land Boundaries of Input Mesh Will be Used')
         if z_offset is None:
             log.info('-Enter Z-Offset Value')
             sys.exit()
@@ -80,103 +204,191 @@ class Reader(object):
             log.info('-No Area Constraint for Triangle Size')
         else:
             log.info('-Maximum Triangle Area: ' + str(max_triangle_area))
+        if options['reference']:
+            log.info('-Z-Offset Test Uses Reference (Per-Point) Interpolation')
+        if options['binary_vtk']:
+            log.info('-VTK Files Written in Binary Format')
+        if options['mode'] not in ('pass', 'queue', 'independent', 'cost'):
+            log.critical('Unknown Simplification Mode: ' + options['mode'])
+            sys.exit()
+        log.info('-Simplification Mode: ' + options['mode'])
+        if options['operator'] not in ('remove', 'collapse'):
+            log.critical('Unknown Removal Operator: ' + options['operator'])
+            sys.exit()
+        if options['operator'] == 'collapse':
+            if options['mode'] in ('pass', 'queue') and options['tiles'] == 1:
+                log.info('-Vertices Removed by Half-Edge Collapse')
+            else:
+                log.info('-Half-Edge Collapse Only Applies to Pass and Queue Modes Without Tiles')
+        if options['mode'] == 'cost':
+            log.info('-Cost Mode Targets: Vertices ' + str(options['target_vertices']) + ', Reduction (%) ' +
+                     str(options['target_reduction']) + ', Time Budget (s) ' + str(options['time_budget']))
+        elif options['target_vertices'] is not None or options['target_reduction'] is not None or \
+                options['time_budget'] is not None:
+            log.info('-Targets and Time Budget Only Apply to Cost Mode')
+        if options['mode'] == 'independent':
+            log.info('-Independent Set Removal Workers: ' + str(options['workers'] or 'All Available'))
+        if options['tiles'] > 1:
+            log.info('-Parallel Simplification: ' + str(options['tiles']) + ' Tiles, ' +
+                     str(options['workers'] or 'All Available') + ' Workers')
+        if options['out_of_core']:
+            log.info('-Out-of-Core Simplification: ' + str(options['chunk_size']) + ' Nodes per Chunk')
+            if options['output'] != 'all' or options['formats'] != ['gr3', 'vtk'] or options['sync_write']:
+                log.info('-Output Options Do Not Apply to Out-of-Core Simplification, Simplified_Mesh.gr3 is Written')
+        if options['checkpoint'] is not None:
+            log.info('-Checkpoint File: ' + options['checkpoint'])
+        if options['progressive'] is not None:
+            if options['tiles'] > 1 or options['out_of_core']:
+                log.info('-Progressive Log Does Not Apply to Tiles or Out-of-Core Simplification')
+                options['progressive'] = None
+            else:
+                log.info('-Progressive Log File: ' + options['progressive'])
 
-        return input_file, boundary_idx_list, negative_down, validate, z_offset, max_triangle_area, aspect
+        return input_file, boundary_idx_list, negative_down, validate, z_offset, max_triangle_area, aspect, options
 
     @staticmethod
     def read_boundary_idx(url_in):
-        boundary_idx_list = list()
-        with open(url_in) as infile:
-            reader = csv.reader(infile)
-            for idx in reader:
-                boundary_idx = int(idx[0])
-                boundary_idx_list.append(boundary_idx)
+        boundary_idx_list = numpy.loadtxt(url_in, delimiter=',', usecols=0, dtype=numpy.int64, ndmin=1)
 
         return boundary_idx_list
 
     @staticmethod
     def boundary_idx_from_hgrid(url_in):
-        boundary_list = list()
         with open(url_in) as infile:
-            reader = csv.reader(infile, delimiter=' ')
-            rows = list(reader)
-            num_faces, num_vertices = int(rows[1][0]), int(rows[1][1])
-            for i in range(num_faces+num_vertices+2, len(rows)):
-                row = rows[i]
-                if r'!' not in str(row):
-                    boundary_list.append(int(row[0]))
+            infile.readline()
+            num_faces, num_vertices = [int(v) for v in infile.readline().split()[:2]]
+            # Skip node and element blocks without parsing them
+            for _ in itertools.islice(infile, num_vertices + num_faces):
+                pass
+            open_boundaries, land_boundaries = Reader.read_hgrid_boundaries(infile)
 
         # Remove any duplicates
-        boundary_idx_list = list(set(boundary_list))
+        boundary_idx_list = numpy.concatenate(open_boundaries + land_boundaries + [[]]).astype(numpy.int64)
+        boundary_idx_list = numpy.unique(boundary_idx_list)
         return boundary_idx_list
 
+    @staticmethod
+    def read_hgrid_boundaries(infile):
+        """ Reads the open and land boundary sections following the element block of an hgrid.gr3 file.
+
+        Returns two lists with one array of node indices per boundary segment; both are empty if the file stops
+        after the element block. """
+
+        lines = [line.split() for line in infile]
+        lines = [line for line in lines if line and not line[0].startswith('!')]
+
+        def read_segments(position):
+            segments = list()
+            if position >= len(lines):
+                return segments, position
+            num_segments = int(lines[position][0])
+            position += 2  # Segment count and total node count
+            for _ in range(num_segments):
+                num_nodes = int(lines[position][0])
+                nodes = numpy.array([line[0] for line in lines[position+1:position+1+num_nodes]], dtype=numpy.int64)
+                segments.append(nodes)
+                position += num_nodes + 1
+            return segments, position
+
+        open_boundaries, position = read_segments(0)
+        land_boundaries, position = read_segments(position)
+
+        return open_boundaries, land_boundaries
+
+    @staticmethod
+    def read_gr3_nodes(infile, num_vertices):
+        """ Parses the node block of a GR3 file into an (N, 4) array of index, x, y, z in chunks. """
+
+        nodes = numpy.loadtxt(itertools.islice(infile, num_vertices), dtype=numpy.float64, usecols=(0, 1, 2, 3),
+                              ndmin=2)
+        if len(nodes) != num_vertices:
+            log.critical('GR3 Node Block Ended After ' + str(len(nodes)) + ' of ' + str(num_vertices) + ' Nodes')
+            sys.exit()
+
+        return nodes
+
+    @staticmethod
+    def read_gr3_elements(infile, num_faces):
+        """ Parses the element block of a GR3 file into an (F, 3) array of zero-based vertex indices. """
+
+        elements = numpy.loadtxt(itertools.islice(infile, num_faces), dtype=numpy.int64, usecols=(0, 1, 2, 3, 4),
+                                 ndmin=2)
+        if len(elements) != num_faces:
+            log.critical('GR3 Element Block Ended After ' + str(len(elements)) + ' of ' + str(num_faces) +
+                         ' Elements')
+            sys.exit()
+        if (elements[:, 1] != 3).any():
+            log.info('-Skipping ' + str(int((elements[:, 1] != 3).sum())) + ' Non-Triangular Elements')
+            elements = elements[elements[:, 1] == 3]
+
+        # indexing starts from 1 in gr3 format
+        return (elements[:, 2:5] - 1).astype(numpy.int32)
+
     @staticmethod
     def read_mesh_vertices(mesh, negative_down=False):
-        points_list = list()
-        for vertex_handle in mesh.vertices():
-            sounding = mesh.point(vertex_handle)
-            vertical_uncertainty = float(mesh.vertex_property('z_offset', vertex_handle))
-            if negative_down:
-                z = float(sounding[2]) * -1
-            else:
-                z = float(sounding[2])
-            x, y = float(sounding[0]), float(sounding[1])
-            points_list.append([[x, y, z], vertical_uncertainty])
+        """ Copies the live mesh vertices into an (N, 3) sounding array and an (N,) vertical uncertainty array. """
+
+        vertices = mesh.vertices()
+        points = mesh.points[vertices].copy()
+        if negative_down:
+            points[:, 2] *= -1
+        vertical_uncertainty = mesh.z_offset[vertices].copy()
 
-        return points_list
+        return points, vertical_uncertainty
 
     @staticmethod
-    def read_gr3_mesh(mesh_url_in, z_offset, boundary_idx_list, negative_down):
+    def read_z_offsets(z_offset, num_vertices):
         # If z-offset is float, then update all nodes with the same value, otherwise use provided node level offset file
-        individual_node_z_offset = False
         if z_offset.replace('.', '').isnumeric():
-            z_offset = float(z_offset)
+            z_offsets = numpy.full(num_vertices, float(z_offset))
         else:
-            individual_node_z_offset = True
-            z_offset_infile = open(z_offset)
-            z_offset_reader = csv.reader(z_offset_infile, delimiter=' ')
-            z_offset_rows = list(z_offset_reader)
+            with open(z_offset) as z_offset_infile:
+                z_offset_infile.readline()
+                z_offset_infile.readline()
+                z_offsets = Reader.read_gr3_nodes(z_offset_infile, num_vertices)[:, 3]
+
+        return z_offsets
 
+    @staticmethod
+    def read_gr3_mesh(mesh_url_in, z_offset, boundary_idx_list, negative_down):
         with open(mesh_url_in) as infile:
-            reader = csv.reader(infile, delimiter=' ')
-            rows = list(reader)
-
-            # header = rows[0]
-            num_faces, num_vertices = int(rows[1][0]), int(rows[1][1])
-
-            mesh = TriMesh()
-            for i in range(2, num_vertices+2):
-                sounding = rows[i]
-                # May need to adjust negative z values
-                idx, x, y, z = float(sounding[0]), float(sounding[1]), float(sounding[2]), float(sounding[3])
-                vertex_handle = mesh.add_vertex(numpy.array([x, y, z]))
-                # Update vertex with z_offset
-                if individual_node_z_offset:
-                    z_offset_sounding = z_offset_rows[i]
-                    z_offset = float(z_offset_sounding[3])
-                mesh.set_vertex_property('z_offset', vertex_handle, z_offset)
-
-                # Update vertex eligibility for simplification and catalog
-                if idx in boundary_idx_list:
-                    # Boundary point and land point
-                    if (negative_down and z > 0) or (not negative_down and z < 0):
-                        mesh.set_vertex_property('omit', vertex_handle, 1)
-                    # Only boundary point
-                    else:
-                        mesh.set_vertex_property('omit', vertex_handle, 2)
-                elif (negative_down and z > 0) or (not negative_down and z < 0):
-                    # Only land point
-                    mesh.set_vertex_property('omit', vertex_handle, 3)
-                else:
-                    # Non-boundary and non-land, eligible for simplification
-                    mesh.set_vertex_property('omit', vertex_handle, 0)
-            for i in range(num_vertices+2, num_vertices+num_faces+2):
-                face = rows[i]
-                # indexing starts from 1 in gr3 format
-                idx, c, idx1, idx2, idx3 = int(face[0]), int(face[1]), int(face[2])-1, int(face[3])-1, int(face[4])-1
-                point1, point2, point3 = mesh.vertex_handle(idx1), mesh.vertex_handle(idx2), mesh.vertex_handle(idx3)
-                mesh.add_face(point1, point2, point3)
-
-        if individual_node_z_offset:
-            z_offset_infile.close()
+            infile.readline()  # header
+            num_faces, num_vertices = [int(v) for v in infile.readline().split()[:2]]
+            nodes = Reader.read_gr3_nodes(infile, num_vertices)
+            faces = Reader.read_gr3_elements(infile, num_faces)
+
+            # Fall back on the open and land boundaries stored in the hgrid itself
+            if boundary_idx_list is None:
+                open_boundaries, land_boundaries = Reader.read_hgrid_boundaries(infile)
+                boundary_idx_list = numpy.concatenate(open_boundaries + land_boundaries + [[]]).astype(numpy.int64)
+                log.info('-Boundary Nodes Read From Mesh: ' + str(len(open_boundaries)) + ' Open, ' +
+                         str(len(land_boundaries)) + ' Land Segments')
+
+        z_offsets = Reader.read_z_offsets(z_offset, num_vertices)
+
+        # Update vertex eligibility for simplification and catalog
+        boundary = numpy.isin(nodes[:, 0], numpy.asarray(boundary_idx_list))
+        if not boundary.any():
+            # Without boundary nodes the outline of the mesh would be coarsened, keep it instead
+            log.info('-No Boundary Nodes Found, Outline of Mesh Kept')
+            boundary = outline_vertices(num_vertices, faces)
+        omit = Reader.omit_flags(nodes[:, 3], boundary, negative_down)
+
+        mesh = ArrayMesh(nodes[:, 1:4], faces, z_offsets, omit)
+
         return mesh
+
+    @staticmethod
+    def omit_flags(z, boundary, negative_down):
+        """ Omit flag of every vertex from its depth and a boolean boundary mask. """
+
+        if negative_down:
+            land = z > 0
+        else:
+            land = z < 0
+        omit = numpy.zeros(len(z), dtype=numpy.int8)  # Non-boundary and non-land, eligible for simplification
+        omit[land] = 3  # Only land point
+        omit[boundary] = 2  # Only boundary point
+        omit[boundary & land] = 1  # Boundary point and land point
+
+        return omit
@@ -1,98 +1,440 @@
-from mesh_simplification.utilities import triangulate_polygon, interpolate, calculate_aspect
-from shapely.geometry import Polygon, Point
+import heapq
+import time
+import numpy
 
+from mesh_simplification import instrumentation
+from mesh_simplification.mesh import signed_area
+from mesh_simplification.utilities import triangulate_ring, interpolate, triangle_aspects, batch_max_deviation, \
+    largest_triangle_area
+from mesh_simplification.logger import log
 
-def vertex_removal(mesh, target_vertex_handle, point_tree, max_triangle_area, aspect_constraint):
-    """ Deletes candidate vertices and re-triangulates the resulting hole. """
 
-    # Handles of vertices surrounding target vertex
-    target_vertex_vv_handles = [i for i in list(mesh.vv(target_vertex_handle)) if i is not target_vertex_handle]
-    z_offset = mesh.vertex_property('z_offset', target_vertex_handle)
+def vertex_removal(mesh, target_vertex_handle, point_tree, max_triangle_area, aspect_constraint, reference=False,
+                   operator='remove', cache=False):
+    """ Deletes candidate vertices and re-triangulates the resulting hole. Returns True if the vertex was removed.
 
-    # Handles of faces surrounding target vertex
-    target_vertex_vf_handles = [i for i in list(mesh.vf(target_vertex_handle))]
+    The z-offset test runs on all points in the hole at once; reference=True uses the original per-point shapely
+    loop instead, which is kept to confirm both paths give the same result. operator='collapse' merges the vertex
+    into a neighbour instead, see collapse_removal(). cache is passed on to hole_triangulation(). """
 
-    # Calculate the aspect of each triangle surrounding the target vertex
-    aspect_constraint_test = True
-    if aspect_constraint:
-        aspects_before = list()
-        for face_handle in target_vertex_vf_handles:
-            fv = mesh.fv(face_handle)
-            point_list = [mesh.point(vh) for vh in fv]
-            tri_poly = Polygon(point_list)
-            aspect = calculate_aspect(tri_poly)
-            aspects_before.append(aspect)
-        if len(set(aspects_before)) > 1:
-            aspect_constraint_test = False
-
-    # Conversion of handles to x,y for triangulation
-    target_vertex_vv_xy = [[mesh.point(vh)[0], mesh.point(vh)[1]] for vh in target_vertex_vv_handles]
+    # Indices of vertices surrounding target vertex, in counter-clockwise order
+    target_vertex_vv_handles = mesh.vv(target_vertex_handle)
 
-    # Generate a triangulation of the potential hole created from vertex removal
-    hole_polygon = Polygon(target_vertex_vv_xy)
-    triangulation_of_hole = triangulate_polygon(hole_polygon)
+    # A hole needs at least three vertices to be re-triangulated
+    if len(target_vertex_vv_handles) < 3:
+        instrumentation.reject('ring')
+        return False
+
+    if operator == 'collapse':
+        return collapse_removal(mesh, target_vertex_handle, target_vertex_vv_handles, point_tree, max_triangle_area,
+                                aspect_constraint, reference)
+
+    ring_xyz, ring_faces_xyz, z_offset, soundings = gather_candidate(mesh, target_vertex_handle,
+                                                                     target_vertex_vv_handles)
+    triangles = hole_triangulation(mesh, target_vertex_handle, target_vertex_vv_handles, cache)
+    triangles, deviation, owner = test_removal(ring_xyz, ring_faces_xyz, z_offset, point_tree, max_triangle_area,
+                                               aspect_constraint, reference, triangles,
+                                               cached_aspects(mesh, target_vertex_handle, aspect_constraint),
+                                               soundings)
+
+    # If the vertex can be removed, delete it and fill resulting hole with triangles
+    if triangles is None:
+        return False
+    apply_removal(mesh, target_vertex_handle, target_vertex_vv_handles, triangles, deviation, soundings, owner)
+    instrumentation.count('removals')
+    return True
+
+
+def gather_candidate(mesh, target_vertex_handle, target_vertex_vv_handles):
+    """ Copies the one-ring of a candidate vertex out of the mesh: ring vertex coordinates, coordinates of the faces
+    around the vertex, its z-offset and the indices of the soundings owned by those faces (None if the mesh does not
+    track sounding ownership, see ArrayMesh.assign_soundings()). """
+
+    start = time.perf_counter()
+    ring_faces = mesh.vf(target_vertex_handle)
+    ring_xyz = mesh.points[target_vertex_vv_handles]
+    ring_faces_xyz = mesh.points[mesh.face_vertices[ring_faces]]
+    z_offset = float(mesh.z_offset[target_vertex_handle])
+    soundings = mesh.face_soundings(ring_faces) if mesh.face_sounding is not None else None
+    instrumentation.add_time('gather', start)
+
+    return ring_xyz, ring_faces_xyz, z_offset, soundings
+
+
+def cached_aspects(mesh, target_vertex_handle, aspect_constraint):
+    """ Cached compass aspects of the faces around a candidate vertex, None if the aspect constraint is off. """
 
-    # Vertices and triangles of retriangulation
-    vertices, triangles = triangulation_of_hole['vertices'], triangulation_of_hole['triangles']
+    if not aspect_constraint:
+        return None
+    return mesh.face_aspects(mesh.vf(target_vertex_handle))
 
-    # Look-up dictionary for x,y to vertex handle
-    v_handle_lookup = dict()
-    for v in vertices:
-        index = target_vertex_vv_xy.index([v[0], v[1]])
-        v_handle_lookup[index] = target_vertex_vv_handles[index]
+
+def hole_triangulation(mesh, target_vertex_handle, target_vertex_vv_handles, cache=True):
+    """ Re-triangulation of the hole left by a candidate vertex as (T, 3) indices into its one-ring.
+
+    With cache=True, results are kept per candidate and reused for as long as its one-ring stays the same, so a
+    rejected candidate is not re-triangulated on every pass. Removals drop the entries of the removed vertex and of
+    its neighbours. Only the drivers that test an unchanged one-ring again cache: pass mode over its repeated passes
+    and cost mode when it removes a costed vertex. The queue and independent modes only test a vertex again after
+    its one-ring changed. """
+
+    ring_key = tuple(target_vertex_vv_handles) if cache else None
+    cached = mesh.hole_cache.get(target_vertex_handle) if cache else None
+    if cached is not None and cached[0] == ring_key:
+        instrumentation.count('triangulation_cache_hits')
+        return cached[1]
+
+    start = time.perf_counter()
+    triangles = triangulate_ring(mesh.points[target_vertex_vv_handles, :2])
+    instrumentation.add_time('triangulation', start)
+    if cache:
+        mesh.hole_cache[target_vertex_handle] = (ring_key, triangles)
+    return triangles
+
+
+def test_removal(ring_xyz, ring_faces_xyz, z_offset, point_tree, max_triangle_area, aspect_constraint,
+                 reference=False, triangles=None, aspects_before=None, soundings=None):
+    """ Runs the aspect, area and z-offset tests for removing a vertex from its one-ring arrays alone, without
+    touching the mesh. triangles can pass in an already computed re-triangulation, aspects_before the cached
+    compass aspects of the faces around the vertex (see ArrayMesh.face_aspects()) and soundings the indices of the
+    point_tree points in the hole, which are otherwise queried from point_tree.
+
+    Returns the re-triangulation of the hole as (T, 3) indices into the ring, the largest vertical deviation the
+    removal causes at the soundings in the hole and the index of the new triangle containing each of them; None,
+    infinite and None if the vertex has to stay. """
+
+    # Aspect of each triangle surrounding the target vertex, they all have to face the same compass direction
+    start = time.perf_counter()
+    if aspect_constraint:
+        if aspects_before is None:
+            aspects_before = triangle_aspects(ring_faces_xyz)
+        start = instrumentation.add_time('aspect', start)
+        if (aspects_before != aspects_before[0]).any():
+            instrumentation.reject('aspect_before')
+            return None, numpy.inf, None
+
+    # Generate a triangulation of the potential hole created from vertex removal
+    if triangles is None:
+        triangles = triangulate_ring(ring_xyz[:, :2])
+        start = instrumentation.add_time('triangulation', start)
+    triangles_xyz = ring_xyz[triangles]
 
     # Compare aspects before and after re-triangulation of hole
-    if aspect_constraint and aspect_constraint_test:
-        aspects_after = list()
-        for tri in triangles:
-            p1, p2, p3 = tri[0], tri[1], tri[2]
-            vertex_list = [v_handle_lookup[p1], v_handle_lookup[p2], v_handle_lookup[p3]]
-            point_list = [mesh.point(vh) for vh in vertex_list]
-            tri_poly = Polygon(point_list)
-            aspect = calculate_aspect(tri_poly)
-            aspects_after.append(aspect)
-        if set(aspects_before) != set(aspects_after):
-            aspect_constraint_test = False
-
-    triangle_area_test = True
+    if aspect_constraint:
+        aspects_after = triangle_aspects(triangles_xyz)
+        start = instrumentation.add_time('aspect', start)
+        if (aspects_after != aspects_before[0]).any():
+            instrumentation.reject('aspect_after')
+            return None, numpy.inf, None
+
     if max_triangle_area > 0:
-        triangle_areas = list()
-        for tri in triangles:
-            p1, p2, p3 = tri[0], tri[1], tri[2]
-            vertex_list = [v_handle_lookup[p1], v_handle_lookup[p2], v_handle_lookup[p3]]
-            point_list = [mesh.point(vh) for vh in vertex_list]
-            tri_poly = Polygon(point_list)
-            triangle_areas.append(tri_poly.area)
-        max_triangle = max(triangle_areas)
+        max_triangle = largest_triangle_area(triangles_xyz)
+        start = instrumentation.add_time('area', start)
         if max_triangle > max_triangle_area:
-            triangle_area_test = False
-
-    if aspect_constraint_test and triangle_area_test:
-        all_points_in_hole_idx = point_tree.query(hole_polygon, 'intersects')
-        all_points_in_hole_geoms = point_tree.geometries.take(all_points_in_hole_idx).tolist()
-
-        # Interpolate the z-value at the location of the vertex if the vertex is removed
-        interpolation_test = False
-        for i in range(len(all_points_in_hole_idx)):
-            point = all_points_in_hole_geoms[i]
-            point_xyz = [point.x, point.y, point.z]
-
-            for tri in triangles:
-                vh1, vh2, vh3 = v_handle_lookup[tri[0]], v_handle_lookup[tri[1]], v_handle_lookup[tri[2]]
-                triangle_shape = Polygon([Point(mesh.point(vh1)), Point(mesh.point(vh2)), Point(mesh.point(vh3))])
-
-                if point.intersects(triangle_shape):
-                    interpolation_test = interpolate(triangle_shape, point_xyz, z_offset)
-                    break
-            if interpolation_test is False:
-                break
+            instrumentation.reject('area')
+            return None, numpy.inf, None
+
+    # Interpolate the z-value at the location of the vertex if the vertex is removed
+    if soundings is None:
+        soundings = point_tree.query_polygon(ring_xyz[:, :2])
+        start = instrumentation.add_time('point_query', start)
+    points_xyz = point_tree.points[soundings]
+    if reference:
+        interpolation_test = reference_z_offset_test(triangles_xyz, points_xyz, z_offset)
+        deviation, owner = batch_max_deviation(triangles_xyz, points_xyz, True) if interpolation_test else \
+            (numpy.inf, None)
+    else:
+        deviation, owner = batch_max_deviation(triangles_xyz, points_xyz, True)
+        interpolation_test = deviation <= z_offset
+    instrumentation.add_time('z_offset', start)
+
+    if interpolation_test:
+        return triangles, deviation, owner
+    instrumentation.reject('z_offset')
+    return None, numpy.inf, None
+
+
+def collapse_removal(mesh, target_vertex_handle, target_vertex_vv_handles, point_tree, max_triangle_area,
+                     aspect_constraint, reference=False):
+    """ Removes a vertex by collapsing it into one of its neighbours, trying the neighbours closest in depth first.
+    Collapsing into ring vertex u leaves the fan of triangles from u over the one-ring, which is tested like any
+    other re-triangulation, so no triangulator is called. The collapse must also keep the mesh valid: no fan
+    triangle may flip or degenerate, and u and the vertex may only share the two ring vertices next to u (link
+    condition), otherwise the collapse would create a duplicate edge. Returns True if the vertex was removed. """
+
+    # Border vertices have an open one-ring and no fan that covers their faces
+    num_ring = len(target_vertex_vv_handles)
+    if len(mesh.vf(target_vertex_handle)) != num_ring:
+        instrumentation.reject('border')
+        return False
+
+    ring_xyz, ring_faces_xyz, z_offset, soundings = gather_candidate(mesh, target_vertex_handle,
+                                                                     target_vertex_vv_handles)
+    aspects_before = cached_aspects(mesh, target_vertex_handle, aspect_constraint)
+    ring_set = set(target_vertex_vv_handles)
+    offsets = numpy.arange(1, num_ring - 1)
+    depth_difference = numpy.abs(ring_xyz[:, 2] - mesh.points[target_vertex_handle, 2])
+    for i in numpy.argsort(depth_difference, kind='stable').tolist():
+        triangles = numpy.stack([numpy.full(num_ring - 2, i), (i + offsets) % num_ring,
+                                 (i + offsets + 1) % num_ring], axis=1)
+        triangles_xyz = ring_xyz[triangles]
+        if (signed_area(triangles_xyz[:, 0], triangles_xyz[:, 1], triangles_xyz[:, 2]) <= 0).any():
+            instrumentation.reject('flip')
+            continue
+
+        target = target_vertex_vv_handles[i]
+        shared = ring_set.intersection(mesh.vv(target))
+        if shared != {target_vertex_vv_handles[i - 1], target_vertex_vv_handles[(i + 1) % num_ring]}:
+            instrumentation.reject('link_condition')
+            continue
+
+        triangles, deviation, owner = test_removal(ring_xyz, ring_faces_xyz, z_offset, point_tree,
+                                                   max_triangle_area, aspect_constraint, reference, triangles,
+                                                   aspects_before, soundings)
+        if triangles is None:
+            continue
+
+        mesh.hole_cache.pop(target_vertex_handle, None)
+        for vertex_handle in target_vertex_vv_handles:
+            mesh.hole_cache.pop(vertex_handle, None)
+        if mesh.operation_log is not None:
+            # The faces left around target are the fan triangles
+            mesh.operation_log.record(mesh, target_vertex_handle, target_vertex_vv_handles, triangles, deviation)
+        start = time.perf_counter()
+        ring_faces = mesh.vf(target_vertex_handle)
+        mesh.collapse_vertex(target_vertex_handle, target)
+        if soundings is not None:
+            # The faces kept around target are the fan and own every sounding of the old one-ring
+            mesh.reassign_soundings(soundings, [face for face in ring_faces if mesh.face_alive[face]])
+        instrumentation.add_time('collapse', start)
+        instrumentation.count('removals')
+        return True
+
+    return False
+
+
+def apply_removal(mesh, target_vertex_handle, target_vertex_vv_handles, triangles, deviation=numpy.nan,
+                  soundings=None, owner=None):
+    """ Deletes a vertex and fills the hole with triangles given as indices into its one-ring. deviation is the
+    largest vertical deviation at the soundings in the hole (see test_removal()), recorded in the mesh's operation
+    log if it has one. If the mesh tracks sounding ownership, the soundings of the hole are handed over to the new
+    triangles; soundings and owner can pass in the ones gathered and located by the removal test. """
+
+    # The one-rings of the removed vertex's neighbours change, so do their hole triangulations
+    mesh.hole_cache.pop(target_vertex_handle, None)
+    for vertex_handle in target_vertex_vv_handles:
+        mesh.hole_cache.pop(vertex_handle, None)
+    if mesh.operation_log is not None:
+        mesh.operation_log.record(mesh, target_vertex_handle, target_vertex_vv_handles, triangles, deviation)
+
+    start = time.perf_counter()
+    if mesh.face_sounding is not None and soundings is None:
+        soundings, owner = mesh.face_soundings(mesh.vf(target_vertex_handle)), None
+    mesh.delete_vertex(target_vertex_handle)
+    faces = [mesh.add_face(target_vertex_vv_handles[p1], target_vertex_vv_handles[p2], target_vertex_vv_handles[p3])
+             for p1, p2, p3 in triangles.tolist()]
+    if mesh.face_sounding is not None:
+        mesh.reassign_soundings(soundings, faces, owner)
+    instrumentation.add_time('delete_add_face', start)
+
+
+def removal_candidates(mesh):
+    """ Vertices eligible for removal sorted by depth, and the number of omitted vertices.
 
-        # If the vertex can be removed, delete it and fill resulting hole with triangles
-        if interpolation_test:
-            mesh.delete_vertex(target_vertex_handle, False)
-            for tri in triangles:
-                p1, p2, p3 = tri[0], tri[1], tri[2]
-                vertex_list = [v_handle_lookup[p1], v_handle_lookup[p2], v_handle_lookup[p3]]
-                mesh.add_face(vertex_list)
+    Land and boundary nodes are skipped, as are nodes shallower than their own z-offset. """
+
+    start = time.perf_counter()
+    vertex_handles = mesh.vertices()
+    eligible = (mesh.omit[vertex_handles] == 0) & \
+               (mesh.z_offset[vertex_handles] <= mesh.points[vertex_handles, 2])
+    candidates = vertex_handles[eligible]
+    candidates = candidates[numpy.argsort(mesh.points[candidates, 2], kind='stable')]
+    instrumentation.add_time('sort', start)
+    instrumentation.count('candidates', len(candidates))
+
+    return candidates, int(len(vertex_handles) - len(candidates))
+
+
+def simplify_pass(mesh, point_tree, max_triangle_area, aspect_constraint, reference=False, on_removal=None,
+                  operator='remove'):
+    """ Tries to remove every eligible vertex once, shallowest first. Returns the number of omitted vertices.
+
+    on_removal, if given, is called with the mesh after every removal. operator is passed on to vertex_removal(). """
+
+    candidates, ignore_count = removal_candidates(mesh)
+    for vertex_handle in candidates.tolist():
+        if vertex_removal(mesh, vertex_handle, point_tree, max_triangle_area, aspect_constraint, reference,
+                          operator, cache=True) and on_removal is not None:
+            on_removal(mesh)
+
+    return ignore_count
+
+
+def simplify_queue(mesh, point_tree, max_triangle_area, aspect_constraint, reference=False, seeds=None,
+                   on_removal=None, operator='remove'):
+    """ Removes vertices from a depth-ordered priority queue. Returns the number of omitted vertices.
+
+    The outcome of a removal test only depends on the one-ring of the candidate, so after a successful removal only
+    the one-ring neighbours of the removed vertex are queued again, for the next round. Each round is a pass over
+    the queued vertices only, shallowest first, so a single call reaches the same mesh as repeating simplify_pass()
+    until nothing changes. If seeds is given, only those vertices are queued at first. on_removal, if given, is
+    called with the mesh after every removal, operator is passed on to vertex_removal(). """
+
+    candidates, ignore_count = removal_candidates(mesh)
+    eligible = numpy.zeros(len(mesh.points), dtype=bool)
+    eligible[candidates] = True
+    queued = numpy.zeros(len(mesh.points), dtype=bool)
+    if seeds is not None:
+        candidates = candidates[numpy.isin(candidates, seeds)]
+
+    heap = list(zip(mesh.points[candidates, 2].tolist(), candidates.tolist()))
+    heapq.heapify(heap)
+    while heap:
+        next_round = list()
+        while heap:
+            depth, vertex_handle = heapq.heappop(heap)
+            if not mesh.vertex_alive[vertex_handle]:
+                continue
+
+            ring = mesh.vv(vertex_handle)
+            if vertex_removal(mesh, vertex_handle, point_tree, max_triangle_area, aspect_constraint, reference,
+                              operator):
+                if on_removal is not None:
+                    on_removal(mesh)
+                for neighbour in ring:
+                    if eligible[neighbour] and not queued[neighbour]:
+                        queued[neighbour] = True
+                        next_round.append((float(mesh.points[neighbour, 2]), neighbour))
+
+        queued[[vertex_handle for depth, vertex_handle in next_round]] = False
+        heap = next_round
+        heapq.heapify(heap)
+
+    return ignore_count
+
+
+def simplify_cost(mesh, point_tree, max_triangle_area, aspect_constraint, reference=False, target_vertices=None,
+                  time_budget=None, on_removal=None):
+    """ Removes vertices cheapest first. The cost of a removal is the largest vertical deviation it causes at the
+    soundings in the hole; vertices failing any test have no cost and are not queued. After a removal the one-ring
+    neighbours of the removed vertex are re-costed, older heap entries of a vertex are skipped by version number.
+
+    Stops when the heap is empty, the mesh is down to target_vertices or time_budget seconds have passed, whichever
+    comes first. Returns the number of omitted vertices. """
+
+    start = time.perf_counter()
+    candidates, ignore_count = removal_candidates(mesh)
+    eligible = numpy.zeros(len(mesh.points), dtype=bool)
+    eligible[candidates] = True
+    version = numpy.zeros(len(mesh.points), dtype=numpy.int64)
+
+    def cost_entry(vertex_handle):
+        ring = mesh.vv(vertex_handle)
+        if len(ring) < 3:
+            instrumentation.reject('ring')
+            return None
+        ring_xyz, ring_faces_xyz, z_offset, soundings = gather_candidate(mesh, vertex_handle, ring)
+        triangles, deviation, owner = test_removal(ring_xyz, ring_faces_xyz, z_offset, point_tree, max_triangle_area,
+                                                   aspect_constraint, reference,
+                                                   hole_triangulation(mesh, vertex_handle, ring),
+                                                   cached_aspects(mesh, vertex_handle, aspect_constraint), soundings)
+        if triangles is None:
+            return None
+        # Ties are broken by depth as in the other modes
+        return deviation, float(mesh.points[vertex_handle, 2]), int(vertex_handle), int(version[vertex_handle])
+
+    heap = [entry for entry in map(cost_entry, candidates.tolist()) if entry is not None]
+    heapq.heapify(heap)
+    log.info('\t\t-Removable Candidates: ' + str(len(heap)))
+
+    stop_reason = 'no removable vertices left'
+    while heap:
+        if target_vertices is not None and mesh.n_vertices() <= target_vertices:
+            stop_reason = 'target vertex count reached'
+            break
+        if time_budget is not None and time.perf_counter() - start >= time_budget:
+            stop_reason = 'time budget used'
+            break
+
+        deviation, depth, vertex_handle, entry_version = heapq.heappop(heap)
+        if entry_version != version[vertex_handle] or not mesh.vertex_alive[vertex_handle]:
+            continue
+
+        # The one-ring is unchanged since the entry was made, so its cached triangulation passed every test
+        ring = mesh.vv(vertex_handle)
+        apply_removal(mesh, vertex_handle, ring, hole_triangulation(mesh, vertex_handle, ring), deviation)
+        instrumentation.count('removals')
+        if on_removal is not None:
+            on_removal(mesh)
+
+        for neighbour in ring:
+            if eligible[neighbour]:
+                version[neighbour] += 1
+                entry = cost_entry(neighbour)
+                if entry is not None:
+                    heapq.heappush(heap, entry)
+
+    log.info('\t\t-Cost Mode Stopped: ' + stop_reason)
+    mesh.hole_cache.clear()
+    return ignore_count
+
+
+def simplify_iteration(mesh, point_tree, max_triangle_area, aspect_constraint, mode='pass', reference=False,
+                       operator='remove', tiles=1, workers=None, target_vertices=None, time_budget=None,
+                       on_removal=None):
+    """ One iteration of the simplification loop of the command line tool, the API, sweeps and benchmarks: runs the
+    driver of the given mode (or the tiled driver if tiles > 1) once and garbage-collects the mesh. Pass mode is
+    repeated until a pass removes nothing, the other modes and tiles reach that point in a single iteration.
+
+    Returns the simplified mesh (a new one with tiles), the number of omitted vertices and whether the loop is done.
+    Exceptions raised by on_removal leave the mesh without garbage collection. """
+
+    from mesh_simplification.parallel import simplify_tiled, simplify_independent
+
+    vertex_count = mesh.n_vertices()
+    start = time.perf_counter()
+    if tiles > 1:
+        mesh, ignore_count = simplify_tiled(mesh, point_tree, max_triangle_area, aspect_constraint, tiles, workers,
+                                            reference, on_removal)
+    elif mode == 'independent':
+        ignore_count = simplify_independent(mesh, point_tree, max_triangle_area, aspect_constraint, workers,
+                                            reference, on_removal)
+    elif mode == 'cost':
+        ignore_count = simplify_cost(mesh, point_tree, max_triangle_area, aspect_constraint, reference,
+                                     target_vertices, time_budget, on_removal)
+    elif mode == 'queue':
+        ignore_count = simplify_queue(mesh, point_tree, max_triangle_area, aspect_constraint, reference,
+                                      on_removal=on_removal, operator=operator)
+    else:
+        ignore_count = simplify_pass(mesh, point_tree, max_triangle_area, aspect_constraint, reference, on_removal,
+                                     operator)
+    instrumentation.add_time('simplify', start)
+
+    # Garbage collection removes deleted elements from memory
+    with instrumentation.timed('garbage_collection'):
+        mesh.garbage_collection()
+
+    done = mode != 'pass' or tiles > 1 or mesh.n_vertices() == vertex_count
+    return mesh, ignore_count, done
+
+
+def reference_z_offset_test(triangles_xyz, points_xyz, z_offset):
+    """ Per-point shapely implementation of the z-offset test, kept as a reference for the batched test. """
+
+    from shapely.geometry import Polygon, Point
+
+    all_points_in_hole_geoms = [Point(p) for p in points_xyz]
+    triangle_shapes = [Polygon([Point(p) for p in tri_xyz]) for tri_xyz in triangles_xyz]
+
+    interpolation_test = False
+    for point in all_points_in_hole_geoms:
+        point_xyz = [point.x, point.y, point.z]
+
+        for triangle_shape in triangle_shapes:
+            if point.intersects(triangle_shape):
+                interpolation_test = interpolate(triangle_shape, point_xyz, z_offset)
+                break
+        if interpolation_test is False:
+            break
 
-    return
+    return interpolation_test
@@ -0,0 +1,175 @@
+import os
+import numpy
+
+from mesh_simplification.logger import log
+
+
+class GridIndex(object):
+    """ Uniform grid over the x,y locations of a fixed set of points, built once and queried by bbox or polygon.
+
+    Points are bucketed by grid cell and stored cell by cell (CSR layout): order holds the point indices sorted by
+    cell and cell_start the offset of each cell in order. Cells are numbered row by row, so the cells a bbox covers
+    in one grid row are a single contiguous slice. Queries return indices into the original point array. """
+
+    def __init__(self, points, order, cell_start, origin, cell_size, shape):
+        self.points = numpy.ascontiguousarray(points, dtype=numpy.float64)
+        self.order = order
+        self.cell_start = cell_start
+        self.origin = origin
+        self.cell_size = float(cell_size)
+        self.shape = shape
+        self.sorted_xy = self.points[order, :2]
+
+    @staticmethod
+    def build(points, points_per_cell=4):
+        points = numpy.asarray(points, dtype=numpy.float64)
+        xy = points[:, :2]
+        origin = xy.min(axis=0) if len(xy) else numpy.zeros(2)
+        extent = (xy.max(axis=0) - origin) if len(xy) else numpy.ones(2)
+
+        # Square cells holding points_per_cell points on average
+        area = max(float(extent[0]) * float(extent[1]), 1e-12)
+        cell_size = max(numpy.sqrt(area * points_per_cell / max(len(xy), 1)), 1e-9)
+        shape = (int(extent[1] // cell_size) + 1, int(extent[0] // cell_size) + 1)  # rows, columns
+
+        cell = GridIndex._cells(xy, origin, cell_size, shape)
+        order = numpy.argsort(cell, kind='stable').astype(numpy.int64)
+        cell_start = numpy.zeros(shape[0] * shape[1] + 1, dtype=numpy.int64)
+        cell_start[1:] = numpy.cumsum(numpy.bincount(cell, minlength=shape[0] * shape[1]))
+
+        return GridIndex(points, order, cell_start, origin, cell_size, shape)
+
+    @staticmethod
+    def _cells(xy, origin, cell_size, shape):
+        column = numpy.clip(((xy[:, 0] - origin[0]) // cell_size).astype(numpy.int64), 0, shape[1] - 1)
+        row = numpy.clip(((xy[:, 1] - origin[1]) // cell_size).astype(numpy.int64), 0, shape[0] - 1)
+        return row * shape[1] + column
+
+    def _range(self, value, axis):
+        limit = self.shape[1] if axis == 0 else self.shape[0]
+        cell = int((value - self.origin[axis]) // self.cell_size)
+        return min(max(cell, 0), limit - 1)
+
+    def _ranges(self, values, axis):
+        """ _range() of an array of values. """
+
+        limit = self.shape[1] if axis == 0 else self.shape[0]
+        cells = ((values - self.origin[axis]) // self.cell_size).astype(numpy.int64)
+        return numpy.clip(cells, 0, limit - 1)
+
+    def query_bbox(self, xmin, ymin, xmax, ymax):
+        """ Indices of the points inside or on the border of a bbox. """
+
+        column0, column1 = self._range(xmin, 0), self._range(xmax, 0)
+        row0, row1 = self._range(ymin, 1), self._range(ymax, 1)
+        slices = [(self.cell_start[row * self.shape[1] + column0], self.cell_start[row * self.shape[1] + column1 + 1])
+                  for row in range(row0, row1 + 1)]
+        if not slices:
+            return numpy.zeros(0, dtype=numpy.int64)
+        positions = numpy.concatenate([numpy.arange(start, end) for start, end in slices])
+
+        xy = self.sorted_xy[positions]
+        inside = (xy[:, 0] >= xmin) & (xy[:, 0] <= xmax) & (xy[:, 1] >= ymin) & (xy[:, 1] <= ymax)
+        return self.order[positions[inside]]
+
+    def query_bboxes(self, bboxes):
+        """ query_bbox() of every row of an (M, 4) array of xmin, ymin, xmax, ymax, answered together: the cell
+        ranges of all bboxes are computed at once, their slices of order gathered in one pass and all gathered points
+        tested against their bbox in a single mask.
+
+        Returns the point indices of all bboxes one after the other, each in the order query_bbox() gives, and the
+        (M + 1,) offsets of every bbox in them (CSR layout, like the index itself). """
+
+        bboxes = numpy.asarray(bboxes, dtype=numpy.float64).reshape(-1, 4)
+        column0, column1 = self._ranges(bboxes[:, 0], 0), self._ranges(bboxes[:, 2], 0)
+        row0, row1 = self._ranges(bboxes[:, 1], 1), self._ranges(bboxes[:, 3], 1)
+
+        # One slice of order per bbox and grid row it covers
+        num_rows = numpy.maximum(row1 - row0 + 1, 0)
+        bbox_of_slice = numpy.repeat(numpy.arange(len(bboxes)), num_rows)
+        row = row0[bbox_of_slice] + numpy.arange(len(bbox_of_slice)) - numpy.repeat(numpy.cumsum(num_rows) - num_rows,
+                                                                                       num_rows)
+        starts = self.cell_start[row * self.shape[1] + column0[bbox_of_slice]]
+        ends = self.cell_start[row * self.shape[1] + column1[bbox_of_slice] + 1]
+
+        # Positions in order of the points of all slices
+        lengths = numpy.maximum(ends - starts, 0)
+        bbox_of_position = numpy.repeat(bbox_of_slice, lengths)
+        positions = numpy.repeat(starts - (numpy.cumsum(lengths) - lengths), lengths) + numpy.arange(lengths.sum())
+
+        xy, bbox = self.sorted_xy[positions], bboxes[bbox_of_position]
+        inside = (xy[:, 0] >= bbox[:, 0]) & (xy[:, 0] <= bbox[:, 2]) & (xy[:, 1] >= bbox[:, 1]) & \
+                 (xy[:, 1] <= bbox[:, 3])
+        offsets = numpy.zeros(len(bboxes) + 1, dtype=numpy.int64)
+        offsets[1:] = numpy.cumsum(numpy.bincount(bbox_of_position[inside], minlength=len(bboxes)))
+        return self.order[positions[inside]], offsets
+
+    def query_polygon(self, ring_xy):
+        """ Indices of the points inside or on the border of a simple polygon given by its (K, 2) vertices, which
+        matches shapely's 'intersects' predicate for points. """
+
+        ring_xy = numpy.asarray(ring_xy, dtype=numpy.float64)
+        xmin, ymin = ring_xy.min(axis=0)
+        xmax, ymax = ring_xy.max(axis=0)
+        candidates = self.query_bbox(xmin, ymin, xmax, ymax)
+        if len(candidates) == 0:
+            return candidates
+
+        inside = points_in_polygon(self.points[candidates, :2], ring_xy)
+        return candidates[inside]
+
+    def save(self, url_out, source_stamp=''):
+        numpy.savez(url_out, order=self.order, cell_start=self.cell_start, origin=self.origin,
+                    cell_size=self.cell_size, shape=numpy.array(self.shape), num_points=len(self.points),
+                    source_stamp=source_stamp)
+
+    @staticmethod
+    def load(url_in, points, source_stamp=''):
+        """ Loads an index saved by save() for the same points, returns None if it does not match them. """
+
+        with numpy.load(url_in) as data:
+            if int(data['num_points']) != len(points) or str(data['source_stamp']) != source_stamp:
+                return None
+            return GridIndex(points, data['order'], data['cell_start'], data['origin'], float(data['cell_size']),
+                             tuple(int(v) for v in data['shape']))
+
+    @staticmethod
+    def build_cached(points, source_url, negative_down=False):
+        """ Loads the index stored next to source_url, building and storing it if it is missing or stale. """
+
+        cache_url = source_url + '.index.npz'
+        stat = os.stat(source_url)
+        source_stamp = '{} {} {}'.format(stat.st_size, stat.st_mtime_ns, negative_down)
+        if os.path.exists(cache_url):
+            index = GridIndex.load(cache_url, points, source_stamp)
+            if index is not None:
+                log.info('-Loaded Sounding Index: ' + cache_url)
+                return index
+
+        index = GridIndex.build(points)
+        index.save(cache_url, source_stamp)
+        log.info('-Saved Sounding Index: ' + cache_url)
+        return index
+
+
+def points_in_polygon(xy, ring_xy, tolerance=1e-12):
+    """ Mask of the (N, 2) locations inside or on the border of the polygon ring (K, 2), using even-odd crossings. """
+
+    x, y = xy[:, 0, numpy.newaxis], xy[:, 1, numpy.newaxis]
+    x1, y1 = ring_xy[:, 0], ring_xy[:, 1]
+    x2, y2 = numpy.roll(x1, -1), numpy.roll(y1, -1)
+
+    # Crossings of a ray towards +x with each edge
+    straddles = (y1 > y) != (y2 > y)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        x_cross = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+    inside = numpy.count_nonzero(straddles & (x < x_cross), axis=1) % 2 == 1
+
+    # Locations on an edge count as intersecting
+    cross = (x2 - x1) * (y - y1) - (y2 - y1) * (x - x1)
+    scale = tolerance * ((x2 - x1) ** 2 + (y2 - y1) ** 2)
+    between = ((x - x1) * (x - x2) <= 0) & ((y - y1) * (y - y2) <= 0)
+    on_edge = ((numpy.abs(cross) <= scale) & between).any(axis=1)
+
+    return inside | on_edge
+
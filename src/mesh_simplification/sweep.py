@@ -0,0 +1,241 @@
+import csv
+import sys
+import time
+import getopt
+import itertools
+import numpy
+
+from mesh_simplification.reader import Reader
+from mesh_simplification.writer import Writer
+from mesh_simplification.mesh import ArrayMesh
+from mesh_simplification.simplification import simplify_iteration
+from mesh_simplification.spatial_index import GridIndex
+from mesh_simplification.utilities import validate_mesh
+from mesh_simplification.logger import log, configure_logging
+
+USAGE = ' -i <inputfile> -b <boundary_points> -n <negative_down> -z <z_offset,z_offset,...> \
+-t <max_triangle_area,max_triangle_area,...> -a <0,1> -o <summary_file> --mode <pass|queue> \
+--workers <num_workers> --write <write_meshes>'
+LONG_OPTIONS = ['mode=', 'workers=', 'write']
+
+# Read-only arrays shared by all configurations, set once per worker process by init_sweep_worker()
+_worker_state = dict()
+
+
+def share_arrays(arrays):
+    """ Copies named arrays into shared memory blocks. Returns the blocks, which the caller has to close and unlink,
+    and the (name, shape, dtype) of every block for attach_arrays(). """
+
+    from multiprocessing import shared_memory
+
+    blocks, specs = list(), dict()
+    for key, array in arrays.items():
+        array = numpy.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        numpy.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        blocks.append(block)
+        specs[key] = (block.name, array.shape, array.dtype.str)
+
+    return blocks, specs
+
+
+def attach_arrays(specs):
+    """ Read-only views of the shared memory blocks made by share_arrays(), and the blocks keeping them open. """
+
+    from multiprocessing import shared_memory
+
+    blocks, arrays = list(), dict()
+    for key, (name, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=name)
+        array = numpy.ndarray(shape, dtype=numpy.dtype(dtype), buffer=block.buf)
+        array.flags.writeable = False
+        blocks.append(block)
+        arrays[key] = array
+
+    return blocks, arrays
+
+
+def init_sweep_worker(specs, index_grid, negative_down, mode, write_meshes):
+    blocks, arrays = attach_arrays(specs)
+    init_sweep_state(arrays, index_grid, negative_down, mode, write_meshes)
+    _worker_state['blocks'] = blocks
+
+
+def init_sweep_state(arrays, index_grid, negative_down, mode, write_meshes):
+    origin, cell_size, shape = index_grid
+    _worker_state['arrays'] = arrays
+    _worker_state['point_tree'] = GridIndex(arrays['input_points'], arrays['order'], arrays['cell_start'],
+                                            numpy.asarray(origin), cell_size, tuple(shape))
+    _worker_state['settings'] = (negative_down, mode, write_meshes)
+
+
+def run_configuration(configuration):
+    """ Simplifies a fresh copy of the input mesh with one z-offset, maximum triangle area and aspect setting, and
+    validates it against the original soundings. Returns one summary row. """
+
+    number, z_index, z_offset, max_triangle_area, aspect = configuration
+    arrays, point_tree = _worker_state['arrays'], _worker_state['point_tree']
+    negative_down, mode, write_meshes = _worker_state['settings']
+
+    input_uncertainty = arrays['z_offsets'][z_index]
+    mesh = ArrayMesh(arrays['points'].copy(), arrays['faces'], input_uncertainty.copy(), arrays['omit'].copy())
+    mesh.assign_soundings(point_tree.points)
+    vertices_before = mesh.n_vertices()
+
+    start = time.perf_counter()
+    iterations, done = 0, False
+    while not done:
+        iterations += 1
+        mesh, ignore_count, done = simplify_iteration(mesh, point_tree, max_triangle_area, aspect, mode)
+    simplify_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    errors, summary = validate_mesh(mesh, arrays['input_points'], input_uncertainty)
+    validate_seconds = time.perf_counter() - start
+
+    if write_meshes:
+        Writer.write_mesh_gr3(mesh, 'Sweep_Mesh_' + str(number))
+
+    return {'configuration': number,
+            'z_offset': z_offset,
+            'max_triangle_area': max_triangle_area,
+            'aspect': int(aspect),
+            'iterations': iterations,
+            'vertices': mesh.n_vertices(),
+            'faces': mesh.n_faces(),
+            'vertex_reduction': 100.0 * (vertices_before - mesh.n_vertices()) / max(vertices_before, 1),
+            'violations': summary['violations'],
+            'unlocated': summary['unlocated'],
+            'max_error': summary['max_error'],
+            'rms_error': summary['rms_error'],
+            'simplify_seconds': simplify_seconds,
+            'validate_seconds': validate_seconds}
+
+
+def write_summary(url_out, rows):
+    with open(url_out, 'w', newline='') as outfile:
+        writer = csv.DictWriter(outfile, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def sweep(input_file, boundary_idx_list, negative_down, z_offsets, max_triangle_areas, aspects, summary_url,
+          mode='pass', num_workers=None, write_meshes=False):
+    """ Simplifies one mesh with every combination of the given z-offsets, maximum triangle areas and aspect settings.
+
+    The mesh, boundary and z-offset files are read and the soundings indexed once. With more than one worker the
+    arrays are placed in shared memory and the configurations run in a process pool, each on its own copy of the
+    mesh. A summary row per configuration (element counts, vertical errors and timings) is written to summary_url
+    as soon as it is available. """
+
+    start = time.perf_counter()
+    boundary_points = None
+    if boundary_idx_list is not None:
+        log.info('-Reading Boundary Node Indices')
+        boundary_points = Reader.read_boundary_idx(boundary_idx_list)
+    log.info('-Reading Mesh')
+    mesh = Reader.read_gr3_mesh(input_file, z_offsets[0], boundary_points, negative_down)
+    input_points, input_uncertainty = Reader.read_mesh_vertices(mesh, negative_down)
+    z_offset_arrays = numpy.stack([Reader.read_z_offsets(z_offset, len(mesh.points)) for z_offset in z_offsets])
+
+    log.info('-Indexing Input Soundings')
+    point_tree = GridIndex.build(input_points)
+    log.info('\t-Read and Index Seconds: ' + str(time.perf_counter() - start))
+
+    arrays = {'points': mesh.points, 'faces': mesh.face_vertices[mesh.faces()], 'omit': mesh.omit,
+              'z_offsets': z_offset_arrays, 'input_points': input_points, 'order': point_tree.order,
+              'cell_start': point_tree.cell_start}
+    index_grid = (point_tree.origin.tolist(), point_tree.cell_size, point_tree.shape)
+    del mesh
+
+    configurations = [(number, z_index, z_offsets[z_index], max_triangle_area, aspect)
+                      for number, (z_index, max_triangle_area, aspect) in
+                      enumerate(itertools.product(range(len(z_offsets)), max_triangle_areas, aspects), 1)]
+    log.info('-Running ' + str(len(configurations)) + ' Configurations')
+
+    blocks, executor = list(), None
+    try:
+        if num_workers is None or num_workers > 1:
+            from concurrent.futures import ProcessPoolExecutor
+
+            blocks, specs = share_arrays(arrays)
+            del arrays
+            executor = ProcessPoolExecutor(max_workers=num_workers, initializer=init_sweep_worker,
+                                           initargs=(specs, index_grid, negative_down, mode, write_meshes))
+            results = executor.map(run_configuration, configurations)
+        else:
+            init_sweep_state(arrays, index_grid, negative_down, mode, write_meshes)
+            results = map(run_configuration, configurations)
+
+        rows = list()
+        for row in results:
+            log.info('\t-Configuration ' + str(row['configuration']) + ' (z-offset ' + str(row['z_offset']) +
+                     ', max area ' + str(row['max_triangle_area']) + ', aspect ' + str(row['aspect']) + '): ' +
+                     str(row['vertices']) + ' Vertices, ' + str(row['violations']) + ' Violations')
+            rows.append(row)
+            write_summary(summary_url, rows)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    log.info('-Summary Written: ' + summary_url)
+    return rows
+
+
+def main():
+    input_file, boundary_idx_list, negative_down = None, None, False
+    z_offsets, max_triangle_areas, aspects = None, [0.0], [False]
+    summary_url, mode, num_workers, write_meshes = 'Sweep_Summary.csv', 'pass', None, False
+    try:
+        options_list, remainder = getopt.getopt(sys.argv[1:], "hi:b:nz:t:a:o:", LONG_OPTIONS)
+    except getopt.GetoptError:
+        print(sys.argv[0], USAGE)
+        sys.exit(2)
+    for opt, arg in options_list:
+        if opt == '-h':
+            print(sys.argv[0], USAGE)
+            sys.exit()
+        elif opt == '--mode':
+            mode = str(arg)
+        elif opt == '--workers':
+            num_workers = int(arg)
+        elif opt == '--write':
+            write_meshes = True
+        elif opt in "-i":
+            input_file = str(arg)
+        elif opt in "-b":
+            boundary_idx_list = str(arg)
+        elif opt in "-n":
+            negative_down = True
+        elif opt in "-z":
+            z_offsets = [z_offset.strip() for z_offset in str(arg).split(',')]
+        elif opt in "-t":
+            max_triangle_areas = [float(area) for area in str(arg).split(',')]
+        elif opt in "-a":
+            aspects = [bool(int(aspect)) for aspect in str(arg).split(',')]
+        elif opt in "-o":
+            summary_url = str(arg)
+
+    if input_file is None or z_offsets is None:
+        print(sys.argv[0], USAGE)
+        sys.exit(2)
+
+    configure_logging()
+    if mode not in ('pass', 'queue'):
+        log.critical('Unknown Sweep Mode: ' + mode)
+        sys.exit()
+
+    log.info('-Input File: ' + input_file)
+    log.info('-Z-Offsets: ' + str(z_offsets))
+    log.info('-Maximum Triangle Areas: ' + str(max_triangle_areas))
+    log.info('-Aspect Constraint: ' + str(aspects))
+    log.info('-Simplification Mode: ' + mode)
+    sweep(input_file, boundary_idx_list, negative_down, z_offsets, max_triangle_areas, aspects, summary_url, mode,
+          num_workers, write_meshes)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,8 @@
-import triangle
 import numpy
 
-from shapely.strtree import STRtree
-from shapely.geometry import Polygon, Point
-from shapely.ops import orient
-from math import ceil
 from bisect import bisect_left
 
+from mesh_simplification import kernels
 from mesh_simplification.logger import log
 
 
@@ -29,7 +25,75 @@ def interpolate(triangle_poly, vertex_xyz, z_offset):
         return True
 
 
+def barycentric_weights(p1, p2, p3, xy):
+    """ Barycentric weights of x,y locations with respect to triangles p1,p2,p3; all inputs broadcast together. """
+
+    weight1_numer = ((p2[..., 1] - p3[..., 1]) * (xy[..., 0] - p3[..., 0])) + \
+                    ((p3[..., 0] - p2[..., 0]) * (xy[..., 1] - p3[..., 1]))
+    weight2_numer = ((p3[..., 1] - p1[..., 1]) * (xy[..., 0] - p3[..., 0])) + \
+                    ((p1[..., 0] - p3[..., 0]) * (xy[..., 1] - p3[..., 1]))
+    denom = ((p2[..., 1] - p3[..., 1]) * (p1[..., 0] - p3[..., 0])) + \
+            ((p3[..., 0] - p2[..., 0]) * (p1[..., 1] - p3[..., 1]))
+
+    # Degenerate (zero area) triangles produce non-finite weights and never contain a point
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        weight1 = weight1_numer / denom
+        weight2 = weight2_numer / denom
+    weight3 = 1 - weight1 - weight2
+
+    return weight1, weight2, weight3
+
+
+def batch_interpolate(triangles_xyz, points_xyz, tolerance=1e-9):
+    """ Locates every point in a set of triangles and interpolates its z-value in one pass.
+
+    triangles_xyz is shaped (T, 3, 3) and points_xyz (P, 3). Returns the interpolated z-values, the index of the
+    containing triangle and a mask of the points that were located in any triangle. """
+
+    p1 = triangles_xyz[numpy.newaxis, :, 0]
+    p2 = triangles_xyz[numpy.newaxis, :, 1]
+    p3 = triangles_xyz[numpy.newaxis, :, 2]
+    xy = points_xyz[:, numpy.newaxis, :2]
+    weight1, weight2, weight3 = barycentric_weights(p1, p2, p3, xy)
+
+    # Points on shared edges are contained by several triangles, pick the one containing them most
+    min_weight = numpy.minimum(numpy.minimum(weight1, weight2), weight3)
+    min_weight[~numpy.isfinite(min_weight)] = -numpy.inf
+    owner = numpy.argmax(min_weight, axis=1)
+    rows = numpy.arange(len(points_xyz))
+    located = min_weight[rows, owner] >= -tolerance
+
+    interp_z = (triangles_xyz[owner, 0, 2] * weight1[rows, owner]) + \
+               (triangles_xyz[owner, 1, 2] * weight2[rows, owner]) + \
+               (triangles_xyz[owner, 2, 2] * weight3[rows, owner])
+
+    return interp_z, owner, located
+
+
+def batch_max_deviation(triangles_xyz, points_xyz, return_owner=False):
+    """ Largest vertical distance between the points falling in a re-triangulated hole and the triangles over them.
+    Infinite if the hole holds no points or a point is outside every triangle, neither of which may be accepted.
+    With return_owner, the index of the triangle containing each point is returned as well (None if infinite). """
+
+    # Matches the reference loop: a hole without any soundings is never accepted
+    if len(points_xyz) == 0:
+        return (numpy.inf, None) if return_owner else numpy.inf
+
+    if kernels.ENABLED:
+        deviation, owner = kernels.max_deviation(triangles_xyz, points_xyz, 1e-9)
+    else:
+        interp_z, owner, located = batch_interpolate(triangles_xyz, points_xyz)
+        deviation = numpy.abs(interp_z - points_xyz[:, 2]).max() if located.all() else numpy.inf
+    if not numpy.isfinite(deviation):
+        return (numpy.inf, None) if return_owner else numpy.inf
+    return (float(deviation), owner) if return_owner else float(deviation)
+
+
 def calculate_aspect(triangle_poly):
+    """ Compass direction of the terrain aspect of a triangle, kept as the reference for triangle_aspects(). """
+
+    from shapely.ops import orient
+
     def calculate_normal_vector(vertex_a, vertex_b, vertex_c):
         ab = vertex_b - vertex_a
         ac = vertex_c - vertex_a
@@ -58,6 +122,48 @@ def calculate_aspect(triangle_poly):
     return compass_direction
 
 
+def triangle_normals(triangles_xyz):
+    """ Normals of (T, 3, 3) triangles with their corners taken counter-clockwise in x,y, as calculate_aspect()
+    orients them. """
+
+    edge1, edge2 = triangles_xyz[:, 1] - triangles_xyz[:, 0], triangles_xyz[:, 2] - triangles_xyz[:, 0]
+    normals = numpy.cross(edge1, edge2)
+    # Like shapely's orient(), clockwise and degenerate triangles are reversed. The cross product is taken again
+    # rather than negated to keep the signs of zero components (and so the aspect of flat triangles) the same
+    clockwise = normals[:, 2] <= 0
+    normals[clockwise] = numpy.cross(edge2[clockwise], edge1[clockwise])
+    return normals
+
+
+def triangle_aspects(triangles_xyz=None, normals=None):
+    """ Vectorized calculate_aspect() for (T, 3, 3) triangles, or for their normals if already known. Returns the
+    compass direction of each triangle as an index into COMPASS_DIRECTIONS. """
+
+    if normals is None:
+        if kernels.ENABLED:
+            return kernels.triangle_aspects(triangles_xyz)
+        normals = triangle_normals(triangles_xyz)
+    aspect_degrees = numpy.degrees(numpy.arctan2(normals[:, 0], normals[:, 1])) % 360.0
+    idx = numpy.minimum(numpy.searchsorted(COMPASS_DEGREES, aspect_degrees, side='left'), len(COMPASS_DEGREES) - 1)
+    return COMPASS_CLASSES[idx]
+
+
+def largest_triangle_area(triangles_xyz):
+    """ Largest area of (T, 3, 3) triangles in the x,y plane. """
+
+    if kernels.ENABLED:
+        return kernels.largest_triangle_area(triangles_xyz)
+    p1, p2, p3 = triangles_xyz[:, 0], triangles_xyz[:, 1], triangles_xyz[:, 2]
+    signed_area = (p2[:, 0] - p1[:, 0]) * (p3[:, 1] - p1[:, 1]) - (p3[:, 0] - p1[:, 0]) * (p2[:, 1] - p1[:, 1])
+    return numpy.abs(signed_area).max() / 2.0
+
+
+# Upper bounds of the compass sectors used by get_compass_direction(), N appears at both ends
+COMPASS_DEGREES = numpy.array([22.5, 67.5, 112.5, 157.5, 202.5, 247.5, 292.5, 337.5, 360])
+COMPASS_DIRECTIONS = ['N', 'NE', 'E', 'SE', 'S', 'SW', 'W', 'NW']
+COMPASS_CLASSES = numpy.array([0, 1, 2, 3, 4, 5, 6, 7, 0], dtype=numpy.int8)
+
+
 def get_compass_direction(input_degrees):
     orientation_degrees = [22.5, 67.5, 112.5, 157.5, 202.5, 247.5, 292.5, 337.5, 360]
     compass_direction = ['N', 'NE', 'E', 'SE', 'S', 'SW', 'W', 'NW', 'N']
@@ -65,28 +171,11 @@ def get_compass_direction(input_degrees):
     return compass_direction[idx]
 
 
-def calculate_average_depth(mesh, negative_down):
-    total_depth, total_points = 0, 0
-    for vertex_handle in mesh.vertices():
-        point = mesh.point(vertex_handle)
-        point_z = point[2]
-        if negative_down:
-            if point_z < 0:
-                total_depth += point_z
-                total_points += 1
-        else:
-            if point_z > 0:
-                total_depth += point_z
-                total_points += 1
-
-    average_depth = total_depth / total_points
-
-    return average_depth
-
-
 def triangulate_polygon(polygon):
     """ Uses a Python wrapper of Triangle (Shechuck, 1996) to triangulate a set of points."""
 
+    import triangle
+
     x, y = polygon.exterior.coords.xy
     del x[-1], y[-1]
     points = numpy.stack((x, y), axis=1)
@@ -100,16 +189,127 @@ def triangulate_polygon(polygon):
     return triangulation
 
 
+def triangulate_ring(ring_xy, max_ring_size=12):
+    """ Triangulates the hole bounded by a counter-clockwise ring and returns (T, 3) indices into the ring.
+
+    Small rings are triangulated in-process by ear clipping followed by Delaunay edge flips, which gives the same
+    constrained Delaunay triangulation as Triangle without building a polygon or mapping coordinates back. Rings
+    larger than max_ring_size, clockwise or degenerate rings fall back on triangulate_polygon(). """
+
+    ring_xy = numpy.asarray(ring_xy, dtype=numpy.float64)
+    triangles = None
+    if len(ring_xy) <= max_ring_size:
+        if kernels.ENABLED:
+            triangles = kernels.ear_clip(ring_xy)
+            triangles = triangles if len(triangles) else None
+        else:
+            triangles = ear_clip(ring_xy.tolist())
+
+    if triangles is None:
+        from shapely.geometry import Polygon
+
+        triangulation = triangulate_polygon(Polygon(ring_xy))
+        ring_index = {(x, y): i for i, (x, y) in enumerate(ring_xy.tolist())}
+        vertex_index = numpy.array([ring_index[(x, y)] for x, y in triangulation['vertices'].tolist()])
+        triangles = vertex_index[triangulation['triangles']].tolist()
+
+    return numpy.array(triangles, dtype=numpy.int64).reshape(-1, 3)
+
+
+def ear_clip(ring_xy):
+    """ Ear clipping of a small counter-clockwise polygon, refined to constrained Delaunay by edge flips.
+    Returns a list of index triangles, or None if the ring is clockwise or no valid ear is found. """
+
+    def orientation(a, b, c):
+        return (b[0] - a[0]) * (c[1] - a[1]) - (c[0] - a[0]) * (b[1] - a[1])
+
+    num_points = len(ring_xy)
+    area = sum(orientation(ring_xy[0], ring_xy[i], ring_xy[i + 1]) for i in range(1, num_points - 1))
+    if num_points < 3 or area <= 0:
+        return None
+
+    remaining = list(range(num_points))
+    triangles = list()
+    while len(remaining) > 3:
+        for i in range(len(remaining)):
+            a, b, c = remaining[i - 1], remaining[i], remaining[(i + 1) % len(remaining)]
+            pa, pb, pc = ring_xy[a], ring_xy[b], ring_xy[c]
+            if orientation(pa, pb, pc) <= 0:
+                continue
+            # Any other ring vertex inside or on the candidate ear blocks it
+            blocked = False
+            for j in remaining:
+                if j != a and j != b and j != c:
+                    p = ring_xy[j]
+                    if orientation(pa, pb, p) >= 0 and orientation(pb, pc, p) >= 0 and orientation(pc, pa, p) >= 0:
+                        blocked = True
+                        break
+            if not blocked:
+                triangles.append((a, b, c))
+                del remaining[i]
+                break
+        else:
+            return None
+
+    if orientation(ring_xy[remaining[0]], ring_xy[remaining[1]], ring_xy[remaining[2]]) <= 0:
+        return None
+    triangles.append(tuple(remaining))
+
+    return delaunay_flip(ring_xy, triangles)
+
+
+def delaunay_flip(ring_xy, triangles):
+    """ Lawson flips of the interior edges of a polygon triangulation until every interior edge is Delaunay. """
+
+    def orientation(a, b, c):
+        return (b[0] - a[0]) * (c[1] - a[1]) - (c[0] - a[0]) * (b[1] - a[1])
+
+    def in_circle(a, b, c, d):
+        adx, ady, bdx, bdy, cdx, cdy = a[0] - d[0], a[1] - d[1], b[0] - d[0], b[1] - d[1], c[0] - d[0], c[1] - d[1]
+        determinant = (adx * adx + ady * ady) * (bdx * cdy - cdx * bdy) - \
+                      (bdx * bdx + bdy * bdy) * (adx * cdy - cdx * ady) + \
+                      (cdx * cdx + cdy * cdy) * (adx * bdy - bdx * ady)
+        scale = max(abs(adx), abs(ady), abs(bdx), abs(bdy), abs(cdx), abs(cdy)) ** 4
+        # Co-circular points are left alone so rounding cannot make edges flip back and forth
+        return determinant > 1e-10 * scale
+
+    triangles = [list(tri) for tri in triangles]
+    for _ in range(len(triangles) ** 2 + 1):
+        edge_owner = dict()
+        for t, (a, b, c) in enumerate(triangles):
+            edge_owner[(a, b)], edge_owner[(b, c)], edge_owner[(c, a)] = t, t, t
+
+        flipped = False
+        for (u, v), t1 in edge_owner.items():
+            t2 = edge_owner.get((v, u))
+            if t2 is None or u > v:
+                continue
+            w = [i for i in triangles[t1] if i != u and i != v][0]
+            x = [i for i in triangles[t2] if i != u and i != v][0]
+            pu, pv, pw, px = ring_xy[u], ring_xy[v], ring_xy[w], ring_xy[x]
+            if in_circle(pu, pv, pw, px) and orientation(pu, px, pw) > 0 and orientation(px, pv, pw) > 0:
+                triangles[t1], triangles[t2] = [u, x, w], [x, v, w]
+                flipped = True
+                break
+        if not flipped:
+            break
+
+    return [tuple(tri) for tri in triangles]
+
+
 def create_idx(start, end):
     """ Creates indexes for vertices so that segments can be created for a constrained triangulation. """
 
     return [[i, i + 1] for i in range(start, end)] + [[end, start]]
 
 
-def get_face_ccw(mesh, vh_list):
-    point1 = mesh.point(vh_list[0])
-    point2 = mesh.point(vh_list[1])
-    point3 = mesh.point(vh_list[2])
+def get_face_ccw(points, vh_list):
+    """ Returns the vertex indices of a face in counter-clockwise order, kept as the reference for
+    get_faces_ccw(). """
+
+    point1 = points[vh_list[0]]
+    point2 = points[vh_list[1]]
+    point3 = points[vh_list[2]]
 
     area = (point2[0]-point1[0])*(point3[1]-point1[1]) - (point3[0]-point1[0])*(point2[1]-point1[1])
 
@@ -119,30 +319,120 @@ def get_face_ccw(mesh, vh_list):
         reversed_list = list(reversed(vh_list))
         return reversed_list
     else:
-        log.info(str([mesh.point(vh) for vh in vh_list]) + ' is collinear')
-
-
-def validate_mesh(generalized_mesh, input_points):
-    generalized_face_handles = list(generalized_mesh.faces())
-    fv = [list(generalized_mesh.fv(face_handle)) for face_handle in generalized_face_handles]
-    generalized_triangles = numpy.array([Polygon([generalized_mesh.point(v[0]), generalized_mesh.point(v[1]), generalized_mesh.point(v[2])]) for v in fv])
-
-    triangle_tree = STRtree(generalized_triangles, int(ceil(len(generalized_triangles) * 0.004)))
-
-    np_point_array = numpy.array([Point(p[0]) for p in input_points])
-    np_uncertainty_array = numpy.array([p[1] for p in input_points])
-    violation_list = list()
-
-    idx = 0
-    for point in np_point_array:
-        query_triangle_idx = triangle_tree.query(point)
-        query_triangle_geom = triangle_tree.geometries.take(query_triangle_idx).tolist()
-        triangle_intersect = [tri for tri in query_triangle_geom if tri.intersects(point)][0]
-        point_xyz = [point.x, point.y, point.z]
-        point_u = np_uncertainty_array[idx]
-        if not interpolate(triangle_intersect, point_xyz, point_u):
-            violation_list.append(point)
-
-        idx += 1
-
-    return violation_list
+        log.info(str([points[vh] for vh in vh_list]) + ' is collinear')
+
+
+def get_faces_ccw(points, faces):
+    """ Vectorized get_face_ccw() over an (F, 3) face array, using one signed-area computation for all faces. """
+
+    faces = numpy.array(faces, dtype=numpy.int32).reshape(-1, 3)
+    p1, p2, p3 = points[faces[:, 0]], points[faces[:, 1]], points[faces[:, 2]]
+    area = (p2[:, 0]-p1[:, 0])*(p3[:, 1]-p1[:, 1]) - (p3[:, 0]-p1[:, 0])*(p2[:, 1]-p1[:, 1])
+
+    clockwise = area < 0
+    faces[clockwise] = faces[clockwise][:, ::-1]
+    collinear = numpy.count_nonzero(area == 0)
+    if collinear:
+        log.info(str(collinear) + ' collinear faces')
+
+    return faces
+
+
+def outline_vertices(num_vertices, faces):
+    """ Boolean mask of the vertices on edges used by a single face, the outline of the mesh and of its islands. """
+
+    edges = numpy.sort(numpy.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]]), axis=1)
+    edges, counts = numpy.unique(edges, axis=0, return_counts=True)
+    outline = numpy.zeros(num_vertices, dtype=bool)
+    outline[edges[counts == 1].ravel()] = True
+    return outline
+
+
+def locate_points(points_xyz, triangles_xyz, chunk_size=200000, tolerance=1e-9):
+    """ Locates every point in a triangulation and interpolates its z-value, all in batch.
+
+    Triangles are bucketed into a uniform grid by their bboxes, then every point is tested against the triangles of
+    its own cell only. Returns the index of the containing triangle for every point (-1 if not located) and the
+    interpolated z-values (NaN if not located). """
+
+    tri_min = triangles_xyz[:, :, :2].min(axis=1)
+    tri_max = triangles_xyz[:, :, :2].max(axis=1)
+    origin = numpy.minimum(tri_min.min(axis=0), points_xyz[:, :2].min(axis=0))
+    extent = numpy.maximum(tri_max.max(axis=0), points_xyz[:, :2].max(axis=0)) - origin
+
+    # Cells about as large as an average triangle, so most triangles cover only a few cells
+    cell_size = max(float((tri_max - tri_min).max(axis=1).mean()), 1e-9)
+    shape = (int(extent[1] // cell_size) + 1, int(extent[0] // cell_size) + 1)
+
+    def cell_range(xy):
+        column = numpy.clip(((xy[:, 0] - origin[0]) // cell_size).astype(numpy.int64), 0, shape[1] - 1)
+        row = numpy.clip(((xy[:, 1] - origin[1]) // cell_size).astype(numpy.int64), 0, shape[0] - 1)
+        return column, row
+
+    # Expand every triangle into the cells its bbox covers and group them by cell
+    column0, row0 = cell_range(tri_min)
+    column1, row1 = cell_range(tri_max)
+    width = column1 - column0 + 1
+    counts = width * (row1 - row0 + 1)
+    pair_triangle = numpy.repeat(numpy.arange(len(triangles_xyz)), counts)
+    offset = numpy.arange(len(pair_triangle)) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+    pair_cell = (row0[pair_triangle] + offset // width[pair_triangle]) * shape[1] + \
+                column0[pair_triangle] + offset % width[pair_triangle]
+    order = numpy.argsort(pair_cell, kind='stable')
+    cell_triangles = pair_triangle[order]
+    cell_start = numpy.zeros(shape[0] * shape[1] + 1, dtype=numpy.int64)
+    cell_start[1:] = numpy.cumsum(numpy.bincount(pair_cell, minlength=shape[0] * shape[1]))
+
+    owner = numpy.full(len(points_xyz), -1, dtype=numpy.int64)
+    interp_z = numpy.full(len(points_xyz), numpy.nan)
+    for start in range(0, len(points_xyz), chunk_size):
+        chunk = points_xyz[start:start + chunk_size]
+        column, row = cell_range(chunk[:, :2])
+        cell = row * shape[1] + column
+        first, num_candidates = cell_start[cell], cell_start[cell + 1] - cell_start[cell]
+
+        # One (point, candidate triangle) pair per triangle in the point's cell
+        pair_point = numpy.repeat(numpy.arange(len(chunk)), num_candidates)
+        pair_offset = numpy.arange(len(pair_point)) - numpy.repeat(numpy.cumsum(num_candidates) - num_candidates,
+                                                                   num_candidates)
+        pair_triangle = cell_triangles[first[pair_point] + pair_offset]
+        tri = triangles_xyz[pair_triangle]
+        weight1, weight2, weight3 = barycentric_weights(tri[:, 0], tri[:, 1], tri[:, 2], chunk[pair_point, :2])
+        min_weight = numpy.minimum(numpy.minimum(weight1, weight2), weight3)
+        min_weight[~numpy.isfinite(min_weight)] = -numpy.inf
+
+        # Best containing triangle of every point: first pair of each point after sorting by decreasing weight
+        best = numpy.lexsort((-min_weight, pair_point))
+        is_first = numpy.ones(len(best), dtype=bool)
+        is_first[1:] = pair_point[best][1:] != pair_point[best][:-1]
+        best = best[is_first]
+        best = best[min_weight[best] >= -tolerance]
+
+        points_idx = start + pair_point[best]
+        owner[points_idx] = pair_triangle[best]
+        interp_z[points_idx] = (tri[best, 0, 2] * weight1[best]) + (tri[best, 1, 2] * weight2[best]) + \
+                               (tri[best, 2, 2] * weight3[best])
+
+    return owner, interp_z
+
+
+def validate_mesh(generalized_mesh, input_points, input_uncertainty):
+    """ Measures the vertical error of the simplified mesh at every original sounding.
+
+    Returns the per-point error (interpolated minus original z, NaN where a sounding is outside the mesh) and summary
+    statistics. A sounding is a violation if its error exceeds its vertical uncertainty or it could not be located. """
+
+    fv = generalized_mesh.face_vertices[generalized_mesh.faces()]
+    owner, interp_z = locate_points(input_points, generalized_mesh.points[fv])
+    errors = interp_z - input_points[:, 2]
+
+    located = owner >= 0
+    violations = ~(numpy.abs(errors) <= input_uncertainty)
+    located_errors = numpy.abs(errors[located])
+    summary = {'points': int(len(errors)),
+               'violations': int(violations.sum()),
+               'unlocated': int((~located).sum()),
+               'max_error': float(located_errors.max()) if len(located_errors) else 0.0,
+               'rms_error': float(numpy.sqrt(numpy.mean(located_errors ** 2))) if len(located_errors) else 0.0}
+
+    return errors, summary
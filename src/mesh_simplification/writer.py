@@ -1,91 +1,166 @@
-from mesh_simplification.utilities import get_face_ccw
+import collections
+import numpy
+
+from mesh_simplification.utilities import get_faces_ccw
+from mesh_simplification.logger import log
 
 
 class Writer(object):
 
     @staticmethod
     def write_mesh_gr3(mesh, file_name):
+        points, faces, z_offset, omit = mesh.compact_arrays()
+        Writer.write_gr3(points, faces, file_name)
+
+    @staticmethod
+    def write_mesh_vtk(mesh, file_name, binary=False):
+        points, faces, z_offset, omit = mesh.compact_arrays()
+        Writer.write_vtk(points, faces, file_name, binary)
+
+    @staticmethod
+    def write_gr3(points, faces, file_name):
+        faces_ccw = get_faces_ccw(points, faces)
+        Writer.write_gr3_blocks(file_name, len(points), len(faces), [points], [faces_ccw])
+        return
+
+    @staticmethod
+    def write_gr3_blocks(file_name, num_vertices, num_triangles, point_blocks, face_blocks):
+        """ Writes a GR3 file from consecutive blocks of points and zero-based counter-clockwise faces, so a mesh
+        that does not fit in memory can be written block by block. """
+
         out_url = file_name + ".gr3"
-        outfile = open(out_url, 'w')
-        num_vertices = mesh.n_vertices()
-        num_triangles = mesh.n_faces()
-
-        outfile.write("hgrid.gr3\n")
-        outfile.write(str(num_triangles) + " " + str(int(num_vertices)) + "\n")
-
-        vertices_sorted_idx = sorted([v.idx() for v in mesh.vertices()])
-        for v_idx in vertices_sorted_idx:
-            vertex_handle = mesh.vertex_handle(v_idx)
-            point = mesh.point(vertex_handle)
-            idx = v_idx + 1  # indexing starts from 1 in gr3 format
-            outfile.write(str(idx) + " " + str(point[0]) + " " + str(point[1]) + " " + str(point[2]) + "\n")
-
-        faces_sorted_idx = sorted([v.idx() for v in mesh.faces()])
-        for f_idx in faces_sorted_idx:
-            face_handle = mesh.face_handle(f_idx)
-            fv = list(mesh.fv(face_handle))
-            fv_ccw = get_face_ccw(mesh, fv)
-            idx = f_idx + 1  # indexing starts from 1 in gr3 format
-            idx1, idx2, idx3 = fv_ccw[0].idx()+1, fv_ccw[1].idx()+1, fv_ccw[2].idx()+1
-            outfile.write(str(idx) + " 3 " + str(idx1) + " " + str(idx2) + " " + str(idx3) + "\n")
-
-        outfile.close()
+        with open(out_url, 'w') as outfile:
+            outfile.write("hgrid.gr3\n")
+            outfile.write(str(num_triangles) + " " + str(int(num_vertices)) + "\n")
+
+            # indexing starts from 1 in gr3 format
+            start = 1
+            for points in point_blocks:
+                vertex_idx = numpy.arange(start, start + len(points))
+                write_block(outfile, "%d %r %r %r\n", [vertex_idx, points[:, 0], points[:, 1], points[:, 2]])
+                start += len(points)
+
+            start = 1
+            for faces in face_blocks:
+                face_idx = numpy.arange(start, start + len(faces))
+                write_block(outfile, "%d 3 %d %d %d\n", [face_idx, faces[:, 0] + 1, faces[:, 1] + 1, faces[:, 2] + 1])
+                start += len(faces)
         return
 
     @staticmethod
-    def write_mesh_vtk(mesh, file_name):
+    def write_vtk(points, faces, file_name, binary=False):
+        """ Writes a legacy VTK unstructured grid, either as ASCII or as big-endian BINARY blocks. """
+
         out_url = file_name + ".vtk"
-        outfile = open(out_url, 'w')
-        num_vertices = mesh.n_vertices()
-        num_triangles = mesh.n_faces()
-
-        outfile.write("# vtk DataFile Version 2.0\n\n")
-        outfile.write("ASCII\n")
-        outfile.write("DATASET UNSTRUCTURED_GRID\n")
-        outfile.write("POINTS " + str(num_vertices) + " float\n")
-
-        vertices_sorted_idx = sorted([v.idx() for v in mesh.vertices()])
-        for v_idx in vertices_sorted_idx:
-            vertex_handle = mesh.vertex_handle(v_idx)
-            point = mesh.point(vertex_handle)
-            outfile.write(str(point[0]) + " " + str(point[1]) + " " + str(point[2]) + "\n")
-
-        outfile.write("CELLS " + str(num_triangles) + " " + str(int(num_triangles)*4) + "\n")
-
-        faces_sorted_idx = sorted([v.idx() for v in mesh.faces()])
-        for f_idx in faces_sorted_idx:
-            face_handle = mesh.face_handle(f_idx)
-            fv = list(mesh.fv(face_handle))
-            fv_ccw = get_face_ccw(mesh, fv)
-            idx1, idx2, idx3 = fv_ccw[0].idx(), fv_ccw[1].idx(), fv_ccw[2].idx()
-            outfile.write(" 3 " + str(idx1) + " " + str(idx2) + " " + str(idx3) + "\n")
-
-        outfile.write("CELL_TYPES " + str(num_triangles) + "\n")
-
-        for i in range(num_triangles):
-            outfile.write(str(6) + " ")
-        outfile.write("\n")
-
-        outfile.write("POINT_DATA " + str(num_vertices) + "\n")
-        outfile.write("FIELD FieldData 1 \n\n")
-        outfile.write("fieldvalue 1 " + str(num_vertices) + " float \n")
-
-        for v_idx in vertices_sorted_idx:
-            vertex_handle = mesh.vertex_handle(v_idx)
-            point = mesh.point(vertex_handle)
-            outfile.write(str(point[2]) + " ")
-        outfile.write("\n")
-
-        outfile.close()
+        num_vertices = len(points)
+        num_triangles = len(faces)
+        faces_ccw = get_faces_ccw(points, faces)
+
+        if binary:
+            cells = numpy.empty((num_triangles, 4), dtype='>i4')
+            cells[:, 0] = 3
+            cells[:, 1:] = faces_ccw
+            with open(out_url, 'wb') as outfile:
+                outfile.write(b"# vtk DataFile Version 2.0\n\n")
+                outfile.write(b"BINARY\n")
+                outfile.write(b"DATASET UNSTRUCTURED_GRID\n")
+                outfile.write(("POINTS " + str(num_vertices) + " float\n").encode())
+                outfile.write(points.astype('>f4').tobytes() + b"\n")
+                outfile.write(("CELLS " + str(num_triangles) + " " + str(int(num_triangles)*4) + "\n").encode())
+                outfile.write(cells.tobytes() + b"\n")
+                outfile.write(("CELL_TYPES " + str(num_triangles) + "\n").encode())
+                outfile.write(numpy.full(num_triangles, 6, dtype='>i4').tobytes() + b"\n")
+                outfile.write(("POINT_DATA " + str(num_vertices) + "\n").encode())
+                outfile.write(b"FIELD FieldData 1\n")
+                outfile.write(("fieldvalue 1 " + str(num_vertices) + " float\n").encode())
+                outfile.write(points[:, 2].astype('>f4').tobytes() + b"\n")
+            return
+
+        with open(out_url, 'w') as outfile:
+            outfile.write("# vtk DataFile Version 2.0\n\n")
+            outfile.write("ASCII\n")
+            outfile.write("DATASET UNSTRUCTURED_GRID\n")
+            outfile.write("POINTS " + str(num_vertices) + " float\n")
+            write_block(outfile, "%r %r %r\n", [points[:, 0], points[:, 1], points[:, 2]])
+
+            outfile.write("CELLS " + str(num_triangles) + " " + str(int(num_triangles)*4) + "\n")
+            write_block(outfile, " 3 %d %d %d\n", [faces_ccw[:, 0], faces_ccw[:, 1], faces_ccw[:, 2]])
+
+            outfile.write("CELL_TYPES " + str(num_triangles) + "\n")
+            outfile.write("6 " * num_triangles)
+            outfile.write("\n")
+
+            outfile.write("POINT_DATA " + str(num_vertices) + "\n")
+            outfile.write("FIELD FieldData 1 \n\n")
+            outfile.write("fieldvalue 1 " + str(num_vertices) + " float \n")
+            write_block(outfile, "%r ", [points[:, 2]])
+            outfile.write("\n")
         return
 
     @staticmethod
-    def write_violations_xyz(vertex_list, file_name):
+    def write_violations_xyz(points, file_name):
         out_url_vertices = file_name + "_xyz.txt"
-        outfile_vertices = open(out_url_vertices, 'w')
-
-        outfile_vertices.write('x,y,z' + "\n")
-
-        for v in vertex_list:
-            outfile_vertices.write(str(v.x) + "," + str(v.y) + "," + str(v.z) + "\n")
-        outfile_vertices.close()
+        with open(out_url_vertices, 'w') as outfile_vertices:
+            outfile_vertices.write('x,y,z' + "\n")
+            write_block(outfile_vertices, "%r,%r,%r\n", [points[:, 0], points[:, 1], points[:, 2]])
+
+
+class BackgroundWriter(object):
+    """ Writes output files from snapshots of the mesh arrays in a separate process, so the next iteration starts
+    while the previous one is being written. At most max_pending writes are queued; a further write waits for the
+    oldest, which keeps the memory held by snapshots bounded. With background False every write happens in place. """
+
+    def __init__(self, formats=('gr3', 'vtk'), binary_vtk=False, background=True, max_pending=2):
+        self.formats = formats
+        self.binary_vtk = binary_vtk
+        self.max_pending = max_pending
+        self.executor = None
+        if background:
+            from concurrent.futures import ProcessPoolExecutor
+
+            self.executor = ProcessPoolExecutor(max_workers=1)
+        self.pending = collections.deque()
+
+    def write_mesh(self, mesh, file_name):
+        points, faces, z_offset, omit = mesh.compact_arrays()
+        self.submit(write_mesh_files, points, faces, file_name, self.formats, self.binary_vtk)
+
+    def write_violations(self, points, file_name):
+        self.submit(Writer.write_violations_xyz, points, file_name)
+
+    def submit(self, function, *args):
+        if self.executor is None:
+            function(*args)
+            return
+        while len(self.pending) >= self.max_pending:
+            self.pending.popleft().result()
+        self.pending.append(self.executor.submit(function, *args))
+
+    def close(self):
+        """ Waits for the queued writes, raising the error of any that failed. """
+
+        if self.executor is None:
+            return
+        if self.pending:
+            log.info('-Waiting for ' + str(len(self.pending)) + ' Output File Writes')
+        try:
+            while self.pending:
+                self.pending.popleft().result()
+        finally:
+            self.executor.shutdown()
+
+
+def write_mesh_files(points, faces, file_name, formats, binary_vtk=False):
+    if 'gr3' in formats:
+        Writer.write_gr3(points, faces, file_name)
+    if 'vtk' in formats:
+        Writer.write_vtk(points, faces, file_name, binary_vtk)
+
+
+def write_block(outfile, row_format, columns, chunk_size=100000):
+    """ Writes rows built from parallel column arrays, formatting a whole chunk of rows with a single % operation. """
+
+    for start in range(0, len(columns[0]), chunk_size):
+        chunk = [column[start:start+chunk_size].tolist() for column in columns]
+        values = tuple(value for row in zip(*chunk) for value in row)
+        outfile.write((row_format * len(chunk[0])) % values)
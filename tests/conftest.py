@@ -0,0 +1,13 @@
+import pytest
+
+from mesh_simplification import kernels
+
+
+@pytest.fixture(params=[False, pytest.param(True, marks=pytest.mark.skipif(not kernels.AVAILABLE,
+                                                                           reason='numba is not installed'))],
+                ids=['numpy', 'kernels'])
+def backend(request, monkeypatch):
+    """ Runs a test with the NumPy/Python functions of utilities and again with the compiled kernels. """
+
+    monkeypatch.setattr(kernels, 'ENABLED', request.param)
+    return request.param
@@ -0,0 +1,93 @@
+import numpy
+import pytest
+
+from shapely.geometry import Polygon
+
+from mesh_simplification.utilities import interpolate, calculate_aspect, get_face_ccw, get_faces_ccw, \
+    triangulate_polygon, triangulate_ring, batch_max_deviation, triangle_aspects, largest_triangle_area, \
+    COMPASS_DIRECTIONS
+
+
+def random_triangles(num_triangles, seed=0):
+    """ (T, 3, 3) triangles in both orientations, with flat triangles and triangles whose corners are exactly
+    collinear in x,y. Nearly collinear triangles are left out: which way round they are depends on rounding, and
+    shapely 1 (signed area) and shapely 2 (GEOS is_ccw) already disagree about them. """
+
+    rng = numpy.random.default_rng(seed)
+    triangles = rng.normal(0.0, 10.0, (num_triangles, 3, 3))
+    triangles[:20, :, 2] = 3.0
+    triangles[20:40, :, :2] = numpy.round(triangles[20:40, :1, :2]) + numpy.arange(3)[:, None] * [1.0, 2.0]
+    triangles[40:60] = triangles[40:60, ::-1]
+    return triangles
+
+
+def one_rings(num_rings, seed=0):
+    """ Counter-clockwise rings of 3 to 12 vertices around a centre, like the one-ring of a mesh vertex. """
+
+    rng = numpy.random.default_rng(seed)
+    rings = list()
+    for _ in range(num_rings):
+        size = int(rng.integers(3, 13))
+        angles = (numpy.arange(size) + rng.uniform(0.1, 0.9, size)) * 2 * numpy.pi / size
+        radius = rng.uniform(0.5, 1.0, size)
+        rings.append(numpy.c_[radius * numpy.cos(angles), radius * numpy.sin(angles)] * 100.0 +
+                     rng.uniform(-1e4, 1e4, 2))
+    return rings
+
+
+def test_triangle_aspects_match_calculate_aspect(backend):
+    triangles = random_triangles(500)
+
+    expected = [calculate_aspect(Polygon(triangle)) for triangle in triangles]
+    assert [COMPASS_DIRECTIONS[i] for i in triangle_aspects(triangles)] == expected
+
+
+@pytest.mark.parametrize('z_offset', [0.05, 0.2, 0.5, 1.0])
+def test_batch_max_deviation_matches_interpolate(backend, z_offset):
+    rng = numpy.random.default_rng(1)
+    # The collinear triangles are left out, interpolate() divides by their zero area
+    triangles = random_triangles(200, seed=1)
+    for triangle in numpy.r_[triangles[:20], triangles[40:]]:
+        # Points inside the triangle and on its corners, with depths around the plane of the triangle
+        weights = numpy.r_[rng.dirichlet(numpy.ones(3), 10), numpy.eye(3)]
+        points = weights @ triangle
+        points[:, 2] += rng.normal(0.0, 0.5, len(points))
+
+        polygon = Polygon(triangle)
+        expected = all(interpolate(polygon, point, z_offset) for point in points.tolist())
+        assert (batch_max_deviation(triangle[numpy.newaxis], points) <= z_offset) == expected
+
+
+def test_largest_triangle_area_matches_polygon_area(backend):
+    triangles = random_triangles(300)
+
+    for start in range(0, len(triangles), 7):
+        group = triangles[start:start + 7]
+        expected = max(Polygon(triangle).area for triangle in group)
+        assert largest_triangle_area(group) == pytest.approx(expected, rel=1e-12, abs=1e-12)
+
+
+def test_triangulate_ring_matches_triangle(backend):
+    def canonical(triangles):
+        # Same triangles with the same orientation, whatever corner they start from
+        return sorted(tuple(numpy.roll(triangle, -int(numpy.argmin(triangle))).tolist()) for triangle in triangles)
+
+    for ring_xy in one_rings(300):
+        triangulation = triangulate_polygon(Polygon(ring_xy))
+        ring_index = {(x, y): i for i, (x, y) in enumerate(ring_xy.tolist())}
+        vertex_index = numpy.array([ring_index[(x, y)] for x, y in triangulation['vertices'].tolist()])
+
+        assert canonical(triangulate_ring(ring_xy)) == canonical(vertex_index[triangulation['triangles']])
+
+
+def test_get_faces_ccw_matches_get_face_ccw():
+    rng = numpy.random.default_rng(2)
+    points = rng.normal(0.0, 10.0, (50, 3))
+    points[:3, :2] = [[0.0, 0.0], [1.0, 1.0], [2.0, 2.0]]
+    faces = numpy.array([rng.choice(len(points), 3, replace=False) for _ in range(200)] + [[0, 1, 2], [2, 1, 0]])
+
+    oriented = get_faces_ccw(points, faces)
+    for face, face_ccw in zip(faces.tolist(), oriented.tolist()):
+        expected = get_face_ccw(points, face)
+        # get_face_ccw() only logs collinear faces, get_faces_ccw() keeps them as they are
+        assert face_ccw == (face if expected is None else expected)
@@ -0,0 +1,29 @@
+import numpy
+
+from mesh_simplification.mesh import ArrayMesh
+from mesh_simplification.utilities import triangle_normals, triangle_aspects
+
+
+def grid_mesh(size=6, seed=0):
+    """ size x size grid of vertices with random depths, two triangles per cell. """
+
+    rng = numpy.random.default_rng(seed)
+    x, y = numpy.meshgrid(numpy.arange(size, dtype=numpy.float64), numpy.arange(size, dtype=numpy.float64))
+    points = numpy.c_[x.ravel(), y.ravel(), rng.normal(10.0, 1.0, size * size)]
+    corner = (numpy.arange(size - 1)[:, None] * size + numpy.arange(size - 1)).ravel()
+    faces = numpy.r_[numpy.c_[corner, corner + 1, corner + size + 1],
+                     numpy.c_[corner, corner + size + 1, corner + size]]
+    return ArrayMesh(points, faces, numpy.full(len(points), 0.5), numpy.zeros(len(points), dtype=numpy.int8))
+
+
+def test_garbage_collection_keeps_face_aspects():
+    mesh = grid_mesh()
+    mesh.face_aspects(mesh.faces())
+    for vertex in (7, 15, 28):
+        mesh.delete_vertex(vertex)
+    mesh.garbage_collection()
+
+    triangles = mesh.points[mesh.face_vertices[mesh.faces()]]
+    assert (mesh.face_aspect[mesh.faces()] >= 0).all()
+    assert numpy.array_equal(mesh.face_normal[mesh.faces()], triangle_normals(triangles))
+    assert numpy.array_equal(mesh.face_aspect[mesh.faces()], triangle_aspects(triangles))
@@ -0,0 +1,18 @@
+import numpy
+
+from mesh_simplification.spatial_index import GridIndex
+
+
+def test_query_bboxes_matches_query_bbox():
+    rng = numpy.random.default_rng(3)
+    index = GridIndex.build(rng.uniform(0.0, 100.0, (2000, 3)))
+    corners = rng.uniform(-10.0, 110.0, (50, 2))
+    bboxes = numpy.c_[corners, corners + rng.uniform(0.0, 40.0, (50, 2))]
+    # A bbox outside the grid and one that is a single point
+    bboxes[0] = [200.0, 200.0, 210.0, 210.0]
+    bboxes[1] = numpy.r_[index.points[0, :2], index.points[0, :2]]
+
+    indices, offsets = index.query_bboxes(bboxes)
+    assert len(offsets) == len(bboxes) + 1
+    for i, bbox in enumerate(bboxes):
+        assert indices[offsets[i]:offsets[i + 1]].tolist() == index.query_bbox(*bbox).tolist()
@@ -0,0 +1,40 @@
+import numpy
+import pytest
+
+from mesh_simplification.simplification import reference_z_offset_test
+from mesh_simplification.utilities import triangulate_ring, batch_max_deviation
+
+
+def holes(num_holes, seed=0):
+    """ Re-triangulated one-rings as (T, 3, 3) triangles, each with soundings like a query of its ring returns:
+    points inside the hole, on its ring vertices and on the edges of its triangles, some of them shared. """
+
+    rng = numpy.random.default_rng(seed)
+    for _ in range(num_holes):
+        size = int(rng.integers(3, 13))
+        angles = (numpy.arange(size) + rng.uniform(0.1, 0.9, size)) * 2 * numpy.pi / size
+        radius = rng.uniform(0.5, 1.0, size)
+        ring_xyz = numpy.c_[radius * numpy.cos(angles) * 100.0, radius * numpy.sin(angles) * 100.0,
+                            rng.normal(20.0, 2.0, size)]
+        triangles_xyz = ring_xyz[triangulate_ring(ring_xyz[:, :2])]
+
+        # Depths of the soundings are taken off the triangles and moved up or down
+        weights = numpy.r_[rng.dirichlet(numpy.ones(3), 20), numpy.eye(3), [[0.5, 0.5, 0.0], [0.0, 0.5, 0.5]]]
+        triangle = rng.integers(0, len(triangles_xyz), len(weights))
+        points_xyz = numpy.einsum('pk,pkc->pc', weights, triangles_xyz[triangle])
+        points_xyz[:, 2] += rng.normal(0.0, rng.uniform(0.01, 0.3), len(points_xyz))
+        yield triangles_xyz, points_xyz
+
+
+@pytest.mark.parametrize('z_offset', [0.1, 0.3, 0.6, 1.0])
+def test_batched_z_offset_test_matches_reference(backend, z_offset):
+    for triangles_xyz, points_xyz in holes(100):
+        expected = reference_z_offset_test(triangles_xyz, points_xyz, z_offset)
+        assert (batch_max_deviation(triangles_xyz, points_xyz) <= z_offset) == expected
+
+
+def test_hole_without_soundings_is_rejected(backend):
+    triangles_xyz, points_xyz = next(holes(1))
+
+    assert reference_z_offset_test(triangles_xyz, points_xyz[:0], 1.0) is False
+    assert not batch_max_deviation(triangles_xyz, points_xyz[:0]) <= 1.0